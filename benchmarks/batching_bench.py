@@ -0,0 +1,93 @@
+"""Benchmark throughput and latency of Publisher with and without adaptive batching.
+
+Usage::
+
+    PYTHONPATH=. python benchmarks/batching_bench.py [--count N] [--max-latency MS]
+
+For a range of offered rates, envelopes are published at a steady pace and received from a
+bound :const:`zmq.XSUB` socket. Latency is measured from publishing an envelope until it is
+received; throughput is the rate at which envelopes are received. A rate of ``max`` publishes
+as fast as possible. Without batching, :meth:`hermes.Publisher.run` sends one envelope per
+loop iteration.
+"""
+
+# Import Built-Ins
+import argparse
+import time
+from threading import Thread
+
+# Import Third-Party
+import zmq
+
+# Import Homebrew
+from hermes import Envelope, Publisher
+from hermes.batching import split_batch
+
+PORT = 5780
+
+
+def receive(sock, count, latencies):
+    """Receive `count` envelopes from `sock`, appending their latencies."""
+    while len(latencies) < count:
+        if not sock.poll(2000):
+            break
+        frames = sock.recv_multipart()
+        now = time.time()
+        for envelope_frames in split_batch(frames):
+            latencies.append(now - Envelope.load_from_frames(envelope_frames).ts)
+
+
+def run(addr, rate, count, max_latency):
+    """Publish `count` envelopes at `rate` per second; return (throughput, latencies)."""
+    ctx = zmq.Context.instance()
+    xsub = ctx.socket(zmq.XSUB)
+    xsub.bind(addr)
+    publisher = Publisher(addr, 'bench', restamp=False, max_batch_latency=max_latency)
+    publisher.start()
+    time.sleep(.5)
+    xsub.send(b'\x01')
+    time.sleep(.2)
+
+    latencies = []
+    receiver = Thread(target=receive, args=(xsub, count, latencies))
+    receiver.start()
+    data = ['Trade', 'BTC-USD', 6500.0, 0.25]
+    start = deadline = time.time()
+    for i in range(count):
+        if rate:
+            deadline += 1.0 / rate
+            while time.time() < deadline:
+                time.sleep(0)
+        publisher.publish(Envelope('trades/%d' % (i % 4), 'bench', data))
+    receiver.join()
+    elapsed = time.time() - start
+
+    stats = publisher.batcher.stats() if publisher.batcher else None
+    publisher.stop()
+    xsub.close()
+    return len(latencies) / elapsed, sorted(latencies), stats
+
+
+def main():
+    """Run the benchmark and print a result table."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--count', type=int, default=20000)
+    parser.add_argument('--max-latency', type=float, default=1.0, help='milliseconds')
+    args = parser.parse_args()
+
+    print('%-8s %8s %12s %10s %10s  %s' % ('batching', 'rate', 'recv/s', 'p50 ms', 'p99 ms',
+                                            'histogram'))
+    port = PORT
+    for rate in (1000, 10000, 50000, None):
+        for max_latency in (None, args.max_latency / 1e3):
+            throughput, latencies, stats = run('tcp://127.0.0.1:%s' % port, rate, args.count,
+                                               max_latency)
+            port += 1
+            pct = lambda p: latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1e3
+            print('%-8s %8s %12.0f %10.2f %10.2f  %s' % (
+                'adaptive' if max_latency else 'off', rate or 'max', throughput, pct(.5),
+                pct(.99), stats['histogram'] if stats else ''))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""Benchmark compression ratio and encode/decode throughput of Envelope data frames.
+
+Usage::
+
+    PYTHONPATH=. python benchmarks/compression_bench.py [--rounds N]
+
+Compares all available codecs, with and without a trained per-topic dictionary, across
+payload sizes ranging from single trades to large order book snapshots.
+"""
+
+# Import Built-Ins
+import argparse
+import json
+import random
+import time
+
+# Import Homebrew
+from hermes import Envelope
+from hermes.compression import Compressor, available_codecs, register_dictionary
+from hermes.compression import train_dictionary
+
+
+def book_snapshot(levels, seed):
+    """Return an order book snapshot with `levels` price levels per side, as a list."""
+    rnd = random.Random(seed)
+    mid = 6500 + rnd.random() * 10
+    bids = [['%.2f' % (mid - n * 0.5), '%.8f' % rnd.random(), 1500000000 + n]
+            for n in range(levels)]
+    asks = [['%.2f' % (mid + n * 0.5), '%.8f' % rnd.random(), 1500000000 + n]
+            for n in range(levels)]
+    return ['Snapshot', 'BTC-USD', 'bitfinex', bids, asks]
+
+
+def measure(compressor, envelopes, rounds):
+    """Return (ratio, encode MB/s, decode MB/s) for the given envelopes."""
+    raw = sum(len(json.dumps(e.data)) for e in envelopes)
+    start = time.perf_counter()
+    for _ in range(rounds):
+        encoded = [e.convert_to_frames(compressor=compressor) for e in envelopes]
+    encode_time = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for frames in encoded:
+            Envelope.load_from_frames(frames)
+    decode_time = time.perf_counter() - start
+    compressed = sum(len(f[2]) for f in encoded)
+    megabytes = raw * rounds / 1e6
+    return raw / compressed, megabytes / encode_time, megabytes / decode_time
+
+
+def main():
+    """Run the benchmark and print a result table."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rounds', type=int, default=20)
+    args = parser.parse_args()
+
+    samples = [json.dumps(book_snapshot(25, i)).encode('utf-8') for i in range(500)]
+    register_dictionary('book', train_dictionary(samples))
+
+    print('%-6s %-6s %8s %8s %10s %10s' % ('codec', 'dict', 'levels', 'ratio',
+                                            'enc MB/s', 'dec MB/s'))
+    base = Compressor('zlib', threshold=float('inf'))
+    for levels in (1, 10, 100, 1000):
+        envelopes = [Envelope('book/BTC-USD', 'bench', book_snapshot(levels, 1000 + i))
+                     for i in range(max(1, 2000 // levels))]
+        ratio, enc, dec = measure(base, envelopes, args.rounds)
+        print('%-6s %-6s %8s %8.2f %10.1f %10.1f' % ('none', '-', levels, ratio, enc, dec))
+        for codec in available_codecs():
+            for dictionaries in ({}, {'book/': 'book'}):
+                compressor = Compressor(codec, threshold=0, dictionaries=dictionaries)
+                ratio, enc, dec = measure(compressor, envelopes, args.rounds)
+                print('%-6s %-6s %8s %8.2f %10.1f %10.1f' % (
+                    codec, 'yes' if dictionaries else 'no', levels, ratio, enc, dec))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""Benchmark latency of control messages published behind bursts of bulk market data.
+
+Usage::
+
+    PYTHONPATH=. python benchmarks/lanes_bench.py [--rounds N] [--burst N]
+
+Each round publishes a burst of book updates followed by a single control message, and
+measures the time from publishing the control message until it is received from a bound
+:const:`zmq.XSUB` socket. With a single FIFO queue, the control message waits for the whole
+burst to be serialized and sent; with priority lanes it overtakes the queued burst, and with a
+dedicated lane socket it also bypasses the burst queued inside ZMQ.
+"""
+
+# Import Built-Ins
+import argparse
+import time
+
+# Import Third-Party
+import zmq
+
+# Import Homebrew
+from hermes import Envelope, Publisher
+from hermes.lanes import Lane, STRICT, WEIGHTED
+
+PORT = 5790
+CONTROL = 'control/orders'
+
+
+def run(addr, lanes, scheduling, rounds, burst):
+    """Run the benchmark with the given lanes; return sorted control latencies in seconds."""
+    ctx = zmq.Context.instance()
+    xsub = ctx.socket(zmq.XSUB)
+    xsub.bind(addr)
+    publisher = Publisher(addr, 'bench', restamp=False, lanes=lanes, scheduling=scheduling)
+    publisher.start()
+    time.sleep(.5)
+    xsub.send(b'\x01')
+    time.sleep(.2)
+
+    book = ['Book', 'BTC-USD', [[6500.0, 1.5]] * 10, [[6501.0, 2.5]] * 10]
+    latencies = []
+    for i in range(rounds):
+        for _ in range(burst):
+            publisher.publish(Envelope('book/BTC-USD', 'bench', book))
+        sent = time.time()
+        publisher.publish(Envelope(CONTROL, 'bench', ['Ack', i], ts=sent))
+        while True:
+            envelope = Envelope.load_from_frames(xsub.recv_multipart())
+            if envelope.topic == CONTROL:
+                latencies.append(time.time() - envelope.ts)
+                break
+        # Drain the rest of the burst before the next round.
+        while xsub.poll(100):
+            xsub.recv_multipart()
+
+    publisher.stop()
+    xsub.close()
+    return sorted(latencies)
+
+
+def main():
+    """Run the benchmark and print a result table."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rounds', type=int, default=20)
+    parser.add_argument('--burst', type=int, default=5000)
+    args = parser.parse_args()
+
+    setups = [
+        ('fifo', None, STRICT),
+        ('strict', [Lane('control', topics=['control/']), Lane('data')], STRICT),
+        ('weighted', [Lane('control', topics=['control/'], weight=10), Lane('data')],
+         WEIGHTED),
+        ('dedicated', [Lane('control', topics=['control/'], dedicated=True), Lane('data')],
+         STRICT),
+    ]
+    print('%-10s %10s %10s %10s' % ('queue', 'p50 ms', 'p90 ms', 'max ms'))
+    for i, (label, lanes, scheduling) in enumerate(setups):
+        latencies = run('tcp://127.0.0.1:%s' % (PORT + i), lanes, scheduling, args.rounds,
+                        args.burst)
+        pct = lambda p: latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1e3
+        print('%-10s %10.2f %10.2f %10.2f' % (label, pct(.5), pct(.9), latencies[-1] * 1e3))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+"""Benchmark one-way latency between two processes over shm, ipc and tcp transports.
+
+Usage::
+
+    PYTHONPATH=. python benchmarks/shm_latency_bench.py [--count N] [--interval US] [--size B]
+
+A publisher in the parent process sends Envelope frames to a receiver in a child process,
+paced at `--interval` microseconds. Each data frame carries the send time, taken with
+:func:`time.perf_counter` right before handing the frames to the transport; the receiver
+records the elapsed time on arrival. Serialization is excluded, so the figures compare the
+transports only. On Linux, :func:`time.perf_counter` is system-wide, which makes it
+comparable across processes. Both sides poll, yielding the CPU while idle; run on a host with
+at least two free cores, or scheduling delays dominate the results.
+"""
+
+# Import Built-Ins
+import argparse
+import multiprocessing
+import os
+import struct
+import time
+
+# Import Third-Party
+import zmq
+
+# Import Homebrew
+from hermes import Envelope
+from hermes.shm import ShmPublisher, ShmReceiver
+
+STAMP = struct.Struct('<d')
+STOP = b'stop'
+
+
+def frames_for(size):
+    """Return Envelope frames whose data frame is padded to `size` bytes."""
+    frames = list(Envelope('bench/trades', 'bench', ['Raw', 0]).convert_to_frames())
+    return frames[:2] + [b'\x00' * max(size, STAMP.size)] + frames[3:]
+
+
+def shm_receiver(address, ready, results):
+    """Receive frames from the shm ring at `address` until STOP, and report latencies."""
+    receiver = ShmReceiver(address, 'bench')
+    receiver.start(timeout=5)
+    ready.set()
+    latencies = []
+    while True:
+        frames = receiver.recv_frames()
+        if frames is None:
+            os.sched_yield()
+            continue
+        now = time.perf_counter()
+        if frames[2] == STOP:
+            break
+        latencies.append(now - STAMP.unpack_from(frames[2])[0])
+    receiver.stop()
+    results.put(latencies)
+
+
+def zmq_receiver(address, ready, results):
+    """Receive frames from a SUB socket connected to `address` until STOP."""
+    sock = zmq.Context.instance().socket(zmq.SUB)
+    sock.connect(address)
+    sock.setsockopt(zmq.SUBSCRIBE, b'')
+    latencies = []
+    while True:
+        frames = sock.recv_multipart()
+        now = time.perf_counter()
+        if frames[2] == STOP:
+            break
+        if not ready.is_set():
+            ready.set()
+            continue
+        latencies.append(now - STAMP.unpack_from(frames[2])[0])
+    sock.close()
+    results.put(latencies)
+
+
+def run(transport, count, interval, size):
+    """Run a single transport and return its sorted latencies in seconds."""
+    ctx = multiprocessing.get_context('spawn')
+    ready, results = ctx.Event(), ctx.Queue()
+    if transport == 'shm':
+        address = 'hermes-bench-%s' % os.getpid()
+        publisher = ShmPublisher(address, 'bench', slots=1024, slot_size=size + 256)
+        publisher.start()
+        send, target = publisher.publish_frames, shm_receiver
+    else:
+        address = {'ipc': 'ipc:///tmp/hermes-bench-%s' % os.getpid(),
+                   'tcp': 'tcp://127.0.0.1:5799'}[transport]
+        sock = zmq.Context.instance().socket(zmq.PUB)
+        sock.bind(address)
+        send, target = sock.send_multipart, zmq_receiver
+
+    child = ctx.Process(target=target, args=(address, ready, results))
+    child.start()
+    template = frames_for(size)
+    # Wait for the receiver to attach or subscribe before measuring.
+    while not ready.wait(.01):
+        send(template)
+
+    payload = bytearray(template[2])
+    deadline = time.perf_counter()
+    for _ in range(count):
+        deadline += interval
+        while time.perf_counter() < deadline:
+            os.sched_yield()
+        STAMP.pack_into(payload, 0, time.perf_counter())
+        send(template[:2] + [bytes(payload)] + template[3:])
+    send(template[:2] + [STOP] + template[3:])
+    latencies = results.get(timeout=30)
+    child.join()
+
+    if transport == 'shm':
+        publisher.stop()
+    else:
+        sock.close()
+    return sorted(latencies)
+
+
+def main():
+    """Run the benchmark and print a result table."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--count', type=int, default=20000)
+    parser.add_argument('--interval', type=float, default=50, help='microseconds')
+    parser.add_argument('--size', type=int, default=128, help='data frame bytes')
+    args = parser.parse_args()
+
+    print('%-6s %8s %10s %10s %10s %10s' % ('trans', 'received', 'p50 us', 'p90 us',
+                                            'p99 us', 'max us'))
+    for transport in ('shm', 'ipc', 'tcp'):
+        latencies = run(transport, args.count, args.interval / 1e6, args.size)
+        pct = lambda p: latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1e6
+        print('%-6s %8s %10.1f %10.1f %10.1f %10.1f' % (
+            transport, len(latencies), pct(.5), pct(.9), pct(.99), latencies[-1] * 1e6))
+
+
+if __name__ == '__main__':
+    main()
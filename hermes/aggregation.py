@@ -0,0 +1,444 @@
+"""Streaming, windowed aggregation of price and size updates.
+
+Aggregators are updated incrementally, at O(1) amortized cost per update, and never rescan
+their window:
+
+* :class:`hermes.aggregation.Sum`, :class:`hermes.aggregation.Count` and
+  :class:`hermes.aggregation.VWAP` keep running sums, subtracting samples leaving the window.
+* :class:`hermes.aggregation.Min` and :class:`hermes.aggregation.Max` keep a monotonic deque
+  of candidate samples.
+* :class:`hermes.aggregation.OHLC` combines the above with the first and last sample.
+
+Windows are kept per key (usually the topic of an envelope).
+:class:`hermes.aggregation.TumblingWindow` emits a result each time a window of fixed length
+closes, :class:`hermes.aggregation.SlidingWindow` emits the aggregate over the last `length`
+seconds at most once per `emit_interval`.
+
+:class:`hermes.aggregation.AggregationNode` feeds received envelopes into a window and
+publishes its results as :class:`hermes.structs.WindowResult` messages.
+"""
+
+# Import Built-Ins
+import logging
+import time
+from collections import deque
+
+# Import Third-Party
+
+# Import Homebrew
+from hermes.node import Node
+from hermes.structs import WindowResult
+
+# Init Logging Facilities
+log = logging.getLogger(__name__)
+
+# Indices of the fields of a sample tuple (seq, ts, price, size).
+SEQ, TS, PRICE, SIZE = 0, 1, 2, 3
+
+
+class Aggregator:
+    """
+    Base class for incremental aggregators.
+
+    Samples are tuples of (seq, ts, price, size) and are removed in the order they were added.
+    """
+
+    def __init__(self, field=PRICE):
+        """
+        Initialize an :class:`hermes.aggregation.Aggregator` instance.
+
+        :param field: index of the sample field to aggregate
+        """
+        self.field = field
+
+    def add(self, sample):
+        """Add a sample entering the window."""
+        raise NotImplementedError
+
+    def remove(self, sample):
+        """Remove the oldest sample, which is leaving the window."""
+        raise NotImplementedError
+
+    def value(self):
+        """Return the aggregate over all samples currently in the window."""
+        raise NotImplementedError
+
+
+class Sum(Aggregator):
+    """Sum of a sample field, sizes by default."""
+
+    def __init__(self, field=SIZE):
+        """Initialize a :class:`hermes.aggregation.Sum` instance."""
+        super(Sum, self).__init__(field)
+        self.total = 0.0
+
+    def add(self, sample):
+        """Add a sample entering the window."""
+        self.total += sample[self.field]
+
+    def remove(self, sample):
+        """Remove the oldest sample, which is leaving the window."""
+        self.total -= sample[self.field]
+
+    def value(self):
+        """Return the sum."""
+        return self.total
+
+
+class Count(Aggregator):
+    """Number of samples."""
+
+    def __init__(self, field=PRICE):
+        """Initialize a :class:`hermes.aggregation.Count` instance."""
+        super(Count, self).__init__(field)
+        self.count = 0
+
+    def add(self, sample):
+        """Add a sample entering the window."""
+        self.count += 1
+
+    def remove(self, sample):
+        """Remove the oldest sample, which is leaving the window."""
+        self.count -= 1
+
+    def value(self):
+        """Return the number of samples."""
+        return self.count
+
+
+class Min(Aggregator):
+    """Minimum of a sample field, prices by default, using a monotonic deque."""
+
+    def __init__(self, field=PRICE):
+        """Initialize a :class:`hermes.aggregation.Min` instance."""
+        super(Min, self).__init__(field)
+        self._candidates = deque()
+
+    def _dominates(self, new, old):
+        """Check if `new` makes `old` obsolete as candidate."""
+        return new <= old
+
+    def add(self, sample):
+        """Add a sample entering the window."""
+        candidates, field = self._candidates, self.field
+        value = sample[field]
+        while candidates and self._dominates(value, candidates[-1][field]):
+            candidates.pop()
+        candidates.append(sample)
+
+    def remove(self, sample):
+        """Remove the oldest sample, which is leaving the window."""
+        if self._candidates and self._candidates[0][SEQ] == sample[SEQ]:
+            self._candidates.popleft()
+
+    def value(self):
+        """Return the extreme value, or :class:`None` if the window is empty."""
+        return self._candidates[0][self.field] if self._candidates else None
+
+
+class Max(Min):
+    """Maximum of a sample field, prices by default, using a monotonic deque."""
+
+    def _dominates(self, new, old):
+        """Check if `new` makes `old` obsolete as candidate."""
+        return new >= old
+
+
+class VWAP(Aggregator):
+    """Volume weighted average price."""
+
+    def __init__(self, field=PRICE):
+        """Initialize a :class:`hermes.aggregation.VWAP` instance."""
+        super(VWAP, self).__init__(field)
+        self.notional = 0.0
+        self.volume = 0.0
+
+    def add(self, sample):
+        """Add a sample entering the window."""
+        self.notional += sample[PRICE] * sample[SIZE]
+        self.volume += sample[SIZE]
+
+    def remove(self, sample):
+        """Remove the oldest sample, which is leaving the window."""
+        self.notional -= sample[PRICE] * sample[SIZE]
+        self.volume -= sample[SIZE]
+
+    def value(self):
+        """Return the VWAP, or :class:`None` if there was no volume."""
+        return self.notional / self.volume if self.volume else None
+
+
+class OHLC(Aggregator):
+    """Open, high, low and close prices."""
+
+    def __init__(self, field=PRICE):
+        """Initialize a :class:`hermes.aggregation.OHLC` instance."""
+        super(OHLC, self).__init__(field)
+        self._samples = deque()
+        self._high = Max(field)
+        self._low = Min(field)
+
+    def add(self, sample):
+        """Add a sample entering the window."""
+        self._samples.append(sample)
+        self._high.add(sample)
+        self._low.add(sample)
+
+    def remove(self, sample):
+        """Remove the oldest sample, which is leaving the window."""
+        self._samples.popleft()
+        self._high.remove(sample)
+        self._low.remove(sample)
+
+    def value(self):
+        """Return [open, high, low, close], or :class:`None` if the window is empty."""
+        if not self._samples:
+            return None
+        return [self._samples[0][self.field], self._high.value(), self._low.value(),
+                self._samples[-1][self.field]]
+
+
+class _Window:
+    """Base class for windows keeping aggregators per key."""
+
+    def __init__(self, length, aggregators):
+        """
+        Initialize the window.
+
+        :param length: window length in seconds
+        :param aggregators: dict mapping names to :class:`hermes.aggregation.Aggregator`
+                            classes or factories
+        """
+        self.length = length
+        self.aggregators = aggregators
+        self._state = {}
+        self._seq = 0
+
+    def _new_aggregators(self):
+        """Return a fresh set of aggregators."""
+        return {name: factory() for name, factory in self.aggregators.items()}
+
+    @staticmethod
+    def _values(aggregators):
+        """Return the current values of the given aggregators."""
+        return {name: agg.value() for name, agg in aggregators.items()}
+
+    def update(self, key, ts, price, size):
+        """
+        Add a sample to the window of the given key.
+
+        :param key: key of the window, e.g. a topic
+        :param ts: timestamp of the sample
+        :param price: price of the sample
+        :param size: size of the sample
+        :return: list of emitted :class:`hermes.structs.WindowResult` instances
+        """
+        raise NotImplementedError
+
+
+class TumblingWindow(_Window):
+    """
+    Fixed, non-overlapping windows aligned to multiples of their length.
+
+    A sample starting a new window emits the windows of all keys which ended before it, so
+    windows of keys without further samples close while other keys keep the stream busy.
+    Samples belonging to a window which was emitted already arrive too late to be included;
+    they are dropped and counted in :attr:`hermes.aggregation.TumblingWindow.late`.
+    """
+
+    def __init__(self, length, aggregators):
+        """
+        Initialize a :class:`hermes.aggregation.TumblingWindow` instance.
+
+        :param length: window length in seconds
+        :param aggregators: dict mapping names to :class:`hermes.aggregation.Aggregator`
+                            classes or factories
+        """
+        super(TumblingWindow, self).__init__(length, aggregators)
+        self.late = 0
+        self._latest = None
+        self._emitted = {}
+
+    def update(self, key, ts, price, size):
+        """
+        Add a sample, emitting all windows which ended before the sample's window started.
+
+        :return: list of emitted :class:`hermes.structs.WindowResult` instances
+        """
+        bucket = int(ts // self.length)
+        try:
+            current, aggregators = self._state[key]
+        except KeyError:
+            current, aggregators = None, None
+            late = key in self._emitted and bucket <= self._emitted[key]
+        else:
+            late = bucket < current
+        if late:
+            self.late += 1
+            return []
+
+        results = []
+        if current is not None and current < bucket:
+            results.append(self._emit(key, current, aggregators))
+            current = None
+        if self._latest is None or bucket > self._latest:
+            self._latest = bucket
+            results.extend(self._close(bucket))
+        if current is None:
+            aggregators = self._new_aggregators()
+            self._state[key] = bucket, aggregators
+        self._seq += 1
+        sample = (self._seq, ts, price, size)
+        for agg in aggregators.values():
+            agg.add(sample)
+        return results
+
+    def _close(self, bucket):
+        """Emit the windows of all keys which ended before the given window."""
+        return [self._emit(key, current, aggregators)
+                for key, (current, aggregators) in list(self._state.items()) if current < bucket]
+
+    def _emit(self, key, bucket, aggregators):
+        """Remove the window of `key`, and return its result."""
+        del self._state[key]
+        self._emitted[key] = bucket
+        start = bucket * self.length
+        return WindowResult(key, start, start + self.length, self._values(aggregators))
+
+    def flush(self, now=None):
+        """
+        Emit and reset all windows which ended before `now`.
+
+        :param now: current timestamp, defaults to :func:`time.time`
+        :return: list of emitted :class:`hermes.structs.WindowResult` instances
+        """
+        return self._close(int((now or time.time()) // self.length))
+
+
+class SlidingWindow(_Window):
+    """Window covering the last `length` seconds before the most recent sample of each key."""
+
+    def __init__(self, length, aggregators, emit_interval=0):
+        """
+        Initialize a :class:`hermes.aggregation.SlidingWindow` instance.
+
+        :param length: window length in seconds
+        :param aggregators: dict mapping names to :class:`hermes.aggregation.Aggregator`
+                            classes or factories
+        :param emit_interval: minimum time in seconds between results per key; 0 emits a
+                              result for every sample
+        """
+        super(SlidingWindow, self).__init__(length, aggregators)
+        self.emit_interval = emit_interval
+
+    def update(self, key, ts, price, size):
+        """
+        Add a sample, evict samples older than `length` and emit the result, if due.
+
+        :return: list of emitted :class:`hermes.structs.WindowResult` instances
+        """
+        self._seq += 1
+        try:
+            samples, aggregators, last_emit = self._state[key]
+        except KeyError:
+            samples, aggregators, last_emit = deque(), self._new_aggregators(), None
+        sample = (self._seq, ts, price, size)
+        samples.append(sample)
+        for agg in aggregators.values():
+            agg.add(sample)
+
+        cutoff = ts - self.length
+        while samples[0][TS] <= cutoff:
+            old = samples.popleft()
+            for agg in aggregators.values():
+                agg.remove(old)
+
+        if last_emit is None or ts - last_emit >= self.emit_interval:
+            self._state[key] = samples, aggregators, ts
+            return [WindowResult(key, cutoff, ts, self._values(aggregators))]
+        self._state[key] = samples, aggregators, last_emit
+        return []
+
+    def value(self, key):
+        """
+        Return the current aggregates of the given key.
+
+        :param key: key of the window
+        :return: :class:`dict` mapping aggregator names to values
+        """
+        return self._values(self._state[key][1])
+
+
+def extract_trade(envelope):
+    """
+    Return the (price, size) of a trade envelope.
+
+    Supports :class:`hermes.Message` data with `price` and `size` attributes, and lists of the
+    form ``[dtype, price, size, ...]``.
+
+    :param envelope: :class:`hermes.Envelope` instance
+    :return: tuple of :class:`float`
+    """
+    data = envelope.data
+    try:
+        return float(data.price), float(data.size)
+    except AttributeError:
+        return float(data[1]), float(data[2])
+
+
+class AggregationNode(Node):
+    """:class:`hermes.Node` aggregating received envelopes per topic and publishing results."""
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, name, window, receiver=None, publisher=None, channel='agg',
+                 extract=None, facilities=None):
+        """
+        Initialize a :class:`hermes.aggregation.AggregationNode` instance.
+
+        :param name: name of the :class:`hermes.Node` instance.
+        :param window: :class:`hermes.aggregation.TumblingWindow` or
+                       :class:`hermes.aggregation.SlidingWindow` instance
+        :param receiver: :class:`hermes.Receiver` instance.
+        :param publisher: :class:`hermes.Publisher` instance.
+        :param channel: channel to publish results on; the key of the window is appended
+        :param extract: callable returning (price, size) of an envelope, defaults to
+                        :func:`hermes.aggregation.extract_trade`
+        :param facilities: list of additional facilities
+        """
+        super(AggregationNode, self).__init__(name, receiver, publisher, facilities)
+        self.window = window
+        self.channel = channel
+        self.extract = extract or extract_trade
+
+    def aggregate(self, envelope):
+        """
+        Add the given envelope to the window and publish all results emitted.
+
+        :param envelope: :class:`hermes.Envelope` instance
+        :return: :class:`None`
+        """
+        try:
+            price, size = self.extract(envelope)
+        except (TypeError, ValueError, IndexError):
+            log.debug("Cannot aggregate %r", envelope)
+            return
+        for result in self.window.update(envelope.topic, envelope.ts, price, size):
+            self.publish('%s/%s' % (self.channel, result.key), result)
+
+    def run(self):
+        """
+        Execute the main loop.
+
+        While :attr:`hermes.Node._running` is True, aggregate all received envelopes, and
+        periodically flush tumbling windows which closed without receiving new samples.
+        """
+        flush = getattr(self.window, 'flush', None)
+        next_flush = time.time() + self.window.length
+        while self._running:
+            envelope = self.recv()
+            if envelope is not None:
+                self.aggregate(envelope)
+            elif flush and time.time() >= next_flush:
+                for result in flush():
+                    self.publish('%s/%s' % (self.channel, result.key), result)
+                next_flush = time.time() + self.window.length
@@ -0,0 +1,131 @@
+"""Adaptive batching of envelopes sent by a Publisher.
+
+Sending each envelope in a ZMQ message of its own costs a round of system calls and
+framing per envelope, which caps throughput; batching a fixed number of envelopes adds latency
+at quiet times. A :class:`hermes.batching.AdaptiveBatcher` chooses between three modes, based
+on the depth of the publisher's queue and the rate at which envelopes are sent:
+
+* ``immediate``: the queue is short and envelopes arrive slower than one per
+  `max_latency`; each envelope is sent as soon as it is dequeued.
+* ``linger``: the queue is short, but envelopes arrive fast enough to expect more within
+  `max_latency`; the publisher waits up to `max_latency` to fill a batch.
+* ``burst``: envelopes are queued up already; all of them, up to `max_batch`, are sent at once.
+
+Batched envelopes are grouped by topic, and each group is sent as a single multipart message
+of four frames per envelope. As the first frame is the topic frame, subscriptions filter
+batches like single envelopes. :func:`hermes.batching.split_batch` splits such messages into
+the frames of single envelopes again; :class:`hermes.Receiver` and
+:class:`hermes.journal.Recorder` do so transparently. Envelopes of different topics may be
+reordered within a batch, but the order of envelopes per topic is kept.
+"""
+
+# Import Built-Ins
+import logging
+from collections import Counter, OrderedDict
+
+# Import Third-Party
+
+# Import Homebrew
+
+# Init Logging Facilities
+log = logging.getLogger(__name__)
+
+# Number of frames of a single envelope.
+ENVELOPE_FRAMES = 4
+
+IMMEDIATE, LINGER, BURST = 'immediate', 'linger', 'burst'
+
+
+def split_batch(frames):
+    """
+    Split a message into the frames of the envelopes it contains.
+
+    :param frames: list of :class:`bytes`, as received by :meth:`zmq.Socket.recv_multipart`
+    :return: list of lists of :class:`bytes`; the message itself, unless it is a batch
+    """
+    if len(frames) <= ENVELOPE_FRAMES or len(frames) % ENVELOPE_FRAMES:
+        return [frames]
+    return [frames[i:i + ENVELOPE_FRAMES] for i in range(0, len(frames), ENVELOPE_FRAMES)]
+
+
+def group_by_topic(envelopes):
+    """
+    Group envelopes by topic, keeping their order per topic.
+
+    :param envelopes: list of :class:`hermes.Envelope`
+    :return: list of lists of :class:`hermes.Envelope`, in order of each topic's first envelope
+    """
+    groups = OrderedDict()
+    for envelope in envelopes:
+        groups.setdefault(envelope.topic, []).append(envelope)
+    return list(groups.values())
+
+
+class AdaptiveBatcher:
+    """Choose how many envelopes to batch and how long to wait for them, based on load."""
+
+    def __init__(self, max_latency=0.001, max_batch=256, smoothing=0.1):
+        """
+        Initialize a :class:`hermes.batching.AdaptiveBatcher` instance.
+
+        :param max_latency: maximum time in seconds to hold back an envelope to fill a batch
+        :param max_batch: maximum number of envelopes per batch
+        :param smoothing: weight of the latest measurement in the send rate's moving average
+        """
+        if max_latency <= 0:
+            raise ValueError("max_latency must be positive, not %r" % max_latency)
+        if max_batch < 1:
+            raise ValueError("max_batch must be at least 1, not %r" % max_batch)
+        self.max_latency = max_latency
+        self.max_batch = max_batch
+        self.smoothing = smoothing
+        self.mode = IMMEDIATE
+        self.rate = 0.0
+        self.histogram = Counter()
+        self._last_sent = None
+
+    def plan(self, depth):
+        """
+        Decide how to form the next batch, given the number of queued envelopes.
+
+        :param depth: number of envelopes queued, including the first one of the batch
+        :return: tuple of the maximum batch size and the time in seconds to wait for it
+        """
+        if depth > 1:
+            self.mode = BURST
+            return min(depth, self.max_batch), 0.0
+        if self.rate * self.max_latency >= 2:
+            self.mode = LINGER
+            return self.max_batch, min(self.max_latency, self.max_batch / self.rate)
+        self.mode = IMMEDIATE
+        return 1, 0.0
+
+    def sent(self, count, now):
+        """
+        Record that a batch of `count` envelopes was sent, updating the send rate.
+
+        :param count: number of envelopes in the batch
+        :param now: current time in seconds
+        :return: :class:`None`
+        """
+        if self._last_sent is not None:
+            elapsed = max(now - self._last_sent, 1e-6)
+            self.rate += self.smoothing * (count / elapsed - self.rate)
+        self._last_sent = now
+
+    def record(self, size):
+        """Count a message of `size` envelopes in the batch size histogram."""
+        bucket = 1
+        while bucket < size:
+            bucket *= 2
+        self.histogram[bucket] += 1
+
+    def stats(self):
+        """
+        Return batching statistics.
+
+        :return: :class:`dict` with the current mode, send rate in envelopes per second, and
+                 a histogram of envelopes per message, in power-of-two buckets
+        """
+        return {'mode': self.mode, 'rate': self.rate,
+                'histogram': dict(sorted(self.histogram.items()))}
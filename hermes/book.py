@@ -0,0 +1,249 @@
+"""Incremental order book engine, fed by :class:`hermes.structs.OrderBook` envelopes.
+
+:class:`hermes.book.Book` maintains both sides of a level 2 order book. Price levels are kept in
+a sorted array per side, ordered such that the best price is always at the end: bids ascending,
+asks by descending price. Updates locate their level using binary search; since most updates
+happen close to the top of the book, inserting or removing a level rarely moves more than a
+few array elements. The best bid and ask are read in O(1).
+
+:class:`hermes.book.BookNode` is a :class:`hermes.Node` applying all received snapshots and
+deltas to one :class:`hermes.book.Book` per exchange and pair. After draining up to `max_drain`
+envelopes from its receiver, it publishes a single top-N view per changed book, conflating all
+updates received in between. Bounding the drain keeps views flowing under sustained load.
+"""
+
+# Import Built-Ins
+import logging
+from bisect import bisect_left
+
+# Import Third-Party
+
+# Import Homebrew
+from hermes.node import Node
+from hermes.structs import OrderBook
+
+# Init Logging Facilities
+log = logging.getLogger(__name__)
+
+
+class BookSide:
+    """Price levels of one side of an order book."""
+
+    def __init__(self, is_bid):
+        """
+        Initialize a :class:`hermes.book.BookSide` instance.
+
+        :param is_bid: True for the bid side, False for the ask side
+        """
+        self.is_bid = is_bid
+        self._keys = []
+        self._sizes = {}
+
+    def __len__(self):
+        """Return the number of price levels."""
+        return len(self._keys)
+
+    def _key(self, price):
+        """Return the sort key of a price; the best price has the largest key."""
+        return price if self.is_bid else -price
+
+    def clear(self):
+        """Remove all price levels."""
+        self._keys = []
+        self._sizes = {}
+
+    def update(self, price, size):
+        """
+        Set the size of a price level, removing it if `size` is 0.
+
+        :param price: price of the level as :class:`float`
+        :param size: size of the level as :class:`float`
+        :return: :class:`None`
+        """
+        key = self._key(price)
+        if not size:
+            if self._sizes.pop(key, None) is not None:
+                del self._keys[bisect_left(self._keys, key)]
+            return
+        if key not in self._sizes:
+            keys = self._keys
+            if not keys or key > keys[-1]:
+                keys.append(key)
+            else:
+                keys.insert(bisect_left(keys, key), key)
+        self._sizes[key] = size
+
+    @property
+    def best(self):
+        """Return the best level as (price, size) tuple, or :class:`None` if empty."""
+        if not self._keys:
+            return None
+        key = self._keys[-1]
+        return self._key(key), self._sizes[key]
+
+    def top(self, n):
+        """
+        Return the best `n` levels, best first.
+
+        :param n: number of levels
+        :return: list of [price, size] pairs
+        """
+        keys = self._keys[:-n - 1:-1] if n else []
+        sizes = self._sizes
+        return [[self._key(key), sizes[key]] for key in keys]
+
+
+class Book:
+    """Level 2 order book of a single pair on a single exchange."""
+
+    def __init__(self, exchange, pair):
+        """
+        Initialize a :class:`hermes.book.Book` instance.
+
+        :param exchange: name of the exchange
+        :param pair: name of the traded pair
+        """
+        self.exchange = exchange
+        self.pair = pair
+        self.bids = BookSide(is_bid=True)
+        self.asks = BookSide(is_bid=False)
+        self.seq = None
+        self.synced = False
+        self.updates = 0
+
+    @property
+    def best_bid(self):
+        """Return the best bid as (price, size) tuple, or :class:`None`."""
+        return self.bids.best
+
+    @property
+    def best_ask(self):
+        """Return the best ask as (price, size) tuple, or :class:`None`."""
+        return self.asks.best
+
+    def apply(self, update):
+        """
+        Apply a snapshot or delta to the book.
+
+        Deltas received before the first snapshot, or after a gap in sequence numbers, are
+        ignored until the next snapshot arrives.
+
+        :param update: :class:`hermes.structs.OrderBook` instance
+        :return: True if the book changed, False otherwise
+        """
+        if update.snapshot:
+            self.bids.clear()
+            self.asks.clear()
+            self.synced = True
+        elif not self.synced:
+            return False
+        elif update.seq is not None and self.seq is not None and update.seq != self.seq + 1:
+            log.warning("Gap in %s %s book (expected seq %s, got %s), waiting for snapshot",
+                        self.exchange, self.pair, self.seq + 1, update.seq)
+            self.synced = False
+            return False
+
+        for price, size in update.bids:
+            self.bids.update(float(price), float(size))
+        for price, size in update.asks:
+            self.asks.update(float(price), float(size))
+        self.seq = update.seq
+        self.updates += 1
+        return True
+
+    def view(self, depth):
+        """
+        Return the top `depth` levels of each side as snapshot message.
+
+        :param depth: number of levels per side
+        :return: :class:`hermes.structs.OrderBook` instance
+        """
+        return OrderBook(self.exchange, self.pair, self.bids.top(depth), self.asks.top(depth),
+                         snapshot=True, seq=self.seq)
+
+
+class BookNode(Node):
+    """
+    :class:`hermes.Node` maintaining order books and publishing conflated top-N views.
+
+    Envelopes not containing :class:`hermes.structs.OrderBook` data are ignored.
+    """
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, name, receiver=None, publisher=None, depth=10, channel='book',
+                 facilities=None, max_drain=1000):
+        """
+        Initialize a :class:`hermes.book.BookNode` instance.
+
+        :param name: name of the :class:`hermes.Node` instance.
+        :param receiver: :class:`hermes.Receiver` instance.
+        :param publisher: :class:`hermes.Publisher` instance.
+        :param depth: number of levels per side to publish
+        :param channel: channel to publish views on; the exchange and pair are appended
+        :param facilities: list of additional facilities
+        :param max_drain: maximum number of envelopes to apply before publishing views
+        """
+        super(BookNode, self).__init__(name, receiver, publisher, facilities)
+        if max_drain < 1:
+            raise ValueError("max_drain must be at least 1, not %r" % max_drain)
+        self.max_drain = max_drain
+        self.depth = depth
+        self.channel = channel
+        self.books = {}
+
+    def apply(self, envelope):
+        """
+        Apply the order book data of the given envelope to its book.
+
+        :param envelope: :class:`hermes.Envelope` instance
+        :return: the updated :class:`hermes.book.Book`, or :class:`None` if unchanged
+        """
+        update = envelope.data
+        if not isinstance(update, OrderBook):
+            return None
+        key = update.exchange, update.pair
+        try:
+            book = self.books[key]
+        except KeyError:
+            book = self.books[key] = Book(*key)
+        return book if book.apply(update) else None
+
+    def publish_views(self, books):
+        """
+        Publish the top-N view of each of the given books.
+
+        :param books: iterable of :class:`hermes.book.Book` instances
+        :return: :class:`None`
+        """
+        for book in books:
+            channel = '%s/%s/%s' % (self.channel, book.exchange, book.pair)
+            self.publish(channel, book.view(self.depth))
+
+    def run(self):
+        """
+        Execute the main loop.
+
+        While :attr:`hermes.Node._running` is True, apply up to :attr:`max_drain` envelopes
+        from the receiver and publish one view per changed book.
+        """
+        while self._running:
+            self.drain()
+
+    def drain(self):
+        """
+        Apply up to :attr:`max_drain` received envelopes and publish the changed books' views.
+
+        :return: number of envelopes applied
+        """
+        changed = {}
+        count = 0
+        while count < self.max_drain:
+            envelope = self.recv()
+            if envelope is None:
+                break
+            count += 1
+            book = self.apply(envelope)
+            if book is not None:
+                changed[(book.exchange, book.pair)] = book
+        self.publish_views(changed.values())
+        return count
@@ -0,0 +1,156 @@
+"""Clock offset estimation between hosts of a cluster.
+
+:class:`hermes.Envelope` timestamps are taken from the local clock of the sending host, so
+comparing them to the clock of a receiving host mixes latency with clock skew. To separate the
+two, every :class:`hermes.clock.ClockSync` instance periodically pings the clock socket of a
+:class:`hermes.PostOffice` and estimates the offset of the local clock to the PostOffice's
+clock, NTP-style::
+
+    offset = t_server - (t_sent + t_received) / 2
+    delay = t_received - t_sent
+
+Of the most recent samples, the offset of the one with the lowest round-trip delay is used, as
+it is the least distorted by queuing.
+
+A :class:`hermes.Publisher` given a :class:`hermes.clock.ClockSync` stamps envelopes with
+:meth:`hermes.clock.ClockSync.now`, i.e. in the PostOffice's timebase. A
+:class:`hermes.Receiver` using a :class:`hermes.clock.ClockSync` as well then measures per-hop
+latencies which are corrected for clock skew between both hosts.
+"""
+
+# Import Built-Ins
+import logging
+import json
+import time
+from collections import deque
+from threading import Thread, Event
+
+# Import Third-Party
+import zmq
+
+# Import Homebrew
+from hermes.context import create_socket, get_context
+
+# Init Logging Facilities
+log = logging.getLogger(__name__)
+
+
+def answer_pings(sock):
+    """
+    Answer all pending pings on the given :const:`zmq.ROUTER` socket with the current time.
+
+    Used by :class:`hermes.PostOffice` to serve its clock socket.
+
+    :param sock: :const:`zmq.ROUTER` socket :class:`hermes.clock.ClockSync` instances connect to
+    :return: :class:`None`
+    """
+    while True:
+        try:
+            identity, t_sent = sock.recv_multipart(zmq.NOBLOCK)
+        except zmq.error.Again:
+            return
+        sock.send_multipart([identity, t_sent, json.dumps(time.time()).encode('utf-8')])
+
+
+def hop_latency(envelope, clock=None):
+    """
+    Return the time in seconds since the given envelope was sent.
+
+    :param envelope: received :class:`hermes.Envelope`
+    :param clock: :class:`hermes.clock.ClockSync` the sender stamped the envelope with
+    :return: latency in seconds as :class:`float`
+    """
+    now = clock.now() if clock else time.time()
+    return now - float(envelope.sent)
+
+
+class ClockSync(Thread):
+    """Estimate the offset of the local clock to a :class:`hermes.PostOffice`'s clock."""
+
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(self, clock_addr, name='ClockSync', interval=1.0, samples=8, ctx=None):
+        """
+        Initialize a :class:`hermes.clock.ClockSync` instance.
+
+        :param clock_addr: address of the :class:`hermes.PostOffice` clock socket
+        :param name: Name to give this :class:`hermes.clock.ClockSync` instance
+        :param interval: time in seconds between pings
+        :param samples: number of recent samples to select the offset from
+        :param ctx: :class:`zmq.Context` to use; defaults to the shared context
+        """
+        self.clock_addr = clock_addr
+        self.interval = interval
+        self.offset = 0.0
+        self.delay = None
+        self._samples = deque(maxlen=samples)
+        self._synced = Event()
+        self._running = Event()
+        self.ctx = ctx or get_context()
+        super(ClockSync, self).__init__(name=name, daemon=True)
+
+    @property
+    def synced(self):
+        """Check if at least one offset sample was taken."""
+        return self._synced.is_set()
+
+    def wait(self, timeout=None):
+        """
+        Block until the first offset sample was taken.
+
+        :param timeout: timeout in seconds
+        :return: True if synced, False on timeout
+        """
+        return self._synced.wait(timeout)
+
+    def now(self):
+        """Return the current time in the reference clock's timebase."""
+        return time.time() + self.offset
+
+    def add_sample(self, t_sent, t_server, t_received):
+        """
+        Add an offset sample and update the offset estimate.
+
+        :param t_sent: local time the ping was sent at
+        :param t_server: reference time the ping was answered at
+        :param t_received: local time the answer was received at
+        :return: :class:`None`
+        """
+        delay = t_received - t_sent
+        self._samples.append((delay, t_server - (t_sent + t_received) / 2))
+        self.delay, self.offset = min(self._samples)
+        self._synced.set()
+
+    def stop(self, timeout=None):
+        """
+        Stop the :class:`hermes.clock.ClockSync` instance.
+
+        :param timeout: timeout in seconds passed to :meth:`threading.Thread.join()`
+        :return: :class:`None`
+        """
+        self._running.clear()
+        self.join(timeout)
+
+    def run(self):
+        """
+        Ping the reference clock every :attr:`hermes.clock.ClockSync.interval` seconds.
+
+        :return: :class:`None`
+        """
+        self._running.set()
+        sock = create_socket(self.ctx, zmq.DEALER)
+        log.info("Connecting ClockSync to %s..", self.clock_addr)
+        sock.connect(self.clock_addr)
+        while self._running.is_set():
+            started = time.time()
+            sock.send(json.dumps(started).encode('utf-8'))
+            deadline = started + self.interval
+            while self._running.is_set() and time.time() < deadline:
+                if not sock.poll(min(100, max(1, (deadline - time.time()) * 1000))):
+                    continue
+                t_sent, t_server = sock.recv_multipart()
+                self.add_sample(json.loads(t_sent.decode('utf-8')),
+                                json.loads(t_server.decode('utf-8')), time.time())
+                log.debug("Clock offset %.6fs (delay %.6fs)", self.offset, self.delay)
+        sock.close(linger=0)
+        log.info("Loop terminated.")
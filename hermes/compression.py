@@ -0,0 +1,222 @@
+r"""Optional compression of :class:`hermes.Envelope` data frames.
+
+Compression is enabled on the sending side by passing a :class:`hermes.compression.Compressor`
+to :meth:`hermes.Envelope.convert_to_frames` (or to a :class:`hermes.Publisher`). Data frames
+smaller than the compressor's threshold are sent as-is.
+
+Compressed data frames are flagged by a leading NUL byte, which can never start a JSON document,
+followed by a header identifying codec and dictionary::
+
+    b'\x00'  magic byte
+    uint8    codec id
+    uint8    length of the dictionary name (0 if no dictionary was used)
+    bytes    dictionary name (ascii)
+    bytes    compressed payload
+
+:meth:`hermes.Envelope.load_from_frames` detects the flag and decompresses transparently.
+Dictionaries are looked up by name in a process-wide registry, so receivers only need to
+register the same dictionaries as the sender via :func:`hermes.compression.register_dictionary`.
+
+zlib is always available; zstd and lz4 are used if the `zstandard` and `lz4` packages are
+installed, respectively.
+"""
+
+# Import Built-Ins
+import logging
+import struct
+import zlib
+
+# Import Third-Party
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import lz4.block as lz4_block
+except ImportError:
+    lz4_block = None
+
+# Import Homebrew
+
+# Init Logging Facilities
+log = logging.getLogger(__name__)
+
+MAGIC = b'\x00'
+ZLIB, ZSTD, LZ4 = 1, 2, 3
+CODECS = {'zlib': ZLIB, 'zstd': ZSTD, 'lz4': LZ4}
+
+# Default minimum size in bytes of a data frame to be compressed.
+DEFAULT_THRESHOLD = 512
+
+_HEADER = struct.Struct('<BB')
+
+_DICTIONARIES = {}
+_ZSTD_DECOMPRESSORS = {}
+
+
+def available_codecs():
+    """Return the names of the codecs usable in this environment."""
+    codecs = ['zlib']
+    if zstandard is not None:
+        codecs.append('zstd')
+    if lz4_block is not None:
+        codecs.append('lz4')
+    return codecs
+
+
+def register_dictionary(name, data):
+    """
+    Register a compression dictionary under the given name.
+
+    The same dictionary must be registered on both sending and receiving side.
+
+    :param name: ascii name of the dictionary, at most 255 characters
+    :param data: dictionary as :class:`bytes`
+    :return: :class:`None`
+    """
+    if len(name.encode('ascii')) > 255:
+        raise ValueError("Dictionary name %r is too long!" % name)
+    _DICTIONARIES[name] = data
+    _ZSTD_DECOMPRESSORS.pop(name, None)
+
+
+def train_dictionary(samples, size=16 * 1024):
+    """
+    Build a dictionary from sample payloads, e.g. serialized messages of one topic family.
+
+    Uses zstd's dictionary trainer if available. Otherwise the most recent samples are
+    concatenated up to `size` bytes, which works well as a zlib preset dictionary for
+    repetitive JSON payloads.
+
+    :param samples: list of :class:`bytes`
+    :param size: maximum size of the dictionary in bytes
+    :return: dictionary as :class:`bytes`
+    """
+    if zstandard is not None:
+        try:
+            return zstandard.train_dictionary(size, samples).as_bytes()
+        except zstandard.ZstdError as e:
+            log.warning("Could not train zstd dictionary (%s), falling back to "
+                        "sample concatenation", e)
+    data = b''
+    for sample in reversed(samples):
+        if len(data) + len(sample) > size:
+            break
+        data = sample + data
+    return data
+
+
+class Compressor:
+    """
+    Compress data frames above a size threshold with the configured codec.
+
+    Dictionaries can be assigned per topic family by mapping topic prefixes to registered
+    dictionary names; the longest matching prefix wins.
+    """
+
+    def __init__(self, codec=None, threshold=None, level=None, dictionaries=None):
+        """
+        Initialize a :class:`hermes.compression.Compressor` instance.
+
+        :param codec: one of 'zstd', 'lz4' or 'zlib'; defaults to the fastest available codec.
+                      Falls back to zlib if the requested codec is not installed.
+        :param threshold: minimum size in bytes of a data frame to compress
+        :param level: compression level passed to the codec
+        :param dictionaries: dict mapping topic prefixes to registered dictionary names
+        """
+        if codec is None:
+            codec = 'zstd' if zstandard is not None else 'lz4' if lz4_block else 'zlib'
+        if codec not in available_codecs():
+            log.warning("Codec %r unavailable, falling back to zlib.", codec)
+            codec = 'zlib'
+        self.codec = codec
+        self.codec_id = CODECS[codec]
+        self.threshold = DEFAULT_THRESHOLD if threshold is None else threshold
+        self.level = level
+        self.dictionaries = dictionaries or {}
+        self._topic_dicts = {}
+        self._zstd = {}
+
+    def _dictionary_for(self, topic):
+        """Return the name of the dictionary to use for `topic`, or an empty string."""
+        try:
+            return self._topic_dicts[topic]
+        except KeyError:
+            pass
+        name = ''
+        matches = [p for p in self.dictionaries if topic.startswith(p)]
+        if matches:
+            name = self.dictionaries[max(matches, key=len)]
+        self._topic_dicts[topic] = name
+        return name
+
+    def compress(self, data, topic=''):
+        """
+        Compress the given data frame, if it exceeds the threshold.
+
+        :param data: serialized data frame as :class:`bytes`
+        :param topic: topic of the envelope, used to select a dictionary
+        :return: :class:`bytes`, flagged and compressed or unchanged
+        """
+        if len(data) < self.threshold:
+            return data
+        dict_name = self._dictionary_for(topic) if self.dictionaries else ''
+        zdict = _DICTIONARIES[dict_name] if dict_name else None
+
+        if self.codec_id == ZSTD:
+            try:
+                compressor = self._zstd[dict_name]
+            except KeyError:
+                kwargs = {'level': self.level or 3}
+                if zdict:
+                    kwargs['dict_data'] = zstandard.ZstdCompressionDict(zdict)
+                compressor = self._zstd[dict_name] = zstandard.ZstdCompressor(**kwargs)
+            payload = compressor.compress(data)
+        elif self.codec_id == LZ4:
+            kwargs = {'dict': zdict} if zdict else {}
+            payload = lz4_block.compress(data, **kwargs)
+        else:
+            level = -1 if self.level is None else self.level
+            compressor = (zlib.compressobj(level, zdict=zdict) if zdict
+                          else zlib.compressobj(level))
+            payload = compressor.compress(data) + compressor.flush()
+
+        dict_name = dict_name.encode('ascii')
+        return MAGIC + _HEADER.pack(self.codec_id, len(dict_name)) + dict_name + payload
+
+
+def is_compressed(frame):
+    """Check if the given data frame was compressed by a :class:`Compressor`."""
+    return frame[:1] == MAGIC
+
+
+def decompress(frame):
+    """
+    Decompress a flagged data frame.
+
+    :param frame: data frame as produced by :meth:`hermes.compression.Compressor.compress`
+    :return: decompressed data frame as :class:`bytes`
+    :raises KeyError: if the frame references an unregistered dictionary
+    """
+    codec_id, name_len = _HEADER.unpack_from(frame, 1)
+    pos = 1 + _HEADER.size
+    dict_name = bytes(frame[pos:pos + name_len]).decode('ascii')
+    payload = frame[pos + name_len:]
+    zdict = _DICTIONARIES[dict_name] if dict_name else None
+
+    if codec_id == ZSTD:
+        try:
+            decompressor = _ZSTD_DECOMPRESSORS[dict_name]
+        except KeyError:
+            kwargs = {'dict_data': zstandard.ZstdCompressionDict(zdict)} if zdict else {}
+            decompressor = zstandard.ZstdDecompressor(**kwargs)
+            _ZSTD_DECOMPRESSORS[dict_name] = decompressor
+        return decompressor.decompress(payload)
+    if codec_id == LZ4:
+        kwargs = {'dict': zdict} if zdict else {}
+        return lz4_block.decompress(payload, **kwargs)
+    if codec_id == ZLIB:
+        decompressor = zlib.decompressobj(zdict=zdict) if zdict else zlib.decompressobj()
+        return decompressor.decompress(payload) + decompressor.flush()
+    raise ValueError("Unknown compression codec %r!" % codec_id)
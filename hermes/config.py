@@ -1,5 +1,8 @@
 """Defines basic configuration parameters for receivers and publishers."""
 # pylint: disable=pointless-string-statement
+import socket
+
+import zmq
 
 # Data Cluster Address for subscribers
 XSUB_ADDR = "tcp://127.0.0.1:6000"
@@ -9,3 +12,135 @@ XPUB_ADDR = "tcp://127.0.0.1:6001"
 
 # EXEC Cluster DEBUG address for tests and monitoring.
 DEBUG_ADDR = "tcp://127.0.0.1:6002"
+
+# Data Cluster Address for clock offset estimation (see hermes.clock).
+CLOCK_ADDR = "tcp://127.0.0.1:6003"
+
+# Id of this host, carried by each Envelope created on it.
+HOST_ID = socket.gethostname()
+
+# Number of I/O threads of the zmq.Context shared by all components of a process.
+IO_THREADS = 1
+
+# In-process addresses, for Nodes and a PostOffice running in the same process.
+# These require all components to share the same zmq.Context (see hermes.context).
+INPROC_XSUB_ADDR = "inproc://hermes-xsub"
+INPROC_XPUB_ADDR = "inproc://hermes-xpub"
+
+# Prefix of topics reserved for hermes itself. Receivers and Recorders drop envelopes on these
+# topics, apart from those they subscribed to explicitly.
+RESERVED_PREFIX = "_hermes/"
+
+# Reserved topic PostOffices publish heartbeats on (see hermes.PostOffice).
+HEARTBEAT_TOPIC = "_hermes/heartbeat"
+
+# Reserved topics of the readiness handshake between PostOffices, publishers and receivers
+# (see hermes.PostOffice).
+WELCOME_TOPIC = "_hermes/welcome"
+READY_TOPIC = "_hermes/ready"
+PROBE_TOPIC = "_hermes/probe"
+
+
+class SocketOptions:
+    """
+    ZMQ socket options applied to the sockets of hermes components.
+
+    Options left at :class:`None` are not set, keeping ZMQ's default. Instances are combined
+    with :meth:`hermes.config.SocketOptions.merge`: each component applies the process-wide
+    :const:`hermes.config.SOCKET_OPTIONS`, overridden by the options passed to it.
+
+    Note that :const:`zmq.CONFLATE` does not support multipart messages, and therefore cannot
+    be used on sockets carrying :class:`hermes.Envelope` instances.
+    """
+
+    # pylint: disable=too-few-public-methods,too-many-arguments,too-many-instance-attributes
+
+    # Maps attribute names to the zmq socket options they set.
+    OPTIONS = {
+        'sndhwm': zmq.SNDHWM, 'rcvhwm': zmq.RCVHWM, 'sndbuf': zmq.SNDBUF, 'rcvbuf': zmq.RCVBUF,
+        'linger': zmq.LINGER, 'immediate': zmq.IMMEDIATE, 'conflate': zmq.CONFLATE,
+        'tcp_keepalive': zmq.TCP_KEEPALIVE, 'tcp_keepalive_idle': zmq.TCP_KEEPALIVE_IDLE,
+        'tcp_keepalive_intvl': zmq.TCP_KEEPALIVE_INTVL, 'affinity': zmq.AFFINITY,
+    }
+
+    def __init__(self, sndhwm=None, rcvhwm=None, sndbuf=None, rcvbuf=None, linger=None,
+                 immediate=None, conflate=None, tcp_keepalive=None, tcp_keepalive_idle=None,
+                 tcp_keepalive_intvl=None, affinity=None):
+        """
+        Initialize a :class:`hermes.config.SocketOptions` instance.
+
+        :param sndhwm: high water mark of outbound messages
+        :param rcvhwm: high water mark of inbound messages
+        :param sndbuf: kernel send buffer size in bytes
+        :param rcvbuf: kernel receive buffer size in bytes
+        :param linger: time in milliseconds to keep unsent messages after closing a socket
+        :param immediate: only queue messages to completed connections
+        :param conflate: only keep the last message; single-part messages only
+        :param tcp_keepalive: 1 to enable, 0 to disable TCP keepalives
+        :param tcp_keepalive_idle: idle time in seconds before sending keepalives
+        :param tcp_keepalive_intvl: interval in seconds between keepalives
+        :param affinity: bitmask of I/O threads to handle the socket's connections
+        :raises TypeError: if an option is neither :class:`int`, :class:`bool` nor None
+        """
+        self.sndhwm = sndhwm
+        self.rcvhwm = rcvhwm
+        self.sndbuf = sndbuf
+        self.rcvbuf = rcvbuf
+        self.linger = linger
+        self.immediate = immediate
+        self.conflate = conflate
+        self.tcp_keepalive = tcp_keepalive
+        self.tcp_keepalive_idle = tcp_keepalive_idle
+        self.tcp_keepalive_intvl = tcp_keepalive_intvl
+        self.affinity = affinity
+        for attr, value in self.items():
+            if not isinstance(value, int):
+                raise TypeError("Socket option %s must be an int, got %r" % (attr, value))
+
+    def items(self):
+        """Return (attribute, value) pairs of all options which are set."""
+        return [(attr, getattr(self, attr)) for attr in sorted(self.OPTIONS)
+                if getattr(self, attr) is not None]
+
+    def merge(self, overrides):
+        """
+        Return new options, with the options set in `overrides` taking precedence.
+
+        :param overrides: :class:`hermes.config.SocketOptions` instance or :class:`None`
+        :return: :class:`hermes.config.SocketOptions` instance
+        """
+        options = dict(self.items())
+        if overrides is not None:
+            options.update(overrides.items())
+        return SocketOptions(**options)
+
+    def apply(self, sock):
+        """
+        Set all options which are set on the given socket.
+
+        :param sock: :class:`zmq.Socket` instance
+        :return: the socket
+        """
+        for attr, value in self.items():
+            sock.setsockopt(self.OPTIONS[attr], int(value))
+        return sock
+
+    def __repr__(self):
+        """Construct a basic string-represenation of this class instance."""
+        return 'SocketOptions(%s)' % ', '.join('%s=%r' % item for item in self.items())
+
+
+# Profile minimizing latency: small queues, no queuing to pending connections, and
+# dropping unsent messages on close.
+LOW_LATENCY = SocketOptions(sndhwm=1000, rcvhwm=1000, immediate=True, linger=0,
+                            tcp_keepalive=1)
+
+# Profile maximizing throughput: deep queues and large kernel buffers.
+HIGH_THROUGHPUT = SocketOptions(sndhwm=1000000, rcvhwm=1000000, sndbuf=4 * 1024 * 1024,
+                                rcvbuf=4 * 1024 * 1024, linger=1000)
+
+# Socket options applied to all sockets created by hermes components.
+SOCKET_OPTIONS = SocketOptions()
+
+# CPU cores to pin the I/O threads of the shared zmq.Context to, or None.
+IO_THREAD_CPUS = None
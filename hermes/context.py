@@ -0,0 +1,60 @@
+"""Shared :class:`zmq.Context` for all hermes components of a process.
+
+Every :class:`hermes.Publisher`, :class:`hermes.Receiver` and :class:`hermes.PostOffice`
+uses the context returned by :func:`hermes.context.get_context` unless one is passed
+explicitly. Sharing a single context keeps the number of ZMQ I/O threads fixed, no matter
+how many components run in a process, and is required for ``inproc://`` transport.
+
+Components create their sockets using :func:`hermes.context.create_socket`, which applies
+:const:`hermes.config.SOCKET_OPTIONS` and any per-component overrides.
+"""
+
+# Import Built-Ins
+import logging
+
+# Import Third-Party
+import zmq
+
+# Import Homebrew
+from hermes import config
+
+# Init Logging Facilities
+log = logging.getLogger(__name__)
+
+
+# Ids of contexts whose I/O thread affinity was configured.
+_CONFIGURED = set()
+
+
+def get_context(io_threads=None):
+    """
+    Return the process-wide shared :class:`zmq.Context`.
+
+    The context is created on first call; `io_threads` only has an effect then. Its I/O
+    threads are pinned to :const:`hermes.config.IO_THREAD_CPUS`, if set.
+
+    :param io_threads: number of ZMQ I/O threads, defaults to :const:`hermes.config.IO_THREADS`
+    :return: :class:`zmq.Context` instance
+    """
+    ctx = zmq.Context.instance(io_threads or config.IO_THREADS)
+    if io_threads and ctx.get(zmq.IO_THREADS) != io_threads:
+        log.warning("Shared zmq.Context already exists with %s I/O threads, ignoring "
+                    "io_threads=%s", ctx.get(zmq.IO_THREADS), io_threads)
+    if id(ctx) not in _CONFIGURED:
+        _CONFIGURED.add(id(ctx))
+        for cpu in config.IO_THREAD_CPUS or ():
+            ctx.set(zmq.THREAD_AFFINITY_CPU_ADD, cpu)
+    return ctx
+
+
+def create_socket(ctx, socket_type, sockopts=None):
+    """
+    Create a socket with the process-wide socket options applied.
+
+    :param ctx: :class:`zmq.Context` to create the socket with
+    :param socket_type: ZMQ socket type, e.g. :const:`zmq.PUB`
+    :param sockopts: :class:`hermes.config.SocketOptions` overriding
+                     :const:`hermes.config.SOCKET_OPTIONS`
+    :return: :class:`zmq.Socket` instance
+    """
+    return config.SOCKET_OPTIONS.merge(sockopts).apply(ctx.socket(socket_type))
@@ -0,0 +1,236 @@
+"""Deduplication of envelopes received from redundant feeds, with bounded memory.
+
+Subscribing to the same instruments from several feeds - e.g. a primary and a backup
+connector - delivers every update more than once. A :class:`hermes.dedup.Deduplicator`
+derives an identity from each envelope using a key function, and drops envelopes whose
+identity it has seen before. Identities are remembered in one of two stores, both O(1) per
+envelope with a fixed memory ceiling:
+
+* :class:`hermes.dedup.LRUSet` remembers the most recently seen identities exactly, up to a
+  maximum number and, optionally, age.
+* :class:`hermes.dedup.RotatingBloomFilter` remembers identities approximately, in far less
+  memory: it may mistake a small fraction of new envelopes for duplicates, but never lets a
+  duplicate through while it remembers its identity.
+
+As feeds differ in their origin, key functions should not include it. To identify trades
+by the exchange's trade id, found at index 1 of their data::
+
+    dedup = Deduplicator(key=field_key(1), store=RotatingBloomFilter(1000000))
+    receiver = Receiver('tcp://127.0.0.1:5561', 'recv', dedup=dedup)
+"""
+
+# Import Built-Ins
+import hashlib
+import json
+import logging
+import math
+import time
+from collections import OrderedDict
+
+# Import Third-Party
+
+# Import Homebrew
+
+# Init Logging Facilities
+log = logging.getLogger(__name__)
+
+
+def content_key(envelope):
+    """
+    Identify envelopes by topic and a hash of their data.
+
+    Of :class:`hermes.Message` data, all attributes but its timestamp are hashed, as each feed
+    stamps the messages it creates with its own local time.
+
+    :param envelope: :class:`hermes.Envelope` instance
+    :return: :class:`bytes`
+    """
+    data = envelope.data
+    try:
+        # pylint: disable=protected-access
+        data = [getattr(data, attr) for attr in data._slots() if attr != 'ts']
+    except AttributeError:
+        pass
+    data = json.dumps(data, sort_keys=True).encode('utf-8')
+    return envelope.topic.encode('utf-8') + b'\x00' + hashlib.sha1(data).digest()[:16]
+
+
+def field_key(field):
+    """
+    Return a key function identifying envelopes by topic and a single field of their data.
+
+    :param field: index into list data, or key into dict data, e.g. an exchange's trade id
+    :return: callable taking an envelope and returning a :class:`tuple`
+    """
+    def key(envelope):
+        return envelope.topic, envelope.data[field]
+    return key
+
+
+def _to_bytes(key):
+    """Return the given key as :class:`bytes`."""
+    if isinstance(key, bytes):
+        return key
+    if isinstance(key, str):
+        return key.encode('utf-8')
+    return repr(key).encode('utf-8')
+
+
+class LRUSet:
+    """Remember the most recently seen keys, up to a maximum number and age."""
+
+    def __init__(self, capacity, ttl=None, clock=time.time):
+        """
+        Initialize a :class:`hermes.dedup.LRUSet` instance.
+
+        :param capacity: maximum number of keys to remember
+        :param ttl: time in seconds after which keys are forgotten; never by default
+        :param clock: callable returning the current time in seconds
+        """
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1, not %r" % capacity)
+        self.capacity = capacity
+        self.ttl = ttl
+        self.clock = clock
+        self._keys = OrderedDict()
+
+    def seen(self, key):
+        """
+        Record the given key.
+
+        :param key: hashable key
+        :return: True if the key was remembered already, False otherwise
+        """
+        now = self.clock() if self.ttl is not None else None
+        if now is not None:
+            horizon = now - self.ttl
+            while self._keys and next(iter(self._keys.values())) < horizon:
+                self._keys.popitem(last=False)
+        if key in self._keys:
+            self._keys.move_to_end(key)
+            self._keys[key] = now
+            return True
+        self._keys[key] = now
+        if len(self._keys) > self.capacity:
+            self._keys.popitem(last=False)
+        return False
+
+    def clear(self):
+        """Forget all keys."""
+        self._keys.clear()
+
+    def __len__(self):
+        """Return the number of remembered keys."""
+        return len(self._keys)
+
+
+class RotatingBloomFilter:
+    """
+    Remember keys approximately, in two generations of Bloom filters.
+
+    Keys are added to the current generation; once it holds `capacity` keys, it becomes the
+    previous generation, replacing the one before. Keys are therefore remembered for at least
+    `capacity` and at most twice `capacity` insertions, and the false positive rate stays
+    below twice `error_rate`.
+    """
+
+    def __init__(self, capacity, error_rate=0.001):
+        """
+        Initialize a :class:`hermes.dedup.RotatingBloomFilter` instance.
+
+        :param capacity: number of keys per generation
+        :param error_rate: false positive rate of each generation, when full
+        """
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1, not %r" % capacity)
+        if not 0 < error_rate < 1:
+            raise ValueError("error_rate must be between 0 and 1, not %r" % error_rate)
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.bits = int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, int(round(self.bits / capacity * math.log(2))))
+        self._current = bytearray((self.bits + 7) // 8)
+        self._previous = bytearray(len(self._current))
+        self._count = 0
+
+    def _positions(self, key):
+        """Return the bit positions of the given key, using double hashing."""
+        digest = hashlib.sha1(_to_bytes(key)).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:16], 'little')
+        return [(first + i * second) % self.bits for i in range(self.hashes)]
+
+    @staticmethod
+    def _contains(bits, positions):
+        return all(bits[p >> 3] & (1 << (p & 7)) for p in positions)
+
+    def seen(self, key):
+        """
+        Record the given key.
+
+        :param key: :class:`bytes`, :class:`str`, or a key with a stable :func:`repr`
+        :return: True if the key was (probably) remembered already, False otherwise
+        """
+        positions = self._positions(key)
+        if self._contains(self._current, positions):
+            return True
+        found = self._contains(self._previous, positions)
+        if self._count >= self.capacity:
+            self._previous, self._current = self._current, bytearray(len(self._current))
+            self._count = 0
+        for p in positions:
+            self._current[p >> 3] |= 1 << (p & 7)
+        self._count += 1
+        return found
+
+    def clear(self):
+        """Forget all keys."""
+        self._current = bytearray(len(self._current))
+        self._previous = bytearray(len(self._current))
+        self._count = 0
+
+    def __len__(self):
+        """Return the number of keys in the current generation."""
+        return self._count
+
+
+class Deduplicator:
+    """Drop envelopes whose identity was seen before, keeping hit and miss statistics."""
+
+    def __init__(self, key=content_key, store=None):
+        """
+        Initialize a :class:`hermes.dedup.Deduplicator` instance.
+
+        :param key: callable returning the identity of an envelope
+        :param store: :class:`hermes.dedup.LRUSet` or :class:`hermes.dedup.RotatingBloomFilter`
+                      remembering identities; an :class:`hermes.dedup.LRUSet` of 100000 keys
+                      by default
+        """
+        self.key = key
+        self.store = store if store is not None else LRUSet(100000)
+        self.hits = 0
+        self.misses = 0
+
+    def is_duplicate(self, envelope):
+        """
+        Check if an envelope with the same identity was seen before, and remember it.
+
+        :param envelope: :class:`hermes.Envelope` instance
+        :return: :class:`bool`
+        """
+        if self.store.seen(self.key(envelope)):
+            self.hits += 1
+            return True
+        self.misses += 1
+        return False
+
+    def stats(self):
+        """
+        Return deduplication statistics.
+
+        :return: :class:`dict` with the number of duplicates (hits), unique envelopes
+                 (misses), the ratio of duplicates, and the number of remembered identities
+        """
+        total = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses,
+                'ratio': self.hits / total if total else 0.0, 'size': len(self.store)}
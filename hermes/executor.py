@@ -0,0 +1,343 @@
+"""Offload expensive handlers of a Node to a pool of threads or processes.
+
+A :class:`hermes.Node` handling every envelope in its own run loop can use at most one core,
+and a slow handler backs up its receiver's queue. The
+:class:`hermes.executor.ShardedExecutor` runs a handler on a number of shards instead, each a
+single worker thread or process. Envelopes are assigned to shards by a stable hash of their
+topic, so envelopes of the same topic are always handled by the same worker, in the order they
+were submitted. Results are returned in submission order as well, and the number of envelopes
+in flight is bounded, blocking the submitting Node once the limit is reached.
+
+:class:`hermes.executor.ExecutorNode` submits all received envelopes to a
+:class:`hermes.executor.ShardedExecutor` and publishes the handler's results.
+
+:class:`hermes.executor.PartitionedNode` instead has its :class:`hermes.Receiver` partition
+envelopes by topic onto one queue per worker, which the workers consume directly. This saves
+the Node's run loop from handling every envelope, and in raw mode leaves decoding to the
+worker processes as well.
+"""
+
+# Import Built-Ins
+import logging
+import multiprocessing
+import zlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from queue import Queue, Empty
+from threading import BoundedSemaphore, Thread
+
+# Import Third-Party
+
+# Import Homebrew
+from hermes.node import Node
+from hermes.structs import Envelope
+
+# Init Logging Facilities
+log = logging.getLogger(__name__)
+
+
+def shard(key, shards):
+    """
+    Return the shard of the given key.
+
+    Unlike :func:`hash`, the result is stable across processes and interpreter runs.
+
+    :param key: :class:`str` or :class:`bytes`, usually a topic
+    :param shards: number of shards
+    :return: :class:`int` in ``range(shards)``
+    """
+    if isinstance(key, str):
+        key = key.encode('utf-8')
+    return zlib.crc32(key) % shards
+
+
+class ShardedExecutor:
+    """Run a function on shards of single-worker pools, preserving order per key."""
+
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(self, func, shards=4, processes=False, max_in_flight=1000,
+                 name='ShardedExecutor'):
+        """
+        Initialize a :class:`hermes.executor.ShardedExecutor` instance.
+
+        :param func: callable to execute; must be picklable, i.e. defined at module level, if
+                     `processes` is True
+        :param shards: number of workers
+        :param processes: use worker processes instead of threads, to execute `func` in
+                          parallel regardless of the GIL
+        :param max_in_flight: maximum number of submitted calls which did not complete yet
+        :param name: Name to give this :class:`hermes.executor.ShardedExecutor` instance
+        """
+        self.func = func
+        self.shards = shards
+        self.processes = processes
+        self.max_in_flight = max_in_flight
+        self.name = name
+        self.submitted = 0
+        self.failed = 0
+        self._slots = BoundedSemaphore(max_in_flight)
+        self._pools = []
+        self._pending = deque()
+
+    @property
+    def in_flight(self):
+        """Return the number of submitted calls whose results were not yet collected."""
+        return len(self._pending)
+
+    def start(self):
+        """Start the worker pools."""
+        if self.processes:
+            # Forking a process running ZMQ I/O threads may deadlock the child.
+            mp_context = multiprocessing.get_context('spawn')
+            self._pools = [ProcessPoolExecutor(max_workers=1, mp_context=mp_context)
+                           for _ in range(self.shards)]
+        else:
+            self._pools = [ThreadPoolExecutor(max_workers=1) for _ in range(self.shards)]
+
+    def stop(self, wait=True):
+        """
+        Shut down all worker pools.
+
+        :param wait: wait for all submitted calls to complete
+        :return: :class:`None`
+        """
+        for pool in self._pools:
+            pool.shutdown(wait=wait)
+        self._pools = []
+
+    def submit(self, key, *args, timeout=None):
+        """
+        Call the function with `args` on the shard of `key`.
+
+        Blocks while `max_in_flight` calls are still being executed.
+
+        :param key: key determining the shard, usually a topic
+        :param args: positional arguments to call the function with
+        :param timeout: maximum time in seconds to wait for a free slot
+        :raises RuntimeError: if the executor was not started
+        :return: True if the call was submitted, False on timeout
+        """
+        if not self._pools:
+            raise RuntimeError("%s was not started" % self.name)
+        if not self._slots.acquire(timeout=timeout):
+            return False
+        future = self._pools[shard(key, self.shards)].submit(self.func, *args)
+        future.add_done_callback(lambda _: self._slots.release())
+        self._pending.append(future)
+        self.submitted += 1
+        return True
+
+    def results(self, timeout=0):
+        """
+        Yield the results of completed calls, in submission order.
+
+        Stops at the first call that did not complete within `timeout` seconds. Calls that
+        raised an exception are logged and skipped.
+
+        :param timeout: time in seconds to wait for the oldest pending call
+        :return: generator of results
+        """
+        pending = self._pending
+        while pending:
+            try:
+                result = pending[0].result(timeout)
+            except FutureTimeout:
+                return
+            except Exception as e:  # pylint: disable=broad-except
+                log.exception(e)
+                self.failed += 1
+                pending.popleft()
+                continue
+            pending.popleft()
+            yield result
+
+
+class ExecutorNode(Node):
+    """
+    :class:`hermes.Node` executing a handler for each received envelope on an executor.
+
+    The handler is called with the envelope and may return an :class:`hermes.Envelope` to
+    publish, data to publish on the node's channel, or :class:`None`.
+    """
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, name, handler, receiver=None, publisher=None, channel='RAW', shards=4,
+                 processes=False, max_in_flight=1000, facilities=None, drain_timeout=1.0):
+        """
+        Initialize a :class:`hermes.executor.ExecutorNode` instance.
+
+        :param name: name of the :class:`hermes.Node` instance.
+        :param handler: callable taking an envelope; see
+                        :class:`hermes.executor.ShardedExecutor` for its constraints
+        :param receiver: :class:`hermes.Receiver` instance.
+        :param publisher: :class:`hermes.Publisher` instance.
+        :param channel: channel to publish the handler's results on
+        :param shards: number of workers
+        :param processes: use worker processes instead of threads
+        :param max_in_flight: maximum number of envelopes being handled at once
+        :param facilities: list of additional facilities
+        :param drain_timeout: time in seconds to wait for each result still in flight on stop
+        """
+        self.executor = ShardedExecutor(handler, shards, processes, max_in_flight,
+                                        name='%s-executor' % name)
+        facilities = list(facilities or []) + [self.executor]
+        super(ExecutorNode, self).__init__(name, receiver, publisher, facilities)
+        self.channel = channel
+        self.drain_timeout = drain_timeout
+
+    def publish_results(self, timeout=0):
+        """
+        Publish the results of all completed handler calls, in the order they were submitted.
+
+        :param timeout: time in seconds to wait for the oldest pending call
+        :return: :class:`None`
+        """
+        for result in self.executor.results(timeout):
+            if result is None:
+                continue
+            if isinstance(result, Envelope):
+                self.publisher.publish(result)
+            else:
+                self.publish(self.channel, result)
+
+    def run(self):
+        """
+        Execute the main loop.
+
+        While :attr:`hermes.Node._running` is True, submit all received envelopes to the
+        executor and publish results as they complete. Once stopped, the results still in
+        flight are published as well, waiting up to :attr:`drain_timeout` for each.
+        """
+        while self._running:
+            envelope = self.recv()
+            if envelope is not None:
+                self.executor.submit(envelope.topic, envelope)
+            self.publish_results(timeout=0 if envelope is not None else .001)
+
+        while self.executor.in_flight:
+            in_flight = self.executor.in_flight
+            self.publish_results(timeout=self.drain_timeout)
+            if self.executor.in_flight == in_flight:
+                log.warning("%s: dropping %s results not completed within %ss",
+                            self.name, in_flight, self.drain_timeout)
+                break
+
+
+def _consume_partition(handler, partition, results, raw):
+    """
+    Call the handler for each item of a partition queue, until receiving :class:`None`.
+
+    :param handler: callable taking an envelope
+    :param partition: queue of envelopes, or of their frames if `raw`
+    :param results: queue to put the handler's results on
+    :param raw: decode frames before calling the handler
+    :return: :class:`None`
+    """
+    while True:
+        item = partition.get()
+        if item is None:
+            break
+        try:
+            result = handler(Envelope.load_from_frames(item) if raw else item)
+        except Exception as e:  # pylint: disable=broad-except
+            log.exception(e)
+            continue
+        if result is not None:
+            results.put(result)
+
+
+class PartitionedNode(Node):
+    """
+    :class:`hermes.Node` handling envelopes on one worker per receiver partition.
+
+    Each worker consumes a partition of the receiver's envelopes, partitioned by topic, so
+    envelopes of the same topic are handled by the same worker in the order received. The
+    handler may return an :class:`hermes.Envelope` to publish, data to publish on the node's
+    channel, or :class:`None`; results are published by :meth:`hermes.Node.run`. With worker
+    processes, the handler must be picklable, e.g. a module-level function.
+    """
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, name, handler, receiver, publisher=None, channel='RAW', workers=4,
+                 processes=False, raw=False, facilities=None):
+        """
+        Initialize a :class:`hermes.executor.PartitionedNode` instance.
+
+        :param name: name of the :class:`hermes.Node` instance.
+        :param handler: callable taking an envelope
+        :param receiver: :class:`hermes.Receiver` instance, which is partitioned by this node
+        :param publisher: :class:`hermes.Publisher` instance.
+        :param channel: channel to publish the handler's results on
+        :param workers: number of partitions and workers
+        :param processes: use worker processes instead of threads
+        :param raw: have workers decode envelopes instead of the receiver
+        :param facilities: list of additional facilities
+        """
+        super(PartitionedNode, self).__init__(name, receiver, publisher, facilities)
+        self.handler = handler
+        self.channel = channel
+        self.processes = processes
+        self._mp = multiprocessing.get_context('spawn') if processes else None
+        factory = self._mp.Queue if processes else Queue
+        receiver.partition(workers, queue_factory=factory, raw=raw)
+        self.results = factory()
+        self._workers = []
+
+    def depths(self):
+        """Return the number of envelopes queued per partition."""
+        return self.receiver.depths()
+
+    def start(self):
+        """Start the workers, then the :class:`hermes.Node` instance and its facilities."""
+        worker = self._mp.Process if self.processes else Thread
+        for i, partition in enumerate(self.receiver.queues):
+            self._workers.append(worker(
+                target=_consume_partition, name='%s-partition-%s' % (self.name, i),
+                args=(self.handler, partition, self.results, self.receiver.raw), daemon=True))
+            self._workers[-1].start()
+        super(PartitionedNode, self).start()
+
+    def stop(self):
+        """Stop receiving, let the workers finish their partitions, and stop the facilities."""
+        self._running = False
+        self.receiver.stop()
+        for partition in self.receiver.queues:
+            partition.put(None)
+        for worker in self._workers:
+            worker.join()
+        self._workers = []
+        if self.publisher is not None:
+            self.publish_results()
+        super(PartitionedNode, self).stop()
+
+    def publish_results(self, timeout=0):
+        """
+        Publish all results available.
+
+        :param timeout: time in seconds to wait for the first result
+        :return: :class:`None`
+        """
+        try:
+            result = self.results.get(timeout=timeout) if timeout else self.results.get(False)
+        except Empty:
+            return
+        while True:
+            if isinstance(result, Envelope):
+                self.publisher.publish(result)
+            else:
+                self.publish(self.channel, result)
+            try:
+                result = self.results.get(False)
+            except Empty:
+                return
+
+    def run(self):
+        """
+        Execute the main loop.
+
+        While :attr:`hermes.Node._running` is True, publish the workers' results.
+        """
+        while self._running:
+            self.publish_results(timeout=.01)
@@ -0,0 +1,637 @@
+"""Append-only, memory-mapped journal for recording and replaying Envelope frames.
+
+The :class:`hermes.journal.Journal` stores the raw frames of :class:`hermes.Envelope` objects,
+as received from ZMQ, in a directory of fixed-size segment files. Each segment is
+pre-allocated and memory-mapped, so appending a record is a plain memory copy. A segment
+starts with the number of records written to it (uint64, little endian), updated after each
+record, followed by the records.
+
+Every record is laid out as follows (little endian)::
+
+    uint32  record length (including this header)
+    float64 timestamp of the envelope
+    uint16  length of the topic
+    uint16  number of frames
+    bytes   topic (utf-8)
+    uint32  length of each frame (one per frame)
+    bytes   the frames, concatenated
+
+Storing the timestamp and topic in the record header allows readers to filter records without
+decoding the frames.
+
+While recording, a sparse :class:`hermes.journal.SegmentIndex` is kept for each segment and
+written next to it as an ``.idx`` file once the segment is closed. It holds the segment's
+minimum and maximum timestamp, and per topic the timestamps and offsets of its records.
+:meth:`hermes.journal.Journal.query` uses it to skip segments outside the requested time range
+and to binary-search the records of the requested topics.
+
+:class:`hermes.journal.Recorder` is a facility which can be added to a
+:class:`hermes.Node` instance's :attr:`hermes.Node._facilities`. It subscribes to a
+:class:`hermes.PostOffice` and appends everything it receives to a journal.
+:class:`hermes.journal.Replayer` publishes the recorded frames again, either at their
+original pace, accelerated or as fast as possible.
+"""
+
+# Import Built-Ins
+import logging
+import heapq
+import json
+import mmap
+import os
+import struct
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from threading import Thread, Event
+
+# Import Third-Party
+import zmq
+
+# Import Homebrew
+from hermes.batching import split_batch
+from hermes.context import create_socket, get_context
+from hermes.structs import DECODE_ERRORS, Envelope, is_envelope
+
+# Init Logging Facilities
+log = logging.getLogger(__name__)
+
+# Default size of a single segment file, in bytes.
+DEFAULT_SEGMENT_SIZE = 64 * 1024 * 1024
+
+_HEADER = struct.Struct('<IdHH')
+# Segment header: number of records written to the segment.
+_SEGMENT_HEADER = struct.Struct('<Q')
+_FRAME_LEN = struct.Struct('<I')
+_INDEX_HEADER_LEN = struct.Struct('<I')
+
+
+class SegmentIndex:
+    """
+    Sparse index of a single journal segment.
+
+    Tracks the minimum and maximum timestamp of the segment, and for each topic the
+    timestamps and offsets of its records, sorted by timestamp. Records arrive mostly in
+    timestamp order, so the few late ones are inserted near the end of each topic's arrays.
+
+    On disk, the index consists of a length-prefixed JSON header (padded to 8 bytes), followed
+    by the timestamps (float64) and offsets (uint64) of each topic. The arrays are used in place
+    when loaded, so opening an index does not require parsing them.
+    """
+
+    def __init__(self, min_ts=None, max_ts=None, topics=None):
+        """
+        Initialize a :class:`hermes.journal.SegmentIndex` instance.
+
+        :param min_ts: smallest timestamp in the segment
+        :param max_ts: largest timestamp in the segment
+        :param topics: dict mapping topics to a tuple of timestamp and offset sequences
+        """
+        self.min_ts = min_ts
+        self.max_ts = max_ts
+        self.topics = topics if topics is not None else {}
+
+    def add(self, ts, topic, offset):
+        """
+        Add a record to the index.
+
+        :param ts: timestamp of the record
+        :param topic: topic of the record
+        :param offset: offset of the record in its segment
+        :return: :class:`None`
+        """
+        if self.min_ts is None or ts < self.min_ts:
+            self.min_ts = ts
+        if self.max_ts is None or ts > self.max_ts:
+            self.max_ts = ts
+        try:
+            timestamps, offsets = self.topics[topic]
+        except KeyError:
+            timestamps, offsets = self.topics[topic] = array('d'), array('Q')
+        if timestamps and ts < timestamps[-1]:
+            pos = bisect_right(timestamps, ts)
+            timestamps.insert(pos, ts)
+            offsets.insert(pos, offset)
+        else:
+            timestamps.append(ts)
+            offsets.append(offset)
+
+    def overlaps(self, start=None, end=None):
+        """Check if the segment may contain records between `start` and `end`."""
+        if self.min_ts is None:
+            return False
+        if start is not None and self.max_ts < start:
+            return False
+        if end is not None and self.min_ts > end:
+            return False
+        return True
+
+    def lookup(self, topic, start=None, end=None):
+        """
+        Return the timestamps and offsets of a topic's records between `start` and `end`.
+
+        Timestamps are kept sorted within a topic; the range is found using binary search.
+
+        :param topic: topic to look up
+        :param start: smallest timestamp to include
+        :param end: largest timestamp to include
+        :return: list of tuples (ts, offset)
+        """
+        timestamps, offsets = self.topics[topic]
+        lo = 0 if start is None else bisect_left(timestamps, start)
+        hi = len(timestamps) if end is None else bisect_right(timestamps, end)
+        return list(zip(timestamps[lo:hi], offsets[lo:hi]))
+
+    def save(self, path):
+        """
+        Write the index to `path`.
+
+        :param path: file path to write to
+        :return: :class:`None`
+        """
+        names = sorted(self.topics)
+        header = json.dumps({'min_ts': self.min_ts, 'max_ts': self.max_ts,
+                             'topics': [[n, len(self.topics[n][0])] for n in names]})
+        header = header.encode('utf-8')
+        header += b' ' * (-(_INDEX_HEADER_LEN.size + len(header)) % 8)
+        with open(path, 'wb') as f:
+            f.write(_INDEX_HEADER_LEN.pack(len(header)))
+            f.write(header)
+            for name in names:
+                timestamps, offsets = self.topics[name]
+                f.write(array('d', timestamps).tobytes())
+                f.write(array('Q', offsets).tobytes())
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load an index written by :meth:`hermes.journal.SegmentIndex.save`.
+
+        :param path: file path of the index
+        :return: :class:`hermes.journal.SegmentIndex` instance
+        """
+        with open(path, 'rb') as f:
+            data = f.read()
+        (header_len,) = _INDEX_HEADER_LEN.unpack_from(data)
+        pos = _INDEX_HEADER_LEN.size
+        header = json.loads(data[pos:pos + header_len].decode('utf-8'))
+        pos += header_len
+        view = memoryview(data)
+        topics = {}
+        for name, count in header['topics']:
+            size = count * 8
+            timestamps = view[pos:pos + size].cast('d')
+            offsets = view[pos + size:pos + 2 * size].cast('Q')
+            topics[name] = timestamps, offsets
+            pos += 2 * size
+        return cls(header['min_ts'], header['max_ts'], topics)
+
+    @classmethod
+    def build(cls, path):
+        """
+        Build the index of a segment by scanning all of its records.
+
+        :param path: file path of the segment
+        :return: :class:`hermes.journal.SegmentIndex` instance
+        """
+        index = cls()
+        with open(path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size < _SEGMENT_HEADER.size:
+                return index
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                # Records beyond the count may still be being written.
+                (count,) = _SEGMENT_HEADER.unpack_from(mm, 0)
+                offset = _SEGMENT_HEADER.size
+                while count and offset + _HEADER.size <= len(mm):
+                    count -= 1
+                    record_len, ts, topic_len, _ = _HEADER.unpack_from(mm, offset)
+                    if not record_len:
+                        break
+                    pos = offset + _HEADER.size
+                    index.add(ts, mm[pos:pos + topic_len].decode('utf-8'), offset)
+                    offset += record_len
+        return index
+
+
+class Journal:
+    """Segmented, memory-mapped, append-only store of Envelope frames."""
+
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(self, path, segment_size=None, prefix='journal'):
+        """
+        Initialize a :class:`hermes.journal.Journal` instance.
+
+        Existing segments in `path` are kept; new records are appended to a new segment.
+
+        :param path: directory to store segment files in; created if it does not exist
+        :param segment_size: size of each segment file in bytes
+        :param prefix: file name prefix for segment files
+        """
+        self.path = path
+        self.prefix = prefix
+        self.segment_size = segment_size or DEFAULT_SEGMENT_SIZE
+        os.makedirs(path, exist_ok=True)
+        self._file = None
+        self._mm = None
+        self._offset = 0
+        self._records = 0
+        self._index = None
+        self._indexes = {}
+        self._segment_no = len(self.segments())
+
+    def _segment_path(self, segment_no):
+        """Return the file path of the segment with the given number."""
+        return os.path.join(self.path, '%s-%08d.seg' % (self.prefix, segment_no))
+
+    def segments(self):
+        """Return the paths of all segment files of this journal, in order."""
+        names = sorted(n for n in os.listdir(self.path)
+                       if n.startswith(self.prefix + '-') and n.endswith('.seg'))
+        return [os.path.join(self.path, n) for n in names]
+
+    def _open_segment(self, min_size):
+        """Close the current segment and open a new one of at least `min_size` bytes."""
+        self._close_segment()
+        size = max(self.segment_size, _SEGMENT_HEADER.size + min_size)
+        path = self._segment_path(self._segment_no)
+        log.debug("Opening new journal segment %s (%s bytes)..", path, size)
+        self._indexes.pop(path, None)
+        self._file = open(path, 'w+b')
+        self._file.truncate(size)
+        self._mm = mmap.mmap(self._file.fileno(), size)
+        self._offset = _SEGMENT_HEADER.size
+        self._records = 0
+        self._index = SegmentIndex()
+
+    def _close_segment(self):
+        """Flush the current segment and truncate it to its used length."""
+        if self._mm is None:
+            return
+        self._mm.flush()
+        self._mm.close()
+        self._file.truncate(self._offset)
+        self._file.close()
+        path = self._segment_path(self._segment_no)
+        self._index.save(path[:-len('.seg')] + '.idx')
+        self._indexes[path] = self._records, self._index
+        self._mm = None
+        self._file = None
+        self._index = None
+        self._segment_no += 1
+
+    def append(self, frames, ts, topic):
+        """
+        Append the given frames as a single record.
+
+        :param frames: iterable of :class:`bytes`, as returned by
+                       :meth:`hermes.Envelope.convert_to_frames`
+        :param ts: timestamp of the envelope
+        :param topic: topic of the envelope, as :class:`str`
+        :return: tuple of segment number and offset the record was written at
+        """
+        topic_bytes = topic.encode('utf-8')
+        lengths = [len(f) for f in frames]
+        frame_header = struct.pack('<%dI' % len(lengths), *lengths)
+        header_len = _HEADER.size + len(topic_bytes) + len(frame_header)
+        record_len = header_len + sum(lengths)
+
+        if self._mm is None or self._offset + record_len > len(self._mm):
+            self._open_segment(record_len)
+
+        mm, start = self._mm, self._offset
+        _HEADER.pack_into(mm, start, record_len, ts, len(topic_bytes), len(lengths))
+        pos = start + _HEADER.size
+        mm[pos:pos + len(topic_bytes)] = topic_bytes
+        pos += len(topic_bytes)
+        mm[pos:pos + len(frame_header)] = frame_header
+        pos += len(frame_header)
+        for frame in frames:
+            mm[pos:pos + len(frame)] = frame
+            pos += len(frame)
+        self._offset = pos
+        self._records += 1
+        _SEGMENT_HEADER.pack_into(mm, 0, self._records)
+        self._index.add(ts, topic, start)
+        return self._segment_no, start
+
+    def flush(self):
+        """Flush the current segment to disk."""
+        if self._mm is not None:
+            self._mm.flush()
+
+    def close(self):
+        """Close the journal, truncating the current segment to its used length."""
+        self._close_segment()
+
+    def __iter__(self):
+        """Iterate over all records of this journal; see :meth:`hermes.journal.Journal.read`."""
+        return self.read()
+
+    def read(self, start=None, end=None):
+        """
+        Iterate over the records stored in this journal, in the order they were appended.
+
+        As records are stored in order of arrival, their timestamps need not be monotonic; all
+        records are therefore scanned, and those outside the time range skipped.
+
+        :param start: skip records with a timestamp before this
+        :param end: skip records with a timestamp after this
+        :return: generator of tuples (ts, topic, frames)
+        """
+        for path in self.segments():
+            for ts, topic, frames in read_segment(path):
+                if start is not None and ts < start:
+                    continue
+                if end is not None and ts > end:
+                    continue
+                yield ts, topic, frames
+
+    def index(self, path):
+        """
+        Return the :class:`hermes.journal.SegmentIndex` of the given segment.
+
+        Uses the in-memory index for the segment currently written to, and the ``.idx`` file
+        written when a segment was closed otherwise. If the latter is missing, the index is
+        built by scanning the segment.
+
+        Indexes are cached per segment, together with the segment's record count, and rebuilt
+        once records were appended to it, e.g. by another :class:`hermes.journal.Journal`
+        instance writing to it.
+
+        :param path: file path of the segment
+        :return: :class:`hermes.journal.SegmentIndex` instance
+        """
+        if self._mm is not None and path == self._segment_path(self._segment_no):
+            return self._index
+        records = _record_count(path)
+        try:
+            cached_records, index = self._indexes[path]
+        except KeyError:
+            pass
+        else:
+            if cached_records == records:
+                return index
+        idx_path = path[:-len('.seg')] + '.idx'
+        if os.path.exists(idx_path):
+            index = SegmentIndex.load(idx_path)
+        else:
+            index = SegmentIndex.build(path)
+        self._indexes[path] = records, index
+        return index
+
+    def query(self, topic='', start=None, end=None, raw=False):
+        """
+        Iterate over the envelopes of all topics starting with `topic` in the given time range.
+
+        Segments outside of the time range are skipped using their index; within a segment,
+        the records of each matching topic are located using binary search and read from the
+        memory-mapped segment. Records are returned in timestamp order within each segment.
+
+        :param topic: topic prefix to match; defaults to all topics
+        :param start: smallest timestamp to include
+        :param end: largest timestamp to include
+        :param raw: yield tuples (ts, topic, frames) instead of :class:`hermes.Envelope`
+        :return: generator of :class:`hermes.Envelope` instances
+        """
+        for path in self.segments():
+            index = self.index(path)
+            if not index.overlaps(start, end):
+                continue
+            matches = [index.lookup(name, start, end)
+                       for name in index.topics if name.startswith(topic)]
+            if not matches:
+                continue
+            with open(path, 'rb') as f, \
+                    mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                for _, offset in heapq.merge(*matches):
+                    _, ts, name, frames = _unpack_record(mm, offset)
+                    if raw:
+                        yield ts, name, frames
+                    else:
+                        yield Envelope.load_from_frames(frames)
+
+
+def _record_count(path):
+    """Return the number of records written to a segment file, as stored in its header."""
+    with open(path, 'rb') as f:
+        header = f.read(_SEGMENT_HEADER.size)
+    if len(header) < _SEGMENT_HEADER.size:
+        return 0
+    return _SEGMENT_HEADER.unpack(header)[0]
+
+
+def _unpack_record(mm, offset):
+    """
+    Unpack the record stored at `offset` of the given buffer.
+
+    :return: tuple of (record length, ts, topic, frames), or :class:`None` if there is no record
+    """
+    if offset + _HEADER.size > len(mm):
+        return None
+    record_len, ts, topic_len, n_frames = _HEADER.unpack_from(mm, offset)
+    if not record_len:
+        # Pre-allocated, unwritten space of a segment.
+        return None
+    pos = offset + _HEADER.size
+    topic = mm[pos:pos + topic_len].decode('utf-8')
+    pos += topic_len
+    lengths = struct.unpack_from('<%dI' % n_frames, mm, pos)
+    pos += _FRAME_LEN.size * n_frames
+    frames = []
+    for length in lengths:
+        frames.append(mm[pos:pos + length])
+        pos += length
+    return record_len, ts, topic, frames
+
+
+def read_segment(path, offset=_SEGMENT_HEADER.size):
+    """
+    Iterate over the records of a single segment file.
+
+    :param path: path to the segment file
+    :param offset: offset of the first record to read
+    :return: generator of tuples (ts, topic, frames)
+    """
+    with open(path, 'rb') as f:
+        if not os.fstat(f.fileno()).st_size:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            while True:
+                record = _unpack_record(mm, offset)
+                if record is None:
+                    return
+                record_len, ts, topic, frames = record
+                offset += record_len
+                yield ts, topic, frames
+
+
+class Recorder(Thread):
+    """
+    Facility recording all envelopes it receives to a :class:`hermes.journal.Journal`.
+
+    Frames are stored as received, without decoding the data frame.
+    """
+
+    def __init__(self, sub_addr, name, journal, topics=None, ctx=None):
+        """
+        Initialize a :class:`hermes.journal.Recorder` instance.
+
+        :param sub_addr: Address of the :class:`hermes.PostOffice` XPUB socket
+        :param name: Name to give this :class:`hermes.journal.Recorder` instance
+        :param journal: :class:`hermes.journal.Journal` instance to write to
+        :param topics: topic prefix to subscribe to; defaults to all topics
+        :param ctx: :class:`zmq.Context` to use; defaults to the shared context
+        """
+        self.sub_addr = sub_addr
+        self.journal = journal
+        self.recorded = 0
+        self._topics = topics if topics else ''
+        self._running = Event()
+        self.ctx = ctx or get_context()
+        super(Recorder, self).__init__(name=name)
+
+    def stop(self, timeout=None):
+        """
+        Stop the :class:`hermes.journal.Recorder` and close its journal.
+
+        :param timeout: timeout in seconds passed to :meth:`threading.Thread.join()`
+        :return: :class:`None`
+        """
+        log.info("Stopping Recorder instance..")
+        self._running.clear()
+        self.join(timeout)
+        self.journal.close()
+        log.info("..done.")
+
+    def record(self, frames):
+        """
+        Append the given frames to the journal, one record per envelope of a batch.
+
+        Messages on reserved topics, see :const:`hermes.config.RESERVED_PREFIX`, and
+        messages which are not envelopes are skipped.
+
+        :param frames: frames as received by :meth:`zmq.socket.recv_multipart`
+        :return: :class:`None`
+        """
+        for envelope_frames in split_batch(frames):
+            if not is_envelope(envelope_frames):
+                continue
+            try:
+                topic = json.loads(envelope_frames[0].decode('utf-8'))
+                ts = json.loads(envelope_frames[3].decode('utf-8'))
+                if isinstance(ts, list):
+                    ts = ts[0]
+                ts = float(ts)
+            except DECODE_ERRORS:
+                log.exception("Recorder %s: dropping malformed frames %r", self.name,
+                              envelope_frames)
+                continue
+            self.journal.append(envelope_frames, ts, topic)
+            self.recorded += 1
+
+    def run(self):
+        """
+        Subscribe to the configured topics and record all received frames.
+
+        :return: :class:`None`
+        """
+        self._running.set()
+        sock = create_socket(self.ctx, zmq.SUB)
+        sock.setsockopt_unicode(zmq.SUBSCRIBE, self._topics)
+        log.info("Connecting Recorder to zmq.XPUB Socket at %s..", self.sub_addr)
+        sock.connect(self.sub_addr)
+        while self._running.is_set():
+            if not sock.poll(100):
+                continue
+            self.record(sock.recv_multipart())
+        sock.close()
+        self.journal.flush()
+        log.info("Loop terminated.")
+
+
+def _restamp(ts_frame):
+    """Return the given timestamp frame with creation and send time set to now."""
+    now = time.time()
+    ts = json.loads(ts_frame.decode('utf-8'))
+    ts = [now, now, ts[2]] if isinstance(ts, list) else now
+    return json.dumps(ts).encode('utf-8')
+
+
+class Replayer(Thread):
+    """
+    Facility publishing the records of a :class:`hermes.journal.Journal`.
+
+    The recorded frames are sent as-is, so replay speed is bound by the network rather than
+    by decoding.
+    """
+
+    # pylint: disable=too-many-arguments
+
+    def __init__(self, pub_addr, name, journal, speed=1.0, start=None, end=None,
+                 restamp=False, ctx=None):
+        """
+        Initialize a :class:`hermes.journal.Replayer` instance.
+
+        :param pub_addr: Address of the :class:`hermes.PostOffice` XSUB socket
+        :param name: Name to give this :class:`hermes.journal.Replayer` instance
+        :param journal: :class:`hermes.journal.Journal` instance to read from
+        :param speed: replay speed relative to the original pace; `None` or 0 replays
+                      as fast as possible
+        :param start: timestamp of the first record to replay
+        :param end: timestamp of the last record to replay
+        :param restamp: replace the recorded timestamp frame with the current time, so
+                        replayed envelopes aren't considered stale by receivers
+        :param ctx: :class:`zmq.Context` to use; defaults to the shared context
+        """
+        self.pub_addr = pub_addr
+        self.journal = journal
+        self.speed = speed
+        self.start_ts = start
+        self.end_ts = end
+        self.restamp = restamp
+        self.replayed = 0
+        self._running = Event()
+        self.ctx = ctx or get_context()
+        super(Replayer, self).__init__(name=name)
+
+    def stop(self, timeout=None):
+        """
+        Stop the :class:`hermes.journal.Replayer` instance.
+
+        :param timeout: timeout in seconds passed to :meth:`threading.Thread.join()`
+        :return: :class:`None`
+        """
+        log.info("Stopping Replayer instance..")
+        self._running.clear()
+        self.join(timeout)
+        log.info("..done.")
+
+    def run(self):
+        """
+        Publish all records in the configured time range.
+
+        :return: :class:`None`
+        """
+        self._running.set()
+        sock = create_socket(self.ctx, zmq.PUB)
+        log.info("Connecting Replayer to zmq.XSUB Socket at %s..", self.pub_addr)
+        sock.connect(self.pub_addr)
+
+        first_ts = started_at = None
+        for ts, _, frames in self.journal.read(self.start_ts, self.end_ts):
+            if not self._running.is_set():
+                break
+            if self.speed:
+                if first_ts is None:
+                    first_ts, started_at = ts, time.time()
+                delay = started_at + (ts - first_ts) / self.speed - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+            if self.restamp:
+                frames[3] = _restamp(frames[3])
+            sock.send_multipart(frames)
+            self.replayed += 1
+
+        sock.close()
+        self._running.clear()
+        log.info("Replay finished after %s records.", self.replayed)
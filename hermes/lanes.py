@@ -0,0 +1,202 @@
+"""Priority lanes for the queues of Publishers and Receivers.
+
+By default, :class:`hermes.Publisher` and :class:`hermes.Receiver` buffer envelopes in a
+single FIFO queue, so during bursts an order acknowledgement may wait behind tens of thousands
+of book updates. A :class:`hermes.lanes.LaneQueue` instead keeps one queue per
+:class:`hermes.lanes.Lane`, selected by topic prefix, and dequeues envelopes according to a
+scheduling policy:
+
+* :const:`hermes.lanes.STRICT` always serves the first non-empty lane in the order given.
+* :const:`hermes.lanes.WEIGHTED` serves non-empty lanes in proportion to their weights, so
+  bulk lanes cannot be starved entirely.
+
+Example::
+
+    lanes = [Lane('control', topics=['orders/', 'control/']),
+             Lane('data')]
+    publisher = Publisher('tcp://127.0.0.1:5560', 'pub', lanes=lanes)
+"""
+
+# Import Built-Ins
+import logging
+from collections import deque
+from queue import Empty
+from threading import Condition
+import time
+
+# Import Third-Party
+
+# Import Homebrew
+
+# Init Logging Facilities
+log = logging.getLogger(__name__)
+
+STRICT, WEIGHTED = 'strict', 'weighted'
+
+
+class Lane:
+    """Describe a priority lane by name, the topics it carries and its scheduling weight."""
+
+    def __init__(self, name, topics=None, weight=1, dedicated=False):
+        """
+        Initialize a :class:`hermes.lanes.Lane` instance.
+
+        :param name: name of the lane
+        :param topics: list of topic prefixes carried by this lane; all topics by default
+        :param weight: share of envelopes dequeued from this lane under weighted scheduling
+        :param dedicated: have :class:`hermes.Publisher` send this lane's envelopes over
+                          separate sockets, so they do not queue behind other lanes in ZMQ
+        """
+        if weight <= 0:
+            raise ValueError("Lane weight must be positive, not %r" % weight)
+        self.name = name
+        self.topics = tuple(topics) if topics else ()
+        self.weight = weight
+        self.dedicated = dedicated
+
+    def matches(self, topic):
+        """
+        Check if this lane carries the given topic.
+
+        :param topic: topic as :class:`str`
+        :return: :class:`bool`
+        """
+        return not self.topics or topic.startswith(self.topics)
+
+    def __repr__(self):
+        """Construct a basic string-representation of this lane."""
+        return 'Lane(%r, topics=%r, weight=%r)' % (self.name, list(self.topics), self.weight)
+
+
+class LaneQueue:
+    """
+    Thread-safe queue of envelopes, with one FIFO per lane.
+
+    Implements the parts of :class:`queue.Queue`'s interface used by Publisher and Receiver.
+    Envelopes on topics not matched by any lane go to the last lane.
+    """
+
+    # Maximum number of topics to cache the lane of.
+    CACHE_SIZE = 10000
+
+    def __init__(self, lanes, scheduling=STRICT):
+        """
+        Initialize a :class:`hermes.lanes.LaneQueue` instance.
+
+        :param lanes: list of :class:`hermes.lanes.Lane`, in order of priority
+        :param scheduling: :const:`hermes.lanes.STRICT` or :const:`hermes.lanes.WEIGHTED`
+        """
+        if not lanes:
+            raise ValueError("At least one lane is required")
+        if scheduling not in (STRICT, WEIGHTED):
+            raise ValueError("Unknown scheduling policy %r" % scheduling)
+        self.lanes = list(lanes)
+        self.scheduling = scheduling
+        self._queues = [deque() for _ in self.lanes]
+        self._credits = [0] * len(self.lanes)
+        self._cache = {}
+        self._not_empty = Condition()
+
+    def lane_for(self, topic):
+        """
+        Return the lane carrying the given topic.
+
+        :param topic: topic as :class:`str`
+        :return: :class:`hermes.lanes.Lane`
+        """
+        return self.lanes[self._index(topic)]
+
+    def _index(self, topic):
+        """Return the index of the lane carrying the given topic."""
+        try:
+            return self._cache[topic]
+        except KeyError:
+            if len(self._cache) > self.CACHE_SIZE:
+                self._cache.clear()
+            index = next((i for i, lane in enumerate(self.lanes) if lane.matches(topic)),
+                         len(self.lanes) - 1)
+            self._cache[topic] = index
+            return index
+
+    def put(self, envelope, block=True, timeout=None):
+        """
+        Append the envelope to the queue of its lane; the queue is unbounded.
+
+        :param envelope: :class:`hermes.Envelope` instance
+        :param block: ignored; for compatibility with :meth:`queue.Queue.put`
+        :param timeout: ignored; for compatibility with :meth:`queue.Queue.put`
+        :return: :class:`None`
+        """
+        # pylint: disable=unused-argument
+        index = self._index(envelope.topic)
+        with self._not_empty:
+            self._queues[index].append(envelope)
+            self._not_empty.notify()
+
+    def put_nowait(self, envelope):
+        """Equivalent to ``put(envelope, False)``."""
+        self.put(envelope, False)
+
+    def get(self, block=True, timeout=None):
+        """
+        Remove and return the next envelope, according to the scheduling policy.
+
+        :param block: wait for an envelope if all lanes are empty
+        :param timeout: maximum time in seconds to wait
+        :raises queue.Empty: if no envelope is available
+        :return: :class:`hermes.Envelope`
+        """
+        with self._not_empty:
+            if block:
+                deadline = None if timeout is None else time.time() + timeout
+                while not self._size():
+                    remaining = None if deadline is None else deadline - time.time()
+                    if remaining is not None and remaining <= 0:
+                        raise Empty
+                    self._not_empty.wait(remaining)
+            elif not self._size():
+                raise Empty
+            return self._queues[self._select()].popleft()
+
+    def get_nowait(self):
+        """Equivalent to ``get(False)``."""
+        return self.get(False)
+
+    def _select(self):
+        """
+        Return the index of the lane to dequeue from; at least one lane must be non-empty.
+
+        Weighted scheduling uses smooth weighted round-robin: each non-empty lane earns its
+        weight in credits per pick, and the lane with the most credits is served and pays the
+        total weight of all non-empty lanes.
+        """
+        if self.scheduling == STRICT:
+            return next(i for i, q in enumerate(self._queues) if q)
+        total, best = 0, None
+        for i, q in enumerate(self._queues):
+            if q:
+                self._credits[i] += self.lanes[i].weight
+                total += self.lanes[i].weight
+                if best is None or self._credits[i] > self._credits[best]:
+                    best = i
+        self._credits[best] -= total
+        return best
+
+    def _size(self):
+        return sum(len(q) for q in self._queues)
+
+    def qsize(self):
+        """Return the total number of queued envelopes."""
+        return self._size()
+
+    def empty(self):
+        """Check if all lanes are empty."""
+        return not any(self._queues)
+
+    def depths(self):
+        """
+        Return the number of queued envelopes per lane.
+
+        :return: :class:`dict` of lane name to :class:`int`
+        """
+        return {lane.name: len(q) for lane, q in zip(self.lanes, self._queues)}
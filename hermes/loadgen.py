@@ -0,0 +1,652 @@
+r"""Synthetic exchange feeds and a sink measuring throughput, loss and latency, for load tests.
+
+A :class:`hermes.loadgen.LoadGenerator` simulates `instruments` instruments traded on each
+of `exchanges` exchanges, publishing through one :class:`hermes.Publisher` per exchange. A
+:class:`hermes.loadgen.LoadSink` subscribes to the generated topics and reports throughput,
+loss and latency percentiles. Both only need a :class:`hermes.PostOffice`, so load tests can
+run entirely on localhost::
+
+    $ hermes-loadgen run --exchanges 4 --instruments 50 --rate 20000 --duration 30 \\
+          --payload mixed --burst-rate 100000 --burst-period 5 --burst-duration .5
+
+``gen`` and ``sink`` run either side on their own, e.g. in separate processes or hosts.
+
+Payloads are one of:
+
+* ``raw``: trades as plain JSON lists, ``[pair, seq, price, size, side]``
+* ``message``: :class:`hermes.structs.OrderBook` deltas of a few levels
+* ``snapshot``: :class:`hermes.structs.OrderBook` snapshots of `depth` levels per side
+* ``mixed``: trades and book deltas alternately, and a snapshot every `snapshot_every`
+  updates of a stream
+
+Topics are formatted from a template using the fields ``channel`` (``trades`` or ``book``),
+``exchange``, ``pair``, ``base`` and ``quote``; ``'{channel}/{exchange}/{pair}'`` by default.
+Each topic and exchange is a stream with its own sequence numbers, from which the sink
+detects lost and reordered envelopes. Latency is measured from creating an envelope until the
+sink dequeues it, so it includes queueing in the publisher and receiver.
+
+Arrivals are evenly spaced at `rate` envelopes per second across all streams, or, with the
+``poisson`` pattern, exponentially distributed. With a `burst_rate`, the rate rises to it for
+the first `burst_duration` seconds of every `burst_period`.
+"""
+
+# Import Built-Ins
+import argparse
+import json
+import logging
+import random
+import sys
+import time
+from collections import Counter
+from queue import Empty
+from threading import Event, Thread
+
+# Import Third-Party
+
+# Import Homebrew
+from hermes.config import XPUB_ADDR, XSUB_ADDR
+from hermes.proxy import PostOffice
+from hermes.publisher import Publisher
+from hermes.receiver import Receiver
+from hermes.structs import Envelope, OrderBook, topic_frame
+
+# Init Logging Facilities
+log = logging.getLogger(__name__)
+
+RAW, MESSAGE, SNAPSHOT, MIXED = 'raw', 'message', 'snapshot', 'mixed'
+STEADY, POISSON = 'steady', 'poisson'
+
+DEFAULT_TOPIC_TREE = '{channel}/{exchange}/{pair}'
+
+# Time in seconds to wait for publishers and receivers to complete their handshake.
+HANDSHAKE_TIMEOUT = 10.0
+
+BASES = ['BTC', 'ETH', 'XRP', 'LTC', 'BCH', 'EOS', 'XLM', 'ADA', 'TRX', 'XMR', 'DASH', 'NEO',
+         'ETC', 'ZEC', 'XTZ', 'BNB', 'IOTA', 'QTUM', 'OMG', 'LSK']
+
+
+def instrument_names(count, quote='USD'):
+    """
+    Return the names of `count` synthetic instruments, e.g. ``'BTC-USD'``.
+
+    :param count: number of instruments
+    :param quote: quote currency of all instruments
+    :return: list of :class:`str`
+    """
+    bases = BASES[:count] + ['SYN%d' % i for i in range(len(BASES), count)]
+    return ['%s-%s' % (base, quote) for base in bases]
+
+
+def sequence(data):
+    """
+    Return the sequence number of a generated payload.
+
+    :param data: data of an envelope sent by :class:`hermes.loadgen.LoadGenerator`
+    :return: :class:`int`, or :class:`None` if the data has none
+    """
+    if isinstance(data, OrderBook):
+        return data.seq
+    try:
+        return data[1]
+    except (IndexError, KeyError, TypeError):
+        return None
+
+
+class _Stream:
+    """Price and sequence state of a single instrument on a single exchange."""
+
+    __slots__ = ('exchange', 'pair', 'base', 'quote', 'price', 'count', 'seqs')
+
+    def __init__(self, exchange, pair, price):
+        self.exchange = exchange
+        self.pair = pair
+        self.base, _, self.quote = pair.partition('-')
+        self.price = price
+        self.count = 0
+        self.seqs = Counter()
+
+
+class LoadGenerator(Thread):
+    """Publish synthetic market data of several instruments and exchanges at a given rate."""
+
+    # pylint: disable=too-many-arguments,too-many-instance-attributes,too-many-locals
+    def __init__(self, pub_addr, exchanges=1, instruments=10, rate=1000.0, payload=RAW,
+                 topic_tree=DEFAULT_TOPIC_TREE, pattern=STEADY, burst_rate=None,
+                 burst_period=10.0, burst_duration=1.0, depth=500, snapshot_every=100,
+                 count=None, duration=None, seed=None, name='LoadGenerator', **publisher_kwargs):
+        """
+        Initialize a :class:`hermes.loadgen.LoadGenerator` instance.
+
+        :param pub_addr: address of the PostOffice socket facing publishers
+        :param exchanges: number of exchanges, or list of their names
+        :param instruments: number of instruments per exchange, or list of their names
+        :param rate: envelopes per second across all streams; as fast as possible if falsy
+        :param payload: one of ``raw``, ``message``, ``snapshot`` or ``mixed``
+        :param topic_tree: template of topics, see :mod:`hermes.loadgen`
+        :param pattern: ``steady`` or ``poisson`` arrivals
+        :param burst_rate: rate during bursts; no bursts by default
+        :param burst_period: time in seconds from the start of one burst to the next
+        :param burst_duration: duration of each burst in seconds
+        :param depth: number of levels per side of snapshots
+        :param snapshot_every: number of updates per stream between snapshots, when mixed
+        :param count: number of envelopes after which to stop
+        :param duration: time in seconds after which to stop
+        :param seed: seed of the random number generator, for reproducible prices
+        :param name: Name to give this :class:`hermes.loadgen.LoadGenerator` instance
+        :param publisher_kwargs: further keyword arguments of the publishers
+        """
+        if payload not in (RAW, MESSAGE, SNAPSHOT, MIXED):
+            raise ValueError("payload must be one of raw, message, snapshot or mixed, not %r"
+                             % payload)
+        if pattern not in (STEADY, POISSON):
+            raise ValueError("pattern must be steady or poisson, not %r" % pattern)
+        if burst_rate and not 0 < burst_duration <= burst_period:
+            raise ValueError("burst_duration must be positive and at most burst_period")
+        if isinstance(exchanges, int):
+            exchanges = ['exchange%d' % i for i in range(exchanges)]
+        if isinstance(instruments, int):
+            instruments = instrument_names(instruments)
+        self.exchanges = list(exchanges)
+        self.instruments = list(instruments)
+        self.rate = rate
+        self.payload = payload
+        self.topic_tree = topic_tree
+        self.pattern = pattern
+        self.burst_rate = burst_rate
+        self.burst_period = burst_period
+        self.burst_duration = burst_duration
+        self.depth = depth
+        self.snapshot_every = snapshot_every
+        self.count = count
+        self.duration = duration
+        self.random = random.Random(seed)
+        self.publishers = {exchange: Publisher(pub_addr, '%s-%s' % (name, exchange),
+                                               restamp=False, **publisher_kwargs)
+                           for exchange in self.exchanges}
+        self.streams = [_Stream(exchange, pair, self.random.uniform(1, 10000))
+                        for exchange in self.exchanges for pair in self.instruments]
+        self.sent = Counter()
+        self.sent_per_topic = Counter()
+        self.started = self.finished = None
+        self._running = Event()
+        super(LoadGenerator, self).__init__(name=name, daemon=True)
+
+    def current_rate(self, elapsed):
+        """
+        Return the rate at the given time since starting.
+
+        :param elapsed: time in seconds since starting
+        :return: envelopes per second, or :class:`None` if unlimited
+        """
+        if self.burst_rate and elapsed % self.burst_period < self.burst_duration:
+            return self.burst_rate
+        return self.rate or None
+
+    def _levels(self, price, count, step):
+        return [[round(price + step * (i + 1), 2), round(self.random.uniform(.01, 10), 4)]
+                for i in range(count)]
+
+    def payload_for(self, stream):
+        """
+        Generate the next payload of the given stream.
+
+        :param stream: stream to generate a payload for
+        :return: tuple of the channel and data
+        """
+        stream.price = max(.01, stream.price * (1 + self.random.gauss(0, .0005)))
+        kind = self.payload
+        if kind == MIXED:
+            if stream.count % self.snapshot_every == 0:
+                kind = SNAPSHOT
+            else:
+                kind = RAW if stream.count % 2 else MESSAGE
+        stream.count += 1
+        channel = 'trades' if kind == RAW else 'book'
+        stream.seqs[channel] += 1
+        seq = stream.seqs[channel]
+        if kind == RAW:
+            size = round(self.random.uniform(.001, 5), 4)
+            side = 'buy' if self.random.random() < .5 else 'sell'
+            return channel, [stream.pair, seq, round(stream.price, 2), size, side]
+        levels = self.depth if kind == SNAPSHOT else 3
+        bids = self._levels(stream.price, levels, -.01)
+        asks = self._levels(stream.price, levels, .01)
+        return channel, OrderBook(stream.exchange, stream.pair, bids, asks,
+                                  snapshot=kind == SNAPSHOT, seq=seq)
+
+    def envelope_for(self, stream):
+        """
+        Generate the next envelope of the given stream.
+
+        :param stream: stream to generate an envelope for
+        :return: :class:`hermes.Envelope`
+        """
+        channel, data = self.payload_for(stream)
+        topic = self.topic_tree.format(channel=channel, exchange=stream.exchange,
+                                       pair=stream.pair, base=stream.base, quote=stream.quote)
+        return Envelope(topic, stream.exchange, data)
+
+    def start(self, wait=True, timeout=HANDSHAKE_TIMEOUT):
+        """
+        Start the publishers, then the :class:`hermes.loadgen.LoadGenerator` instance.
+
+        :param wait: wait until the publishers are connected
+        :param timeout: time in seconds to wait for each publisher
+        :return: False if a publisher did not complete its handshake in time, True otherwise
+        """
+        ready = True
+        for publisher in self.publishers.values():
+            if publisher.start(wait=wait, timeout=timeout) is False:
+                log.warning("%s did not complete its handshake in time", publisher.name)
+                ready = False
+        super(LoadGenerator, self).start()
+        return ready
+
+    def stop(self, timeout=None):
+        """
+        Stop generating envelopes, and stop the publishers once they sent all queued ones.
+
+        :param timeout: timeout in seconds passed to :meth:`threading.Thread.join()`
+        :return: :class:`None`
+        """
+        self._running.clear()
+        if self.is_alive():
+            self.join(timeout)
+        for publisher in self.publishers.values():
+            deadline = time.time() + (timeout or 5)
+            while publisher.q.qsize() and time.time() < deadline:
+                time.sleep(.01)
+            publisher.stop(timeout)
+
+    @property
+    def done(self):
+        """Return True once the generator stopped generating envelopes."""
+        return self.finished is not None
+
+    def stats(self):
+        """
+        Return generation statistics.
+
+        :return: :class:`dict` with the number of envelopes sent in total and per exchange,
+                 the elapsed time in seconds and the achieved rate
+        """
+        end = self.finished or time.time()
+        elapsed = end - self.started if self.started else 0.0
+        total = sum(self.sent.values())
+        return {'sent': total, 'per_exchange': dict(self.sent), 'elapsed': elapsed,
+                'rate': total / elapsed if elapsed else 0.0}
+
+    def sent_to(self, topics=None):
+        """
+        Return the number of envelopes sent on topics starting with any of the given prefixes.
+
+        :param topics: list of topic prefixes, as subscribed to by a
+                       :class:`hermes.loadgen.LoadSink`; all topics by default
+        :return: :class:`int`
+        """
+        if not topics:
+            return sum(self.sent.values())
+        prefixes = tuple(topics)
+        return sum(n for topic, n in self.sent_per_topic.items() if topic.startswith(prefixes))
+
+    def run(self):
+        """Publish envelopes, round-robin over all streams, until stopped or done."""
+        self._running.set()
+        self.started = start = time.time()
+        deadline = start
+        total, index = 0, 0
+        try:
+            while self._running.is_set():
+                now = time.time()
+                if self.duration is not None and now - start >= self.duration:
+                    break
+                if self.count is not None and total >= self.count:
+                    break
+                rate = self.current_rate(now - start)
+                if rate:
+                    if now < deadline:
+                        time.sleep(min(deadline - now, .001) if deadline - now > .0002 else 0)
+                        continue
+                    gap = self.random.expovariate(rate) if self.pattern == POISSON else 1 / rate
+                    # Don't try to catch up on more than a second of falling behind.
+                    deadline = max(deadline, now - 1) + gap
+                stream = self.streams[index]
+                index = (index + 1) % len(self.streams)
+                envelope = self.envelope_for(stream)
+                self.publishers[stream.exchange].publish(envelope)
+                self.sent[stream.exchange] += 1
+                self.sent_per_topic[envelope.topic] += 1
+                total += 1
+        finally:
+            self.finished = time.time()
+            self._running.clear()
+
+
+class LoadSink(Thread):
+    """
+    Receive envelopes of a :class:`hermes.loadgen.LoadGenerator`, measuring their delivery.
+
+    Gaps in a stream's sequence numbers are counted as lost. Envelopes filling a gap later are
+    counted as reordered instead, other envelopes with a sequence number seen before as
+    duplicates.
+    """
+
+    # Maximum number of missing sequence numbers per stream to remember for late arrivals.
+    MAX_MISSING = 10000
+
+    # pylint: disable=too-many-instance-attributes
+    def __init__(self, sub_addr, topics=None, max_samples=100000, name='LoadSink',
+                 **receiver_kwargs):
+        """
+        Initialize a :class:`hermes.loadgen.LoadSink` instance.
+
+        :param sub_addr: address of the PostOffice socket facing receivers
+        :param topics: list of topic prefixes to subscribe to; all by default
+        :param max_samples: number of latencies to keep for percentiles, sampled uniformly
+        :param name: Name to give this :class:`hermes.loadgen.LoadSink` instance
+        :param receiver_kwargs: further keyword arguments of the receiver
+        """
+        if topics:
+            topics = [topic_frame(topic)[:-1].decode('utf-8') for topic in topics]
+        self.receiver = Receiver(sub_addr, '%s-receiver' % name, topics=topics,
+                                 **receiver_kwargs)
+        self.max_samples = max_samples
+        self.received = 0
+        self.bytes = 0
+        self.lost = 0
+        self.reordered = 0
+        self.duplicates = 0
+        self.latencies = []
+        self.first = self.last = None
+        self._seqs = {}
+        self._missing = {}
+        self._random = random.Random(0)
+        self._running = Event()
+        super(LoadSink, self).__init__(name=name, daemon=True)
+
+    def start(self, wait=True, timeout=HANDSHAKE_TIMEOUT):
+        """
+        Start the receiver, then the :class:`hermes.loadgen.LoadSink` instance.
+
+        :param wait: wait until the receiver's subscriptions took effect
+        :param timeout: time in seconds to wait for the receiver
+        :return: False if the receiver did not complete its handshake in time, True otherwise
+        """
+        ready = self.receiver.start(wait=wait, timeout=timeout) is not False
+        if not ready:
+            log.warning("%s did not complete its handshake in time", self.receiver.name)
+        super(LoadSink, self).start()
+        return ready
+
+    def stop(self, timeout=None):
+        """
+        Stop the :class:`hermes.loadgen.LoadSink` instance and its receiver.
+
+        :param timeout: timeout in seconds passed to :meth:`threading.Thread.join()`
+        :return: :class:`None`
+        """
+        self._running.clear()
+        if self.is_alive():
+            self.join(timeout)
+        self.receiver.stop(timeout)
+
+    def wait_idle(self, idle=1.0, timeout=None):
+        """
+        Wait until nothing was received for `idle` seconds.
+
+        :param idle: time in seconds without receiving anything
+        :param timeout: maximum time in seconds to wait
+        :return: True if the sink went idle, False if the timeout expired
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        while deadline is None or time.time() < deadline:
+            last = self.last or self.first
+            if last is not None and time.time() - last >= idle:
+                return True
+            time.sleep(min(idle, .1))
+        return False
+
+    def measure(self, envelope, now):
+        """
+        Account for a received envelope.
+
+        :param envelope: :class:`hermes.Envelope` instance
+        :param now: time at which it was received
+        :return: :class:`None`
+        """
+        if self.first is None:
+            self.first = now
+        self.last = now
+        self.received += 1
+        latency = now - envelope.ts
+        if len(self.latencies) < self.max_samples:
+            self.latencies.append(latency)
+        else:
+            slot = self._random.randrange(self.received)
+            if slot < self.max_samples:
+                self.latencies[slot] = latency
+        seq = sequence(envelope.data)
+        if seq is None:
+            return
+        key = envelope.origin, envelope.topic
+        last = self._seqs.get(key)
+        if last is None or seq > last:
+            if last is not None and seq > last + 1:
+                self.lost += seq - last - 1
+                missing = self._missing.setdefault(key, set())
+                if len(missing) + seq - last - 1 <= self.MAX_MISSING:
+                    missing.update(range(last + 1, seq))
+            self._seqs[key] = seq
+        elif seq in self._missing.get(key, ()):
+            # A late envelope previously counted as lost.
+            self._missing[key].discard(seq)
+            self.reordered += 1
+            self.lost -= 1
+        else:
+            self.duplicates += 1
+
+    def percentile(self, p):
+        """
+        Return the latency percentile `p` in seconds, or :class:`None` without samples.
+
+        :param p: percentile between 0 and 100
+        """
+        if not self.latencies:
+            return None
+        latencies = sorted(self.latencies)
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p / 100))]
+
+    def stats(self, sent=None):
+        """
+        Return delivery statistics.
+
+        :param sent: number of envelopes sent, if known, to count envelopes lost at the end
+                     of streams as well
+        :return: :class:`dict` with the number of envelopes received and lost, the loss
+                 ratio, the throughput in envelopes per second, and latency percentiles in
+                 seconds
+        """
+        unique = self.received - self.duplicates
+        lost = self.lost if sent is None else max(self.lost, sent - unique)
+        elapsed = (self.last - self.first) if self.first is not None else 0.0
+        stats = {'received': self.received, 'lost': lost, 'reordered': self.reordered,
+                 'duplicates': self.duplicates,
+                 'loss': lost / (lost + self.received) if lost + self.received else 0.0,
+                 'throughput': self.received / elapsed if elapsed else 0.0,
+                 'streams': len(self._seqs)}
+        for p in (50, 90, 99, 99.9):
+            stats['p%s' % p] = self.percentile(p)
+        stats['max'] = max(self.latencies) if self.latencies else None
+        return stats
+
+    def run(self):
+        """Receive and measure envelopes until stopped."""
+        self._running.set()
+        while self._running.is_set():
+            try:
+                envelope = self.receiver.q.get(True, .1)
+            except Empty:
+                continue
+            self.measure(envelope, time.time())
+
+
+def report(stats):
+    """
+    Format the statistics of a load test as a table.
+
+    :param stats: :class:`dict`, as returned by :meth:`hermes.loadgen.LoadSink.stats`,
+                  optionally updated with :meth:`hermes.loadgen.LoadGenerator.stats`
+    :return: :class:`str`
+    """
+    lines = []
+    for key in ('sent', 'rate', 'received', 'throughput', 'lost', 'loss', 'reordered',
+                'duplicates', 'streams', 'p50', 'p90', 'p99', 'p99.9', 'max'):
+        if key not in stats:
+            continue
+        value = stats[key]
+        if value is None:
+            value = '-'
+        elif key.startswith('p') or key == 'max':
+            value = '%.3f ms' % (value * 1e3)
+        elif key == 'loss':
+            value = '%.4f%%' % (value * 100)
+        elif isinstance(value, float):
+            value = '%.1f/s' % value
+        lines.append('%-12s %s' % (key, value))
+    return '\n'.join(lines)
+
+
+def _check(stats, args):
+    """Return the exit status of a load test, given its thresholds."""
+    failed = []
+    if args.max_loss is not None and stats['loss'] > args.max_loss:
+        failed.append('loss %.4f > %s' % (stats['loss'], args.max_loss))
+    if args.max_p99 is not None and (stats['p99'] is None or stats['p99'] * 1e3 > args.max_p99):
+        failed.append('p99 %s ms > %s ms' % (stats['p99'] and stats['p99'] * 1e3, args.max_p99))
+    for reason in failed:
+        log.error("Load test failed: %s", reason)
+    return 1 if failed else 0
+
+
+def _generator(args, pub_addr):
+    """Return a :class:`hermes.loadgen.LoadGenerator` configured from command line arguments."""
+    return LoadGenerator(pub_addr, exchanges=args.exchanges, instruments=args.instruments,
+                         rate=args.rate, payload=args.payload, topic_tree=args.topic_tree,
+                         pattern=args.pattern, burst_rate=args.burst_rate,
+                         burst_period=args.burst_period, burst_duration=args.burst_duration,
+                         depth=args.depth, snapshot_every=args.snapshot_every,
+                         count=args.count, duration=args.duration, seed=args.seed)
+
+
+def _output(stats, args):
+    print(json.dumps(stats, sort_keys=True) if args.json else report(stats))
+
+
+def _wait(generator):
+    while not generator.done:
+        time.sleep(.1)
+
+
+def main(argv=None):
+    """Run a load test, or either side of it, from the command line."""
+    parser = argparse.ArgumentParser(description="Generate synthetic exchange feeds and "
+                                                 "measure their delivery.")
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+    gen = commands.add_parser('gen', help="publish synthetic feeds")
+    sink = commands.add_parser('sink', help="measure received feeds")
+    run = commands.add_parser('run', help="host a PostOffice, publish and measure feeds")
+    for command in (gen, run):
+        command.add_argument('--exchanges', type=int, default=1)
+        command.add_argument('--instruments', type=int, default=10)
+        command.add_argument('--rate', type=float, default=1000.0,
+                             help="envelopes per second; 0 for as fast as possible")
+        command.add_argument('--payload', choices=(RAW, MESSAGE, SNAPSHOT, MIXED), default=RAW)
+        command.add_argument('--topic-tree', default=DEFAULT_TOPIC_TREE)
+        command.add_argument('--pattern', choices=(STEADY, POISSON), default=STEADY)
+        command.add_argument('--burst-rate', type=float)
+        command.add_argument('--burst-period', type=float, default=10.0)
+        command.add_argument('--burst-duration', type=float, default=1.0)
+        command.add_argument('--depth', type=int, default=500, help="levels of snapshots")
+        command.add_argument('--snapshot-every', type=int, default=100)
+        command.add_argument('--count', type=int)
+        command.add_argument('--seed', type=int)
+    for command in (gen, sink, run):
+        command.add_argument('--handshake-timeout', type=float, default=HANDSHAKE_TIMEOUT,
+                             help="time in seconds to wait for publishers and receivers to "
+                                  "connect; exits with status 2 if it expires")
+        command.add_argument('--duration', type=float, default=None if command is gen else 10.0,
+                             help="time in seconds to run for")
+    for command in (sink, run):
+        command.add_argument('--topics', nargs='*', help="topic prefixes to subscribe to")
+        command.add_argument('--idle', type=float, default=2.0,
+                             help="time in seconds to wait for stragglers after the run")
+        command.add_argument('--json', action='store_true', help="print statistics as JSON")
+        command.add_argument('--max-loss', type=float, help="fail above this loss ratio")
+        command.add_argument('--max-p99', type=float, help="fail above this p99 latency in ms")
+    gen.add_argument('--xsub', default=XSUB_ADDR,
+                     help="address of the PostOffice socket facing publishers")
+    sink.add_argument('--xpub', default=XPUB_ADDR,
+                      help="address of the PostOffice socket facing receivers")
+    run.add_argument('--xsub', default=XSUB_ADDR)
+    run.add_argument('--xpub', default=XPUB_ADDR)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    if args.command == 'gen':
+        generator = _generator(args, args.xsub)
+        if not generator.start(timeout=args.handshake_timeout):
+            generator.stop(timeout=5)
+            return 2
+        try:
+            _wait(generator)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            generator.stop(timeout=5)
+        log.info("Sent %(sent)d envelopes at %(rate).1f/s", generator.stats())
+        return 0
+
+    if args.command == 'sink':
+        sink = LoadSink(args.xpub, topics=args.topics)
+        if not sink.start(timeout=args.handshake_timeout):
+            sink.stop(timeout=5)
+            return 2
+        try:
+            time.sleep(args.duration)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            sink.stop(timeout=5)
+        stats = sink.stats()
+        _output(stats, args)
+        return _check(stats, args)
+
+    proxy = PostOffice(args.xsub, args.xpub)
+    proxy.start()
+    sink = LoadSink(args.xpub, topics=args.topics)
+    generator = _generator(args, args.xsub)
+    try:
+        if not sink.start(timeout=args.handshake_timeout):
+            return 2
+        if not generator.start(timeout=args.handshake_timeout):
+            generator.stop(timeout=5)
+            return 2
+        _wait(generator)
+        generator.stop(timeout=5)
+        sink.wait_idle(args.idle, timeout=args.idle + 10)
+    except KeyboardInterrupt:
+        generator.stop(timeout=5)
+    finally:
+        sink.stop(timeout=5)
+        proxy.stop()
+    # Envelopes on topics the sink did not subscribe to are not lost.
+    sent = generator.sent_to(args.topics)
+    stats = sink.stats(sent=sent)
+    stats.update(sent=sent, rate=generator.stats()['rate'])
+    _output(stats, args)
+    return _check(stats, args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
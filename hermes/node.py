@@ -12,6 +12,11 @@ When left unmodified, the Node will simply pass data from the receiver to the pu
 :class:`hermes.Node` supports the `with` statement and will start up all facilities it has
 stored in its instance's :attr:`hermes.Node.facilities` property. These will also be stopped after
 leaving the with block, respectively.
+
+Nodes running in the same process as the :class:`hermes.PostOffice` can be wired using the
+``inproc://`` addresses in :mod:`hermes.config`, which skips the TCP stack entirely. All
+components use the process-wide context of :func:`hermes.context.get_context` by default,
+as required by the ``inproc://`` transport.
 """
 
 # Import Built-Ins
@@ -36,17 +41,19 @@ class Node:
 
     # pylint: disable=too-few-public-methods
 
-    def __init__(self, name, receiver=None, publisher=None):
+    def __init__(self, name, receiver=None, publisher=None, facilities=None):
         """
         Initialize the instance.
 
         :param name: name of the :class:`hermes.Node` instance.
         :param receiver: :class:`hermes.Receiver` instance.
         :param publisher: :class:`hermes.Publisher` instance.
+        :param facilities: list of additional facilities, such as a
+                           :class:`hermes.clock.ClockSync` or :class:`hermes.journal.Recorder`
         """
         self.publisher = publisher
         self.receiver = receiver
-        self._facilities = [self.receiver, self.publisher]
+        self._facilities = list(facilities or []) + [self.receiver, self.publisher]
         self.name = name
         self._running = False
 
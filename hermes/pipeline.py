@@ -0,0 +1,245 @@
+"""Declarative chains of processing stages, executed within a single Node.
+
+Chaining processing steps with one :class:`hermes.Node` per step costs a Receiver thread, a
+Publisher thread and a full serialize, send and deserialize round trip through the
+:class:`hermes.PostOffice` per step. A :class:`hermes.pipeline.Pipeline` instead fuses its
+stages in-process: :class:`hermes.Envelope` objects are passed between stages by reference, and
+only envelopes leaving the last stage are serialized, by the
+:class:`hermes.pipeline.PipelineNode`'s publisher::
+
+    pipeline = Pipeline([
+        Filter(lambda env: env.topic.startswith('trades')),
+        Map(normalize_trade),
+        Route({'trades/BTC': [Aggregate(TumblingWindow(60, {'ohlc': OHLC}), channel='bars')],
+               '': [Map(to_signal, channel='signals')]}),
+    ])
+    node = PipelineNode('derived', pipeline, receiver=receiver, publisher=publisher)
+
+As envelopes may be shared between stages and branches, stages must not modify the envelopes
+they are given; :class:`hermes.pipeline.Map` creates new envelopes instead.
+"""
+
+# Import Built-Ins
+import logging
+
+# Import Third-Party
+
+# Import Homebrew
+from hermes.aggregation import extract_trade
+from hermes.dedup import Deduplicator
+from hermes.node import Node
+from hermes.structs import Envelope
+
+# Init Logging Facilities
+log = logging.getLogger(__name__)
+
+
+class Stage:
+    """Base class for pipeline stages."""
+
+    # pylint: disable=too-few-public-methods
+
+    def process(self, envelope):
+        """
+        Process a single envelope.
+
+        :param envelope: :class:`hermes.Envelope` instance
+        :return: list of :class:`hermes.Envelope` instances to pass to the next stage
+        """
+        raise NotImplementedError
+
+
+class Filter(Stage):
+    """Pass on only envelopes matching a predicate."""
+
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self, predicate):
+        """
+        Initialize a :class:`hermes.pipeline.Filter` instance.
+
+        :param predicate: callable taking an envelope and returning True to pass it on
+        """
+        self.predicate = predicate
+
+    def process(self, envelope):
+        """Return the envelope if it matches the predicate."""
+        return [envelope] if self.predicate(envelope) else []
+
+
+class Deduplicate(Stage):
+    """Drop envelopes whose identity was seen before, e.g. when merging redundant feeds."""
+
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self, deduplicator=None):
+        """
+        Initialize a :class:`hermes.pipeline.Deduplicate` instance.
+
+        :param deduplicator: :class:`hermes.dedup.Deduplicator`; identifies envelopes by
+                             content by default
+        """
+        self.deduplicator = deduplicator or Deduplicator()
+
+    def process(self, envelope):
+        """Return the envelope unless it is a duplicate."""
+        return [] if self.deduplicator.is_duplicate(envelope) else [envelope]
+
+
+class Map(Stage):
+    """Transform the data of envelopes."""
+
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self, func, channel=None):
+        """
+        Initialize a :class:`hermes.pipeline.Map` instance.
+
+        :param func: callable taking an envelope and returning the new data, a new
+                     :class:`hermes.Envelope`, or :class:`None` to drop the envelope
+        :param channel: topic of the new envelope; defaults to the original envelope's topic
+        """
+        self.func = func
+        self.channel = channel
+
+    def process(self, envelope):
+        """Return a new envelope holding the transformed data."""
+        data = self.func(envelope)
+        if data is None:
+            return []
+        if isinstance(data, Envelope):
+            return [data]
+        return [Envelope(self.channel or envelope.topic, envelope.origin, data, ts=envelope.ts,
+                         host=envelope.host)]
+
+
+class Aggregate(Stage):
+    """Feed envelopes into a window, passing on the results it emits."""
+
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self, window, channel='agg', extract=None):
+        """
+        Initialize a :class:`hermes.pipeline.Aggregate` instance.
+
+        :param window: :class:`hermes.aggregation.TumblingWindow` or
+                       :class:`hermes.aggregation.SlidingWindow` instance
+        :param channel: channel of result envelopes; the key of the window is appended
+        :param extract: callable returning (price, size) of an envelope, defaults to
+                        :func:`hermes.aggregation.extract_trade`
+        """
+        self.window = window
+        self.channel = channel
+        self.extract = extract or extract_trade
+
+    def process(self, envelope):
+        """Add the envelope to the window and return envelopes of all results emitted."""
+        try:
+            price, size = self.extract(envelope)
+        except (TypeError, ValueError, IndexError):
+            log.debug("Cannot aggregate %r", envelope)
+            return []
+        return [Envelope('%s/%s' % (self.channel, result.key), envelope.origin, result)
+                for result in self.window.update(envelope.topic, envelope.ts, price, size)]
+
+
+class Route(Stage):
+    """Dispatch envelopes to branches of stages by topic prefix."""
+
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self, branches, first_match=False):
+        """
+        Initialize a :class:`hermes.pipeline.Route` instance.
+
+        :param branches: dict mapping topic prefixes to lists of stages or
+                         :class:`hermes.pipeline.Pipeline` instances; the prefix '' matches
+                         all envelopes
+        :param first_match: only dispatch to the branch with the longest matching prefix,
+                            instead of all matching branches
+        """
+        self.branches = [(prefix, branch if isinstance(branch, Pipeline) else Pipeline(branch))
+                         for prefix, branch in sorted(branches.items(), reverse=True)]
+        self.first_match = first_match
+
+    def process(self, envelope):
+        """Return the output of all branches matching the envelope's topic."""
+        output = []
+        for prefix, branch in self.branches:
+            if envelope.topic.startswith(prefix):
+                output.extend(branch.process(envelope))
+                if self.first_match:
+                    break
+        return output
+
+
+class Pipeline(Stage):
+    """Chain of stages, itself usable as a stage."""
+
+    def __init__(self, stages):
+        """
+        Initialize a :class:`hermes.pipeline.Pipeline` instance.
+
+        :param stages: list of :class:`hermes.pipeline.Stage` instances
+        """
+        self.stages = list(stages)
+
+    def process(self, envelope):
+        """
+        Pass the envelope through all stages.
+
+        :param envelope: :class:`hermes.Envelope` instance
+        :return: list of :class:`hermes.Envelope` instances leaving the last stage
+        """
+        envelopes = [envelope]
+        for stage in self.stages:
+            if len(envelopes) == 1:
+                envelopes = stage.process(envelopes[0])
+            else:
+                envelopes = [out for env in envelopes for out in stage.process(env)]
+            if not envelopes:
+                break
+        return envelopes
+
+
+class PipelineNode(Node):
+    """:class:`hermes.Node` passing received envelopes through a pipeline."""
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, name, pipeline, receiver=None, publisher=None, facilities=None):
+        """
+        Initialize a :class:`hermes.pipeline.PipelineNode` instance.
+
+        :param name: name of the :class:`hermes.Node` instance.
+        :param pipeline: :class:`hermes.pipeline.Pipeline` instance, or list of stages
+        :param receiver: :class:`hermes.Receiver` instance.
+        :param publisher: :class:`hermes.Publisher` instance.
+        :param facilities: list of additional facilities
+        """
+        super(PipelineNode, self).__init__(name, receiver, publisher, facilities)
+        self.pipeline = pipeline if isinstance(pipeline, Pipeline) else Pipeline(pipeline)
+
+    def process(self, envelope):
+        """
+        Pass an envelope through the pipeline and publish its output.
+
+        :param envelope: :class:`hermes.Envelope` instance
+        :return: :class:`None`
+        """
+        for output in self.pipeline.process(envelope):
+            try:
+                self.publisher.publish(output)
+            except AttributeError:
+                raise NotImplementedError
+
+    def run(self):
+        """
+        Execute the main loop.
+
+        While :attr:`hermes.Node._running` is True, pass all received envelopes through the
+        pipeline.
+        """
+        while self._running:
+            envelope = self.recv()
+            if envelope is not None:
+                self.process(envelope)
@@ -0,0 +1,286 @@
+"""Opt-in profiling of the message hot path, and stack sampling at runtime.
+
+A :class:`hermes.profiling.StageProfiler` given to a :class:`hermes.Receiver` or
+:class:`hermes.Publisher` times the stages a sampled fraction of envelopes passes through:
+
+* ``transit``: wire time, from being sent by the publisher until being received; unlike the
+  other stages, this includes time spent in ZMQ queues and on the network
+* ``decode``: decoding the frames to an :class:`hermes.Envelope`
+* ``filter``: exchange filtering, deduplication and lag handling
+* ``enqueue``: putting the envelope on the receiver's queue
+* ``dequeue``: time spent waiting on the receiver's queue, until returned by
+  :meth:`hermes.Receiver.recv`
+* ``handler``: handlers wrapped with :meth:`hermes.profiling.StageProfiler.wrap`
+* ``encode``: converting the envelope to frames in the publisher
+* ``send``: handing the frames to ZMQ
+
+Components without a profiler check for it once per envelope, and unsampled envelopes cost a
+counter increment, so profiling can be left configured in production.
+
+A :class:`hermes.profiling.StackSampler` periodically samples the stacks of all threads, and
+aggregates them in the folded format understood by flame graph tools such as ``flamegraph.pl``
+and speedscope. :func:`hermes.profiling.install_signal_handler` dumps both on ``SIGUSR1``::
+
+    profiler, sampler = StageProfiler(sample_rate=.01), StackSampler()
+    receiver = Receiver('tcp://127.0.0.1:5561', 'recv', profiler=profiler)
+    install_signal_handler('/tmp/hermes-profile', profiler, sampler)
+    sampler.start()
+
+    $ kill -USR1 <pid>
+"""
+
+# Import Built-Ins
+import logging
+import os
+import signal
+import sys
+import time
+from collections import Counter
+from threading import Event, Lock, Thread, current_thread, enumerate as threads
+
+# Import Third-Party
+
+# Import Homebrew
+
+# Init Logging Facilities
+log = logging.getLogger(__name__)
+
+
+class _Trace:
+    """Timestamps of a single sampled envelope passing through consecutive stages."""
+
+    __slots__ = ('profiler', 'last')
+
+    def __init__(self, profiler):
+        self.profiler = profiler
+        self.last = time.perf_counter()
+
+    def mark(self, stage):
+        """Record the time since the previous mark as the duration of `stage`."""
+        now = time.perf_counter()
+        self.profiler.record(stage, now - self.last)
+        self.last = now
+
+
+class StageProfiler:
+    """Record the duration of pipeline stages for a sampled fraction of envelopes."""
+
+    # Maximum number of sampled envelopes waiting on receiver queues to keep track of.
+    MAX_QUEUED = 10000
+
+    def __init__(self, sample_rate=0.01):
+        """
+        Initialize a :class:`hermes.profiling.StageProfiler` instance.
+
+        :param sample_rate: fraction of envelopes to time, between 0 and 1
+        """
+        if not 0 < sample_rate <= 1:
+            raise ValueError("sample_rate must be in (0, 1], not %r" % sample_rate)
+        self.sample_rate = sample_rate
+        self._every = max(1, int(round(1 / sample_rate)))
+        self._counts = {}
+        self._stages = {}
+        self._queued = {}
+        self._lock = Lock()
+
+    def trace(self, source=None):
+        """
+        Start timing the next envelope of `source`, if it is sampled.
+
+        Envelopes are counted per source, so components sharing a profiler are each sampled
+        at the sample rate, however their calls interleave.
+
+        :param source: hashable identifying the caller, e.g. the component itself
+        :return: object whose ``mark(stage)`` method records the time since the previous
+                 mark, or :class:`None` if the envelope is not sampled
+        """
+        count = self._counts.get(source, 0) + 1
+        self._counts[source] = count
+        if count % self._every:
+            return None
+        return _Trace(self)
+
+    def record(self, stage, duration):
+        """
+        Record a single duration of the given stage.
+
+        :param stage: name of the stage
+        :param duration: duration in seconds
+        :return: :class:`None`
+        """
+        with self._lock:
+            stats = self._stages.get(stage)
+            if stats is None:
+                self._stages[stage] = [1, duration, duration]
+            else:
+                stats[0] += 1
+                stats[1] += duration
+                stats[2] = max(stats[2], duration)
+
+    def enqueued(self, envelope):
+        """Remember when a sampled envelope was put on a receiver's queue."""
+        with self._lock:
+            if len(self._queued) < self.MAX_QUEUED:
+                self._queued[id(envelope)] = time.perf_counter()
+
+    def dequeued(self, envelope):
+        """Record the time a sampled envelope spent on a receiver's queue."""
+        if not self._queued:
+            return
+        with self._lock:
+            enqueued = self._queued.pop(id(envelope), None)
+        if enqueued is not None:
+            self.record('dequeue', time.perf_counter() - enqueued)
+
+    def wrap(self, stage, func):
+        """
+        Wrap the given callable to record the duration of sampled calls as `stage`.
+
+        :param stage: name of the stage, e.g. ``'handler'``
+        :param func: callable to wrap
+        :return: callable
+        """
+        def timed(*args, **kwargs):
+            trace = self.trace(timed)
+            if trace is None:
+                return func(*args, **kwargs)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                trace.mark(stage)
+        timed.__name__ = getattr(func, '__name__', 'timed')
+        timed.__doc__ = func.__doc__
+        return timed
+
+    def stats(self):
+        """
+        Return the recorded durations per stage.
+
+        :return: :class:`dict` of stage name to :class:`dict` with the number of samples and
+                 the mean, maximum and total duration in seconds
+        """
+        with self._lock:
+            return {stage: {'count': count, 'mean': total / count, 'max': peak,
+                            'total': total}
+                    for stage, (count, total, peak) in self._stages.items()}
+
+    def report(self):
+        """
+        Return the recorded durations per stage as a table.
+
+        :return: :class:`str`
+        """
+        lines = ['%-10s %10s %12s %12s' % ('stage', 'samples', 'mean us', 'max us')]
+        for stage, stats in sorted(self.stats().items(), key=lambda i: -i[1]['total']):
+            lines.append('%-10s %10d %12.1f %12.1f' % (
+                stage, stats['count'], stats['mean'] * 1e6, stats['max'] * 1e6))
+        return '\n'.join(lines)
+
+    def reset(self):
+        """Discard all recorded durations."""
+        with self._lock:
+            self._stages.clear()
+            self._queued.clear()
+
+
+class StackSampler(Thread):
+    """Sample the stacks of all threads periodically, aggregated as folded stacks."""
+
+    def __init__(self, interval=0.005, name='StackSampler'):
+        """
+        Initialize a :class:`hermes.profiling.StackSampler` instance.
+
+        :param interval: time in seconds between samples
+        :param name: Name to give this :class:`hermes.profiling.StackSampler` instance
+        """
+        self.interval = interval
+        self.stacks = Counter()
+        self._lock = Lock()
+        self._running = Event()
+        super(StackSampler, self).__init__(name=name, daemon=True)
+
+    def sample(self):
+        """Take a single sample of the stacks of all threads, except the sampler's."""
+        names = {thread.ident: thread.name for thread in threads()}
+        own = current_thread().ident
+        # pylint: disable=protected-access
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append('%s (%s:%s)' % (code.co_name, os.path.basename(code.co_filename),
+                                             code.co_firstlineno))
+                frame = frame.f_back
+            stack.append(names.get(ident, str(ident)))
+            with self._lock:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def folded(self):
+        """
+        Return the samples in folded format, one stack and its count per line.
+
+        :return: :class:`str`
+        """
+        with self._lock:
+            return '\n'.join('%s %d' % item for item in sorted(self.stacks.items()))
+
+    def stop(self, timeout=None):
+        """
+        Stop sampling.
+
+        :param timeout: timeout in seconds passed to :meth:`threading.Thread.join()`
+        :return: :class:`None`
+        """
+        self._running.clear()
+        self.join(timeout)
+
+    def run(self):
+        """Sample stacks until stopped."""
+        self._running.set()
+        while self._running.is_set():
+            self.sample()
+            time.sleep(self.interval)
+
+
+def dump(path, profiler=None, sampler=None):
+    """
+    Write the stage report and folded stack samples to files.
+
+    :param path: path prefix; ``.stages.txt`` and ``.folded`` are appended
+    :param profiler: :class:`hermes.profiling.StageProfiler`
+    :param sampler: :class:`hermes.profiling.StackSampler`
+    :return: list of paths written
+    """
+    written = []
+    if profiler is not None:
+        with open(path + '.stages.txt', 'w') as f:
+            f.write(profiler.report() + '\n')
+        written.append(path + '.stages.txt')
+    if sampler is not None:
+        with open(path + '.folded', 'w') as f:
+            f.write(sampler.folded() + '\n')
+        written.append(path + '.folded')
+    return written
+
+
+def install_signal_handler(path, profiler=None, sampler=None, signum=None):
+    """
+    Dump profiling data using :func:`hermes.profiling.dump` whenever a signal is received.
+
+    Must be called from the main thread. The process id and time are appended to `path`.
+
+    :param path: path prefix of the files to write
+    :param profiler: :class:`hermes.profiling.StageProfiler`
+    :param sampler: :class:`hermes.profiling.StackSampler`
+    :param signum: signal to handle; defaults to ``SIGUSR1``
+    :return: the previous signal handler
+    """
+    signum = signal.SIGUSR1 if signum is None else signum
+
+    def handler(*_):
+        prefix = '%s-%s-%d' % (path, os.getpid(), time.time())
+        log.info("Dumping profiling data to %s", ', '.join(dump(prefix, profiler, sampler)))
+
+    return signal.signal(signum, handler)
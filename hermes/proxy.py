@@ -2,17 +2,32 @@
 # pylint: disable=too-few-public-methods
 
 # Import Built-Ins
+import itertools
+import json
 import logging
-from threading import Thread
+import time
+from threading import Thread, Event
 
 # Import Third-Party
 import zmq
 
 # Import Homebrew
+from hermes.clock import answer_pings
+from hermes.config import HEARTBEAT_TOPIC, WELCOME_TOPIC, READY_TOPIC, PROBE_TOPIC
+from hermes.context import create_socket, get_context
+from hermes.structs import RESERVED_FRAME, Envelope, topic_frame
 
 # Init Logging Facilities
 log = logging.getLogger(__name__)
 
+# Topic frames of the readiness handshake.
+WELCOME_FRAME = topic_frame(WELCOME_TOPIC)
+READY_FRAME = topic_frame(READY_TOPIC)
+PROBE_PREFIX = topic_frame(PROBE_TOPIC)[:-1]
+
+# Numbers the inproc:// addresses of PostOffice instances, which must be unique per context.
+_INSTANCES = itertools.count()
+
 
 class PostOffice(Thread):
     """
@@ -21,9 +36,42 @@ class PostOffice(Thread):
     Uses :const:`zmq.XSUB` & :const:`zmq.XPUB` ZMQ sockets to act as intermediary. Subscribe to
     these using the respective PUB or SUB socket by binding to the same address as
     XPUB or XSUB device.
+
+    Messages and subscriptions are relayed by :func:`zmq.proxy_steerable`, without passing
+    through Python. The PostOffice injects its own traffic - heartbeats, and its part of the
+    readiness handshake - through separate sockets connected to its XSUB and XPUB sockets over
+    ``inproc://``, served by a helper thread, and is stopped through an ``inproc://`` control
+    socket.
+
+    When using ``inproc://`` addresses, all :class:`hermes.Publisher` and
+    :class:`hermes.Receiver` instances connecting to the :class:`hermes.PostOffice` must share
+    its :class:`zmq.Context` - which is the default, see :func:`hermes.context.get_context`.
+
+    If a clock address is given, the :class:`hermes.PostOffice` also serves as reference clock
+    for :class:`hermes.clock.ClockSync` instances of the cluster.
+
+    If a heartbeat interval is given, the :class:`hermes.PostOffice` publishes an envelope on
+    :const:`hermes.config.HEARTBEAT_TOPIC` to its subscribers at that interval, allowing
+    :class:`hermes.Receiver` instances to detect a stalled PostOffice and fail over.
+
+    The :class:`hermes.PostOffice` also takes part in a readiness handshake, which lets
+    publishers and receivers know once messages sent through it are no longer dropped:
+
+    * It subscribes to :const:`hermes.config.WELCOME_TOPIC` once; :class:`zmq.XSUB` sends
+      this subscription, like all others, to publishers connecting later as well. A publisher
+      receiving it sends an envelope on the welcome topic, upon which the PostOffice
+      subscribes to :const:`hermes.config.READY_TOPIC`. As subscriptions are sent in order,
+      receiving the latter tells the publisher that it received all current subscriptions.
+    * Receivers subscribe to a topic below :const:`hermes.config.PROBE_TOPIC` after their
+      topics. The PostOffice answers with an envelope on the subscribed topic; since
+      subscriptions are forwarded in order, receiving it marks the receiver as ready.
     """
 
-    def __init__(self, proxy_in, proxy_out, debug_addr=None):
+    # pylint: disable=too-many-instance-attributes
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, proxy_in, proxy_out, debug_addr=None, ctx=None, clock_addr=None,
+                 heartbeat_interval=None, sockopts=None):
         """
         Initialize a :class:`hermes.PostOffice` instance.
 
@@ -33,11 +81,27 @@ class PostOffice(Thread):
         :param proxy_in: ZMQ Address, including port - facing towards cluster nodes
         :param proxy_out: ZMQ address, including port - facing away from cluster nodes
         :param debug_addr: ZMQ address, including port
+        :param ctx: :class:`zmq.Context` to use; defaults to the shared context
+        :param clock_addr: ZMQ address to answer :class:`hermes.clock.ClockSync` pings on
+        :param heartbeat_interval: interval in seconds to publish heartbeats at
+        :param sockopts: :class:`hermes.config.SocketOptions` overriding the process-wide
+                         :const:`hermes.config.SOCKET_OPTIONS`
         """
         self.xsub_url = proxy_in
         self.xpub_url = proxy_out
         self._debug_addr = debug_addr
-        self.ctx = zmq.Context()
+        self.clock_addr = clock_addr
+        self.heartbeat_interval = heartbeat_interval
+        self.sockopts = sockopts
+        self.heartbeats = 0
+        self.subscriptions = set()
+        self._running = Event()
+        self._control_bound = Event()
+        self.ctx = ctx or get_context()
+        internal = 'inproc://hermes-postoffice-%d-' % next(_INSTANCES)
+        self._inject_addr = internal + 'xsub'
+        self._watch_addr = internal + 'xpub'
+        self._control_addr = internal + 'control'
         super(PostOffice, self).__init__()
 
     @property
@@ -55,8 +119,129 @@ class PostOffice(Thread):
 
         :param timeout: timeout in seconds to wait for join
         """
-        self.ctx.term()
+        self._running.clear()
+        while self.is_alive() and not self._control_bound.wait(.1):
+            pass
+        if not self.is_alive():
+            return
+        control = self.ctx.socket(zmq.PAIR)
+        control.connect(self._control_addr)
+        control.send(b'TERMINATE')
+        # Closing the socket before the proxy read the command may discard it.
         self.join(timeout)
+        control.close(linger=0)
+
+    def _answer_probe(self, inject, topic):
+        """
+        Publish an envelope on the probe topic a receiver subscribed to.
+
+        :param topic: subscribed topic frame
+        :return: :class:`None`
+        """
+        try:
+            probe = json.loads(topic.decode('utf-8'))
+        except ValueError:
+            log.warning("Ignoring malformed probe subscription %r", topic)
+            return
+        envelope = Envelope(probe, self.xpub_url, ['Probe'])
+        inject.send_multipart(envelope.convert_to_frames())
+
+    def _read_subscriptions(self, inject):
+        """
+        Process the subscriptions relayed to the inject socket, as to every publisher.
+
+        Answers probes, and keeps track of the topics subscribers are interested in.
+
+        :return: :class:`None`
+        """
+        while True:
+            try:
+                msg = inject.recv(zmq.NOBLOCK)
+            except zmq.error.Again:
+                return
+            action, topic = msg[:1], msg[1:]
+            if topic.startswith(PROBE_PREFIX):
+                if action == b'\x01':
+                    self._answer_probe(inject, topic)
+            elif topic.startswith(RESERVED_FRAME):
+                continue
+            elif action == b'\x01':
+                self.subscriptions.add(topic)
+            elif action == b'\x00':
+                self.subscriptions.discard(topic)
+
+    @staticmethod
+    def _welcome(watch):
+        """
+        Answer the welcome envelopes of publishers with the ready subscription.
+
+        The subscription is withdrawn right away, so it isn't sent to publishers connecting
+        later before their other subscriptions.
+
+        :return: :class:`None`
+        """
+        while True:
+            try:
+                watch.recv_multipart(zmq.NOBLOCK)
+            except zmq.error.Again:
+                return
+            watch.setsockopt(zmq.SUBSCRIBE, READY_FRAME)
+            watch.setsockopt(zmq.UNSUBSCRIBE, READY_FRAME)
+
+    def _heartbeat(self, inject):
+        """
+        Publish a heartbeat envelope to all subscribers of the heartbeat topic.
+
+        :return: :class:`None`
+        """
+        self.heartbeats += 1
+        envelope = Envelope(HEARTBEAT_TOPIC, self.xpub_url, ['Heartbeat', self.heartbeats])
+        inject.send_multipart(envelope.convert_to_frames())
+
+    def _serve(self):
+        """
+        Serve the PostOffice's own traffic, while :func:`zmq.proxy_steerable` relays messages.
+
+        :return: :class:`None`
+        """
+        inject = create_socket(self.ctx, zmq.XPUB)
+        inject.connect(self._inject_addr)
+        watch = create_socket(self.ctx, zmq.SUB)
+        watch.setsockopt(zmq.SUBSCRIBE, WELCOME_FRAME)
+        watch.connect(self._watch_addr)
+
+        poller = zmq.Poller()
+        poller.register(inject, zmq.POLLIN)
+        poller.register(watch, zmq.POLLIN)
+
+        # Set up the clock socket, if address is given.
+        if self.clock_addr:
+            clock = create_socket(self.ctx, zmq.ROUTER)
+            clock.bind(self.clock_addr)
+            poller.register(clock, zmq.POLLIN)
+        else:
+            clock = None
+
+        next_heartbeat = time.time()
+        while self._running.is_set():
+            timeout = .1
+            if self.heartbeat_interval:
+                now = time.time()
+                if now >= next_heartbeat:
+                    self._heartbeat(inject)
+                    next_heartbeat = now + self.heartbeat_interval
+                timeout = min(timeout, next_heartbeat - now)
+            events = dict(poller.poll(max(0, timeout * 1000)))
+            if inject in events:
+                self._read_subscriptions(inject)
+            if watch in events:
+                self._welcome(watch)
+            if clock in events:
+                answer_pings(clock)
+
+        for sock in (inject, watch, clock):
+            if sock:
+                sock.close()
 
     def run(self):
         """
@@ -68,30 +253,42 @@ class PostOffice(Thread):
 
         :return: :class:`None`
         """
+        self._running.set()
         ctx = self.ctx
 
         log.info("Setting up XPUB ZMQ socket..")
-        xpub = ctx.socket(zmq.XPUB)
+        xpub = create_socket(ctx, zmq.XPUB, self.sockopts)
         log.info("Binding XPUB socket facing subscribers to %s..", self.xpub_url)
         xpub.bind(self.xpub_url)
+        xpub.bind(self._watch_addr)
 
         log.info("Setting up XSUB ZMQ socket..")
-        xsub = ctx.socket(zmq.XSUB)
+        xsub = create_socket(ctx, zmq.XSUB, self.sockopts)
         log.info("Binding XSUB socket facing publishers to %s..", self.xsub_url)
         xsub.bind(self.xsub_url)
+        xsub.bind(self._inject_addr)
 
         # Set up a debug socket, if address is given.
         if self.debug_addr:
-            debug_pub = ctx.socket(zmq.PUB)
+            debug_pub = create_socket(ctx, zmq.PUB, self.sockopts)
             debug_pub.bind(self.debug_addr)
         else:
             debug_pub = None
 
-        log.info("Launching poll loop..")
+        control = ctx.socket(zmq.PAIR)
+        control.bind(self._control_addr)
+        self._control_bound.set()
+
+        helper = Thread(target=self._serve, name='%s-helper' % self.name, daemon=True)
+        helper.start()
+
+        log.info("Launching proxy..")
         try:
-            zmq.proxy(xpub, xsub, debug_pub)
-        except zmq.error.ContextTerminated:
-            xpub.close()
-            xsub.close()
-            debug_pub.close()
+            zmq.proxy_steerable(xpub, xsub, debug_pub, control)
+        finally:
+            self._running.clear()
+            helper.join()
+            for sock in (xpub, xsub, debug_pub, control):
+                if sock:
+                    sock.close()
             log.info("Closed sockets, Proxy terminated")
@@ -2,18 +2,32 @@
 
 # Import Built-Ins
 import logging
-from queue import Queue
+import time
+from collections import Counter
+from queue import Queue, Empty
 from threading import Thread, Event
 
 # Import Third-Party
 import zmq
+from zmq.utils.monitor import recv_monitor_message
 
 # Import home-grown
+from hermes.batching import AdaptiveBatcher, group_by_topic
+from hermes.config import WELCOME_TOPIC, READY_TOPIC
+from hermes.context import create_socket, get_context
+from hermes.executor import shard
+from hermes.lanes import LaneQueue, STRICT
+from hermes.ratelimit import RateLimiter
+from hermes.structs import RESERVED_FRAME, Envelope, topic_frame
 
 
 # Init Logging Facilities
 log = logging.getLogger(__name__)
 
+# Topic frames of the readiness handshake with hermes.PostOffice.
+WELCOME_FRAME = topic_frame(WELCOME_TOPIC)
+READY_FRAME = topic_frame(READY_TOPIC)
+
 
 class Publisher(Thread):
     """
@@ -24,33 +38,185 @@ class Publisher(Thread):
 
     The :meth:`hermes.Publisher.run` method continuously checks for data on the internal q,
     which is fed by the :meth:`hermes.Publisher.publish` method.
+
+    Given several addresses, the publisher connects one socket to each of them and routes
+    envelopes according to its routing mode, serializing each envelope only once:
+
+    * :attr:`hermes.Publisher.BROADCAST` sends every envelope to all endpoints, e.g. to a
+      primary and a backup :class:`hermes.PostOffice`.
+    * :attr:`hermes.Publisher.HASH` sends each envelope to one endpoint, chosen by a stable
+      hash of its topic, e.g. to shard topics across several proxies.
+    * :attr:`hermes.Publisher.FAILOVER` sends every envelope to the first endpoint which is
+      connected, as reported by socket monitor events.
+
+    With the handshake enabled, the publisher uses :const:`zmq.XPUB` sockets and performs the
+    readiness handshake of :class:`hermes.PostOffice`. Envelopes published before it completed
+    are buffered instead of being dropped by ZMQ; see :meth:`hermes.Publisher.start`.
+
+    With interest tracking enabled, the publisher also keeps track of the subscriptions it
+    receives, and :meth:`hermes.Publisher.publish` discards envelopes on topics nobody
+    subscribed to before they are serialized, counting them in
+    :attr:`hermes.Publisher.skipped`. This implies the handshake, which tells the publisher
+    once it received all current subscriptions.
+
+    Given a list of :class:`hermes.lanes.Lane`, the publisher queues envelopes per lane and
+    sends them in the order of the lanes' priorities, so control messages can overtake bulk
+    data queued before them; see :mod:`hermes.lanes`. Lanes marked as dedicated are sent over
+    separate sockets per endpoint, so they do not queue behind other lanes inside ZMQ either.
+
+    Given a list of :class:`hermes.ratelimit.RateLimit`, the publisher limits the rate at which
+    it sends envelopes per topic before serializing them, dropping or coalescing envelopes
+    exceeding it; see :mod:`hermes.ratelimit`. Their number is counted per topic in
+    :attr:`hermes.Publisher.limiter`'s :attr:`hermes.ratelimit.RateLimiter.dropped`.
+
+    With a maximum batch latency given, the publisher sends envelopes in batches whose size
+    adapts to its load, using a :class:`hermes.batching.AdaptiveBatcher` available as
+    :attr:`hermes.Publisher.batcher`; see :mod:`hermes.batching`.
+
+    Given a :class:`hermes.profiling.StageProfiler`, the publisher times encoding and sending
+    a sampled fraction of envelopes; see :mod:`hermes.profiling`.
     """
 
-    def __init__(self, pub_addr, name, ctx=None):
+    # pylint: disable=too-many-instance-attributes
+
+    # Maximum number of (topic, origin) pairs to cache encoded frames for.
+    HEADER_CACHE_SIZE = 10000
+
+    # Routing modes for publishers with multiple endpoints.
+    BROADCAST, HASH, FAILOVER = 'broadcast', 'hash', 'failover'
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, pub_addr, name, ctx=None, compressor=None, clock=None, restamp=True,
+                 routing=BROADCAST, sockopts=None, handshake=False, track_interest=False,
+                 lanes=None, scheduling=STRICT, rate_limits=None, max_batch_latency=None,
+                 max_batch=256, profiler=None, extended_ts=None):
         """
         Initialize Instance.
 
-        :param pub_addr: Address this instance should bind to
+        :param pub_addr: Address this instance should connect to, or list of addresses
         :param name: Name to give this :class:`hermes.Publisher` instance.
+        :param ctx: :class:`zmq.Context` to use; defaults to the shared context
+        :param compressor: :class:`hermes.compression.Compressor` applied to data frames
+        :param clock: :class:`hermes.clock.ClockSync` to stamp envelopes' send time with
+        :param restamp: update envelopes' creation timestamp when sending them; disable this
+                        for publishers forwarding envelopes created elsewhere
+        :param routing: routing mode used if multiple addresses are given
+        :param sockopts: :class:`hermes.config.SocketOptions` overriding the process-wide
+                         :const:`hermes.config.SOCKET_OPTIONS`
+        :param handshake: hold back envelopes until all endpoints (any endpoint, when failing
+                          over) completed the readiness handshake with their PostOffice
+        :param track_interest: skip envelopes on topics without subscribers; implies
+                               `handshake`
+        :param lanes: list of :class:`hermes.lanes.Lane` to queue envelopes in, in order of
+                      priority; a single FIFO queue by default
+        :param scheduling: scheduling policy between lanes, see :mod:`hermes.lanes`
+        :param rate_limits: list of :class:`hermes.ratelimit.RateLimit` to apply per topic
+        :param max_batch_latency: maximum time in seconds to hold back envelopes to batch
+                                  them; batching is disabled by default
+        :param max_batch: maximum number of envelopes per batch
+        :param profiler: :class:`hermes.profiling.StageProfiler` to time stages with
+        :param extended_ts: transmit send time and host id of envelopes, see
+                            :class:`hermes.Envelope`; defaults to whether a clock is given, as
+                            receivers need it to measure skew-corrected latencies
         """
+        if routing not in (self.BROADCAST, self.HASH, self.FAILOVER):
+            raise ValueError("Unknown routing mode %r" % routing)
         self.pub_addr = pub_addr
+        self.endpoints = [pub_addr] if isinstance(pub_addr, str) else list(pub_addr)
+        self.routing = routing
+        self.sockopts = sockopts
+        self.handshake = handshake or track_interest
+        self.track_interest = track_interest
+        self.skipped = Counter()
+        self._interest = frozenset()
+        self._interest_cache = {}
+        self.connected = [False] * len(self.endpoints)
+        self.failovers = 0
+        self._active = 0
         self._running = Event()
         self.sock = None
-        self.q = Queue()
-        self.ctx = ctx or zmq.Context().instance()
+        self.socks = []
+        self._monitors = []
+        self._ready = Event()
+        self._ready_socks = set()
+        self.lanes = list(lanes) if lanes else []
+        self._lane_socks = {}
+        self.q = LaneQueue(self.lanes, scheduling) if lanes else Queue()
+        self.limiter = RateLimiter(rate_limits) if rate_limits else None
+        self.profiler = profiler
+        self.batcher = None
+        if max_batch_latency:
+            self.batcher = AdaptiveBatcher(max_batch_latency, max_batch)
+        self.compressor = compressor
+        self.clock = clock
+        self.extended_ts = clock is not None if extended_ts is None else extended_ts
+        self.restamp = restamp
+        self._header_cache = {}
+        self.ctx = ctx or get_context()
         super(Publisher, self).__init__(name=name)
 
+    def start(self, wait=False, timeout=None):
+        """
+        Start the :class:`hermes.Publisher` instance.
+
+        :param wait: enable the handshake and block until it completed
+        :param timeout: maximum time in seconds to wait
+        :return: True if ready, False on timeout; :class:`None` if not waiting
+        """
+        if wait:
+            self.handshake = True
+        super(Publisher, self).start()
+        if wait:
+            return self.wait_ready(timeout)
+        return None
+
+    @property
+    def ready(self):
+        """Check if envelopes are being sent; see :meth:`hermes.Publisher.wait_ready`."""
+        return self._ready.is_set()
+
+    def wait_ready(self, timeout=None):
+        """
+        Block until the sockets are connected, and the handshake completed, if enabled.
+
+        :param timeout: maximum time in seconds to wait
+        :return: True if ready, False on timeout
+        """
+        return self._ready.wait(timeout)
+
     def publish(self, envelope):
         """
         Publish the given data to all current subscribers.
 
+        Envelopes published before the :class:`hermes.Publisher` is ready are buffered.
+
         :param envelope: :class:`hermes.Envelope` instance
-        :return: None
+        :return: True if the envelope was queued, False if nobody subscribed to its topic
+        """
+        if self.track_interest and not self.interested(envelope.topic):
+            self.skipped[envelope.topic] += 1
+            return False
+        self.q.put(envelope)
+        return True
+
+    def interested(self, topic):
+        """
+        Check if any subscriber is interested in the given topic.
+
+        Always True if interest tracking is disabled, or the handshake did not complete yet.
+
+        :param topic: topic as :class:`str`
+        :return: :class:`bool`
         """
-        if self.sock:
-            self.q.put(envelope)
+        if not self.track_interest or not self._ready.is_set():
             return True
-        return False
+        cache, interest = self._interest_cache, self._interest
+        try:
+            return cache[topic]
+        except KeyError:
+            frame = topic_frame(topic)
+            result = cache[topic] = any(frame.startswith(p) for p in interest)
+            return result
 
     def stop(self, timeout=None):
         """
@@ -67,51 +233,277 @@ class Publisher(Thread):
         """
         Join the :class:`hermes.Publisher` instance and shut it down.
 
-        Clears the :attr:`hermes.Publisher._running` flag to gracefully terminate the run loop.
+        Clears the :attr:`hermes.Publisher._running` flag to gracefully terminate the run loop,
+        which closes the socket.
 
         :param timeout: timeout in seconds to wait for :meth:`hermes.Publisher.join` to finish
         :return: :class:`None`
         """
         log.debug("Clearing _running state..")
         self._running.clear()
-        log.debug("Closing socket..")
-        try:
-            self.sock.close()
-        except AttributeError:
-            log.debug("Socket was already closed!")
-            pass
         super(Publisher, self).join(timeout)
 
+    def _convert(self, envelope):
+        """
+        Convert the given envelope to frames, using cached topic and origin frames.
+
+        :param envelope: :class:`hermes.Envelope` instance
+        :return: list of :class:`bytes`
+        """
+        if len(self._header_cache) > self.HEADER_CACHE_SIZE:
+            self._header_cache.clear()
+        sent = self.clock.now() if self.clock else None
+        return envelope.convert_to_frames(compressor=self.compressor, sent=sent,
+                                          restamp=self.restamp,
+                                          header_cache=self._header_cache,
+                                          extended=self.extended_ts)
+
+    def _create_socket(self):
+        """Create a :const:`zmq.PUB` socket, or :const:`zmq.XPUB` socket for the handshake."""
+        if self.handshake:
+            sock = create_socket(self.ctx, zmq.XPUB, self.sockopts)
+            sock.setsockopt(zmq.XPUB_VERBOSE, 1)
+            return sock
+        return create_socket(self.ctx, zmq.PUB, self.sockopts)
+
+    def _connect(self):
+        """Connect one socket to each endpoint, plus one per endpoint and dedicated lane."""
+        for addr in self.endpoints:
+            sock = self._create_socket()
+            if self.routing == self.FAILOVER:
+                self._monitors.append(sock.get_monitor_socket(
+                    zmq.EVENT_CONNECTED | zmq.EVENT_DISCONNECTED))
+            log.info("Connecting Publisher to zmq.XSUB Socket at %s.." % addr)
+            sock.connect(addr)
+            self.socks.append(sock)
+        for lane in self.lanes:
+            if lane.dedicated:
+                self._lane_socks[lane.name] = [self._create_socket() for _ in self.endpoints]
+                for sock, addr in zip(self._lane_socks[lane.name], self.endpoints):
+                    sock.connect(addr)
+        self.sock = self.socks[0]
+        if not self.handshake:
+            self._ready.set()
+
+    def _sockets(self):
+        """
+        Yield all sockets, keyed by endpoint index and lane name.
+
+        :return: generator of ((:class:`int`, lane name or :class:`None`), :class:`zmq.Socket`)
+        """
+        for i, sock in enumerate(self.socks):
+            yield (i, None), sock
+        for lane, socks in self._lane_socks.items():
+            for i, sock in enumerate(socks):
+                yield (i, lane), sock
+
+    def _close(self):
+        """Close all sockets and monitors."""
+        for sock in self.socks:
+            if self._monitors:
+                sock.disable_monitor()
+            sock.close()
+        for monitor in self._monitors:
+            monitor.close()
+        for socks in self._lane_socks.values():
+            for sock in socks:
+                sock.close()
+        self.socks, self._monitors, self._lane_socks = [], [], {}
+        self.sock = None
+        self._ready.clear()
+        self._ready_socks.clear()
+
+    def _read_subscriptions(self):
+        """Process pending subscriptions received on the :const:`zmq.XPUB` sockets."""
+        for key, sock in self._sockets():
+            while True:
+                try:
+                    msg = sock.recv(zmq.NOBLOCK)
+                except zmq.error.Again:
+                    break
+                if msg[:1] == b'\x01':
+                    self._on_subscribe(key, sock, msg[1:])
+                elif msg[:1] == b'\x00' and msg[1:] in self._interest:
+                    self._set_interest(self._interest - {msg[1:]})
+
+    def _on_subscribe(self, key, sock, topic):
+        """
+        Handle a subscription received on the given socket.
+
+        An endpoint is ready once all of its sockets completed the handshake.
+
+        :param key: tuple of endpoint index and lane name, as yielded by
+                    :meth:`hermes.Publisher._sockets`
+        :param sock: :class:`zmq.Socket` the subscription was received on
+        :param topic: subscribed topic frame prefix
+        :return: :class:`None`
+        """
+        if topic == WELCOME_FRAME and key not in self._ready_socks:
+            welcome = Envelope(WELCOME_TOPIC, self.name, ['Welcome'])
+            sock.send_multipart(welcome.convert_to_frames())
+        elif topic == READY_FRAME and key not in self._ready_socks:
+            log.debug("Publisher %s: %s is ready", self.name, self.endpoints[key[0]])
+            self._ready_socks.add(key)
+            per_endpoint = 1 + len(self._lane_socks)
+            ready = [i for i in range(len(self.endpoints))
+                     if sum(k[0] == i for k in self._ready_socks) == per_endpoint]
+            if ready and (self.routing == self.FAILOVER or len(ready) == len(self.endpoints)):
+                self._ready.set()
+        elif topic not in self._interest and not topic.startswith(RESERVED_FRAME):
+            self._set_interest(self._interest | {topic})
+
+    def _set_interest(self, interest):
+        """
+        Replace the set of subscribed topic frame prefixes, and reset the interest cache.
+
+        Both are replaced rather than modified, as they are read by publishing threads.
+        """
+        self._interest = interest
+        self._interest_cache = {}
+
+    def _update_connections(self):
+        """
+        Process pending socket monitor events and select the active failover endpoint.
+
+        The active endpoint is the first connected one in the order given, so the publisher
+        fails back once the primary endpoint reconnects. If none is connected, the primary
+        endpoint is used.
+        """
+        changed = False
+        for i, monitor in enumerate(self._monitors):
+            while True:
+                try:
+                    event = recv_monitor_message(monitor, zmq.NOBLOCK)['event']
+                except zmq.error.Again:
+                    break
+                self.connected[i] = event == zmq.EVENT_CONNECTED
+                changed = True
+        if not changed:
+            return
+        active = self.connected.index(True) if any(self.connected) else 0
+        if active != self._active:
+            log.warning("Publisher %s failing over from %s to %s", self.name,
+                        self.endpoints[self._active], self.endpoints[active])
+            self.failovers += 1
+            self._active = active
+
+    def _send(self, envelope, frames):
+        """
+        Send frames to the endpoints selected by the routing mode.
+
+        :param envelope: :class:`hermes.Envelope` the frames were converted from
+        :param frames: list of :class:`bytes`
+        :return: :class:`None`
+        """
+        socks = self.socks
+        if self._lane_socks:
+            socks = self._lane_socks.get(self.q.lane_for(envelope.topic).name, socks)
+        if len(socks) == 1:
+            socks[0].send_multipart(frames)
+        elif self.routing == self.BROADCAST:
+            for sock in socks:
+                sock.send_multipart(frames)
+        elif self.routing == self.HASH:
+            socks[shard(envelope.topic, len(socks))].send_multipart(frames)
+        else:
+            socks[self._active].send_multipart(frames)
+
+    def _admit(self, envelope):
+        """Check if the rate limits, if any, allow sending the given envelope now."""
+        return self.limiter is None or self.limiter.admit(envelope)
+
+    def _drain(self):
+        """
+        Dequeue a batch of envelopes as planned by the batcher, waiting for it to fill up.
+
+        The queue must not be empty.
+
+        :return: list of :class:`hermes.Envelope`
+        """
+        limit, linger = self.batcher.plan(self.q.qsize())
+        deadline = time.time() + linger
+        batch, dequeued = [], 0
+        while dequeued < limit:
+            try:
+                if dequeued and linger:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        break
+                    envelope = self.q.get(timeout=remaining)
+                else:
+                    envelope = self.q.get(block=False)
+            except Empty:
+                break
+            dequeued += 1
+            if self._admit(envelope):
+                batch.append(envelope)
+        return batch
+
+    def _send_batch(self, envelopes):
+        """
+        Send the given envelopes in one message per topic.
+
+        :param envelopes: list of :class:`hermes.Envelope`
+        :return: :class:`None`
+        """
+        for group in group_by_topic(envelopes):
+            trace = self.profiler.trace(self) if self.profiler is not None else None
+            frames = []
+            for envelope in group:
+                frames.extend(self._convert(envelope))
+            if trace is not None:
+                trace.mark('encode')
+            log.debug("Sending batch of %s envelopes on %r ..", len(group), group[0].topic)
+            self._send(group[0], frames)
+            if trace is not None:
+                trace.mark('send')
+            self.batcher.record(len(group))
+        self.batcher.sent(len(envelopes), time.time())
+
     def run(self):
         """
         Custumized run loop to publish data.
 
-        Sets up a ZMQ publisher socket and sends data as soon as it is available
+        Sets up a ZMQ publisher socket per endpoint and sends data as soon as it is available
         on the internal Queue at :attr:`hermes.Publisher.q`.
 
         :return: :class:`None`
         """
         self._running.set()
-        ctx = zmq.Context()
-        self.sock = ctx.socket(zmq.PUB)
-        log.info("Connecting Publisher to zmq.XSUB Socket at %s.." % self.pub_addr)
-        self.sock.connect(self.pub_addr)
+        self._connect()
         log.info("Success! Executing publisher loop..")
         while self._running.is_set():
-            if not self.q.empty():
-                cts_msg = self.q.get(block=False)
-                frames = cts_msg.convert_to_frames()
-                log.debug("Sending %r ..", cts_msg)
-                try:
-                    self.sock.send_multipart(frames)
-                except zmq.error.ZMQError as e:
-                    log.error("ZMQError while sending data (%s), "
-                              "stopping Publisher", e)
-                    break
-            else:
+            if self._monitors:
+                self._update_connections()
+            if self.handshake:
+                self._read_subscriptions()
+            if not self._ready.is_set():
                 continue
+            envelopes = self.limiter.due() if self.limiter else []
+            if not self.q.empty():
+                if self.batcher is not None:
+                    envelopes.extend(self._drain())
+                else:
+                    cts_msg = self.q.get(block=False)
+                    if self._admit(cts_msg):
+                        envelopes.append(cts_msg)
+            try:
+                if self.batcher is not None and envelopes:
+                    self._send_batch(envelopes)
+                    continue
+                for cts_msg in envelopes:
+                    trace = self.profiler.trace(self) if self.profiler is not None else None
+                    frames = self._convert(cts_msg)
+                    if trace is not None:
+                        trace.mark('encode')
+                    log.debug("Sending %r ..", cts_msg)
+                    self._send(cts_msg, frames)
+                    if trace is not None:
+                        trace.mark('send')
+            except zmq.error.ZMQError as e:
+                log.error("ZMQError while sending data (%s), "
+                          "stopping Publisher", e)
+                break
 
-        ctx.destroy()
-        self.sock = None
+        self._close()
         log.info("Loop terminated.")
-
@@ -0,0 +1,200 @@
+"""Per-topic rate limiting and sampling for Publishers.
+
+A :class:`hermes.ratelimit.RateLimit` describes a token bucket for all topics matching its
+prefixes; each topic gets a bucket of its own. An envelope may be sent if its bucket holds a
+token. Otherwise it is either dropped or, when coalescing, held back until the bucket refills,
+replacing any envelope held back for the same topic before - so a noisy feed still delivers
+its latest value, just less often.
+
+Sampling at most one envelope per topic every `min_interval` seconds is a token bucket with a
+rate of ``1 / min_interval`` and a burst size of one.
+
+Example::
+
+    limits = [RateLimit(topics=['book/'], min_interval=.1),
+              RateLimit(topics=['trades/'], rate=1000, burst=100, coalesce=False)]
+    publisher = Publisher('tcp://127.0.0.1:5560', 'pub', rate_limits=limits)
+"""
+
+# Import Built-Ins
+import logging
+import time
+from collections import Counter
+
+# Import Third-Party
+
+# Import Homebrew
+
+# Init Logging Facilities
+log = logging.getLogger(__name__)
+
+
+class RateLimit:
+    """Token bucket parameters for the topics matching a list of prefixes."""
+
+    def __init__(self, topics=None, rate=None, burst=1, min_interval=None, coalesce=True):
+        """
+        Initialize a :class:`hermes.ratelimit.RateLimit` instance.
+
+        :param topics: list of topic prefixes this limit applies to; all topics by default
+        :param rate: number of envelopes per second and topic
+        :param burst: number of envelopes which may be sent at once after an idle period
+        :param min_interval: minimum time in seconds between envelopes of a topic; overrides
+                             `rate` and `burst`
+        :param coalesce: hold back the latest throttled envelope instead of dropping it
+        """
+        if min_interval is not None:
+            if min_interval <= 0:
+                raise ValueError("min_interval must be positive, not %r" % min_interval)
+            rate, burst = 1.0 / min_interval, 1
+        if rate is None or rate <= 0:
+            raise ValueError("rate must be positive, not %r" % rate)
+        if burst < 1:
+            raise ValueError("burst must be at least 1, not %r" % burst)
+        self.topics = tuple(topics) if topics else ()
+        self.rate = rate
+        self.burst = burst
+        self.coalesce = coalesce
+
+    def matches(self, topic):
+        """
+        Check if this limit applies to the given topic.
+
+        :param topic: topic as :class:`str`
+        :return: :class:`bool`
+        """
+        return not self.topics or topic.startswith(self.topics)
+
+    def __repr__(self):
+        """Construct a basic string-representation of this limit."""
+        return 'RateLimit(topics=%r, rate=%r, burst=%r, coalesce=%r)' % (
+            list(self.topics), self.rate, self.burst, self.coalesce)
+
+
+class _Bucket:
+    """Token bucket state of a single topic."""
+
+    __slots__ = ('limit', 'tokens', 'last', 'pending')
+
+    def __init__(self, limit, now):
+        self.limit = limit
+        self.tokens = float(limit.burst)
+        self.last = now
+        self.pending = None
+
+    def refill(self, now):
+        """Add the tokens earned since the last refill, up to the burst size."""
+        self.tokens = min(self.limit.burst, self.tokens + (now - self.last) * self.limit.rate)
+        self.last = now
+
+    def next_token(self):
+        """Return the time at which the next token will be available."""
+        return self.last + (1 - self.tokens) / self.limit.rate
+
+
+class RateLimiter:
+    """
+    Apply a list of :class:`hermes.ratelimit.RateLimit` to envelopes, per topic.
+
+    Each topic is governed by the first limit matching it; topics matching none are not
+    limited. Not thread-safe; :class:`hermes.Publisher` only uses it from its run loop.
+    """
+
+    # Maximum number of topics to cache the bucket of.
+    CACHE_SIZE = 10000
+
+    def __init__(self, limits, clock=time.time):
+        """
+        Initialize a :class:`hermes.ratelimit.RateLimiter` instance.
+
+        :param limits: list of :class:`hermes.ratelimit.RateLimit`, in order of precedence
+        :param clock: callable returning the current time in seconds
+        """
+        self.limits = list(limits)
+        self.clock = clock
+        self.dropped = Counter()
+        self._buckets = {}
+        self._pending = {}
+        self._next_due = float('inf')
+
+    def _bucket(self, topic, now):
+        """Return the bucket of the given topic, or :class:`None` if it is not limited."""
+        try:
+            return self._buckets[topic]
+        except KeyError:
+            if len(self._buckets) > self.CACHE_SIZE:
+                # Keep buckets holding back envelopes, so none are lost.
+                self._buckets = {t: b for t, b in self._buckets.items()
+                                 if b is not None and b.pending is not None}
+            limit = next((lim for lim in self.limits if lim.matches(topic)), None)
+            bucket = self._buckets[topic] = _Bucket(limit, now) if limit else None
+            return bucket
+
+    @property
+    def pending(self):
+        """Return the number of envelopes currently held back."""
+        return len(self._pending)
+
+    def admit(self, envelope, now=None):
+        """
+        Check if the given envelope may be sent now.
+
+        Envelopes which may not are dropped, or held back if their limit coalesces; held
+        back envelopes are returned by :meth:`hermes.ratelimit.RateLimiter.due` once their
+        bucket refilled.
+
+        :param envelope: :class:`hermes.Envelope` instance
+        :param now: current time; defaults to the limiter's clock
+        :return: :class:`bool`
+        """
+        now = self.clock() if now is None else now
+        bucket = self._bucket(envelope.topic, now)
+        if bucket is None:
+            return True
+        bucket.refill(now)
+        if bucket.tokens >= 1:
+            bucket.tokens -= 1
+            if bucket.pending is not None:
+                # The new envelope supersedes the one held back.
+                self.dropped[envelope.topic] += 1
+                bucket.pending = None
+                del self._pending[envelope.topic]
+            return True
+        if bucket.limit.coalesce:
+            if bucket.pending is not None:
+                self.dropped[envelope.topic] += 1
+            else:
+                self._pending[envelope.topic] = bucket
+                self._next_due = min(self._next_due, bucket.next_token())
+            bucket.pending = envelope
+        else:
+            self.dropped[envelope.topic] += 1
+        return False
+
+    def due(self, now=None):
+        """
+        Return the held back envelopes whose buckets refilled, consuming their tokens.
+
+        Cheap to call in a loop: the buckets are only checked once the earliest of them is
+        due.
+
+        :param now: current time; defaults to the limiter's clock
+        :return: list of :class:`hermes.Envelope`
+        """
+        if not self._pending:
+            return []
+        now = self.clock() if now is None else now
+        if now < self._next_due:
+            return []
+        envelopes, next_due = [], float('inf')
+        for topic, bucket in list(self._pending.items()):
+            bucket.refill(now)
+            if bucket.tokens >= 1:
+                bucket.tokens -= 1
+                envelopes.append(bucket.pending)
+                bucket.pending = None
+                del self._pending[topic]
+            else:
+                next_due = min(next_due, bucket.next_token())
+        self._next_due = next_due
+        return envelopes
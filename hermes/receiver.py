@@ -3,6 +3,7 @@
 # Import Built-Ins
 import logging
 import time
+from collections import OrderedDict, deque
 from queue import Queue, Empty
 from threading import Thread, Event
 
@@ -10,36 +11,302 @@ from threading import Thread, Event
 import zmq
 
 # Import home-grown
-from hermes.structs import Envelope
+from hermes.batching import ENVELOPE_FRAMES, split_batch
+from hermes.clock import hop_latency
+from hermes.config import HEARTBEAT_TOPIC, PROBE_TOPIC
+from hermes.context import create_socket, get_context
+from hermes.dedup import LRUSet
+from hermes.executor import shard
+from hermes.lanes import LaneQueue, STRICT
+from hermes.structs import DECODE_ERRORS, Envelope, is_envelope, topic_frame
 
 # Init Logging Facilities
 log = logging.getLogger(__name__)
 
+# Topic frame of heartbeats, as sent by hermes.PostOffice.
+HEARTBEAT_FRAME = topic_frame(HEARTBEAT_TOPIC)
+
+
+class LagPolicy:
+    """
+    Thresholds for graduated handling of slow subscribers.
+
+    The lag of each received envelope is fed to an exponentially weighted moving average. Once
+    it exceeds the warning threshold, a warning is logged; above the catch-up threshold, the
+    :class:`hermes.Receiver` drains its socket and only keeps the newest envelope per topic.
+    At most `max_catch_ups` consecutive catch-ups are made; after that, all envelopes are
+    delivered again until the average lag drops below the warning threshold. Only if the
+    average lag then still exceeds the shutdown threshold, the receiver shuts down.
+    """
+
+    # pylint: disable=too-few-public-methods,too-many-arguments
+
+    def __init__(self, warn=0.5, catch_up=1.0, shutdown=5.0, smoothing=0.1, max_catch_ups=3):
+        """
+        Initialize a :class:`hermes.receiver.LagPolicy` instance.
+
+        :param warn: average lag in seconds above which a warning is logged
+        :param catch_up: average lag in seconds above which to skip to the latest envelopes
+        :param shutdown: average lag in seconds above which to shut down, once catching up
+                         failed `max_catch_ups` times in a row; `None` never shuts down
+        :param smoothing: weight of the newest sample in the moving average
+        :param max_catch_ups: number of consecutive catch-ups before shutting down, or before
+                              delivering all envelopes again if below the shutdown threshold
+        """
+        self.warn = warn
+        self.catch_up = catch_up
+        self.shutdown = shutdown
+        self.smoothing = smoothing
+        self.max_catch_ups = max_catch_ups
+
+
+class LagEstimator:
+    """Rolling estimate of the lag between publishing and receiving envelopes."""
+
+    # pylint: disable=too-many-instance-attributes
+
+    OK, WARN, CATCH_UP, SHUTDOWN = 'ok', 'warn', 'catch_up', 'shutdown'
+
+    def __init__(self, policy):
+        """
+        Initialize a :class:`hermes.receiver.LagEstimator` instance.
+
+        :param policy: :class:`hermes.receiver.LagPolicy` instance
+        """
+        self.policy = policy
+        self.last = 0.0
+        self.average = 0.0
+        self.max = 0.0
+        self.samples = 0
+        self.warnings = 0
+        self.catch_ups = 0
+        self.skipped = 0
+        self.state = self.OK
+        self._consecutive_catch_ups = 0
+
+    def update(self, lag):
+        """
+        Add a lag sample and return the action the :class:`hermes.Receiver` should take.
+
+        :param lag: lag of the latest envelope in seconds
+        :return: one of the state constants of this class
+        """
+        policy = self.policy
+        self.last = lag
+        self.samples += 1
+        self.max = max(self.max, lag)
+        self.average += policy.smoothing * (lag - self.average)
+
+        if self.average > policy.catch_up:
+            if self._consecutive_catch_ups < policy.max_catch_ups:
+                state = self.CATCH_UP
+            elif policy.shutdown is not None and self.average > policy.shutdown:
+                state = self.SHUTDOWN
+            else:
+                # Catching up did not help; stop dropping envelopes.
+                state = self.WARN
+        elif self.average > policy.warn:
+            state = self.WARN
+        else:
+            state = self.OK
+            self._consecutive_catch_ups = 0
+
+        if state == self.WARN and self.state == self.OK:
+            self.warnings += 1
+        self.state = state
+        return state
+
+    def caught_up(self, skipped, lag):
+        """
+        Record a catch-up which skipped `skipped` envelopes.
+
+        The moving average is reset to `lag`, the lag of the newest envelope kept.
+        """
+        self.catch_ups += 1
+        self._consecutive_catch_ups += 1
+        self.skipped += skipped
+        self.average = lag
+
+    @property
+    def stats(self):
+        """Return the current lag metrics as :class:`dict`."""
+        return {'state': self.state, 'last': self.last, 'average': self.average,
+                'max': self.max, 'samples': self.samples, 'warnings': self.warnings,
+                'catch_ups': self.catch_ups, 'skipped': self.skipped}
+
 
 class Receiver(Thread):
-    """Class providing a connection to one or many ZMQ Publisher(s)."""
+    """
+    Class providing a connection to one or many ZMQ Publisher(s).
+
+    Given a heartbeat timeout, the receiver subscribes to the heartbeats of the
+    :class:`hermes.PostOffice` it is connected to. If it receives nothing for longer than the
+    timeout, it connects to the next of its addresses, and disconnects from the silent one
+    after another timeout has passed. Envelopes received twice during this overlap, e.g. from
+    publishers sending to both PostOffices, are dropped.
+
+    With the handshake enabled, the receiver subscribes to a probe topic after its topics,
+    which the :class:`hermes.PostOffice` answers once it processed the subscriptions; see
+    :meth:`hermes.Receiver.start`. Messages on other topics reserved for hermes, see
+    :const:`hermes.config.RESERVED_PREFIX`, and messages which fail to decode are dropped.
+
+    Given a list of :class:`hermes.lanes.Lane`, received envelopes are queued per lane, and
+    :meth:`hermes.Receiver.recv` returns them in the order of the lanes' priorities; see
+    :mod:`hermes.lanes`.
+
+    Given a :class:`hermes.dedup.Deduplicator`, envelopes whose identity was received before,
+    e.g. from a redundant feed, are dropped before being queued; see :mod:`hermes.dedup`.
+
+    Given a number of partitions, envelopes are queued on one of several queues, chosen by a
+    stable hash of their topic, so several consumers can process them in parallel while each
+    topic's envelopes stay in order; see :meth:`hermes.Receiver.partition` and
+    :class:`hermes.executor.PartitionedNode`.
+
+    Given a :class:`hermes.profiling.StageProfiler`, the receiver times the stages a sampled
+    fraction of envelopes passes through; see :mod:`hermes.profiling`.
+    """
 
     # pylint: disable=too-many-instance-attributes
 
-    def __init__(self, sub_addr, name, topics=None, exchanges=None):
+    # Number of recent envelopes remembered to drop duplicates while failing over.
+    DEDUP_SIZE = 10000
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, sub_addr, name, topics=None, exchanges=None, ctx=None, lag_policy=None,
+                 clock=None, heartbeat_timeout=None, sockopts=None, handshake=False,
+                 lanes=None, scheduling=STRICT, dedup=None, partitions=None, profiler=None):
         """
         Initialize a Receiver instance.
 
-        :param sub_addr: Address to which this :class:`hermes.Receiver` binds to
-        :param topics: List of topics to subscribe to
+        :param sub_addr: Address to which this :class:`hermes.Receiver` connects to, or list
+                         of addresses to fail over between, in order of preference
+        :param topics: subscription prefix, or list of prefixes, of the JSON-encoded topic
+                       frame; see :func:`hermes.structs.topic_frame`
         :param exchanges: List of exchanges to subscribe to
         :param name: Name to give this :class:`hermes.Receiver` instance
+        :param ctx: :class:`zmq.Context` to use; defaults to the shared context
+        :param lag_policy: :class:`hermes.receiver.LagPolicy` to handle slow subscribers with
+        :param clock: :class:`hermes.clock.ClockSync` used to measure skew-corrected lag,
+                      assuming publishers stamp envelopes using the same reference clock
+        :param heartbeat_timeout: time in seconds without receiving anything, including
+                                  heartbeats, after which to fail over to the next address
+        :param sockopts: :class:`hermes.config.SocketOptions` overriding the process-wide
+                         :const:`hermes.config.SOCKET_OPTIONS`
+        :param handshake: probe the PostOffice to detect when subscriptions took effect
+        :param lanes: list of :class:`hermes.lanes.Lane` to queue envelopes in, in order of
+                      priority; a single FIFO queue by default
+        :param scheduling: scheduling policy between lanes, see :mod:`hermes.lanes`
+        :param dedup: :class:`hermes.dedup.Deduplicator` to drop duplicate envelopes with
+        :param partitions: number of queues to partition envelopes into by topic
+        :param profiler: :class:`hermes.profiling.StageProfiler` to time stages with
         """
-        self.zmq_context = zmq.Context()
+        self.ctx = ctx or get_context()
         self.sock = None
         self.sub_addr = sub_addr
-        self.timeout = 1
-        self._topics = topics if topics else ''
+        self.addresses = [sub_addr] if isinstance(sub_addr, str) else list(sub_addr)
+        self.heartbeat_timeout = heartbeat_timeout
+        self.sockopts = sockopts
+        self.handshake = handshake
+        self._probe = None
+        self._ready = Event()
+        self.active = 0
+        self.failovers = 0
+        self.duplicates = 0
+        self.last_heartbeat = None
+        self._last_seen = None
+        self._overlap = None
+        self._seen = LRUSet(self.DEDUP_SIZE)
+        self._batch = deque()
+        self.dedup = dedup
+        self.profiler = profiler
+        self.lag = LagEstimator(lag_policy or LagPolicy())
+        self.clock = clock
+        self._topics = [topics] if isinstance(topics, str) else list(topics or [''])
         self._exchanges = exchanges if exchanges else ''
-        self.q = Queue()
+        self._lanes, self._scheduling = lanes, scheduling
+        self.raw = False
+        self.queues = [self._new_queue()]
+        self.q = self.queues[0]
+        if partitions:
+            self.partition(partitions)
         self._running = Event()
         super(Receiver, self).__init__(name=name)
 
+    def _new_queue(self):
+        """Return a new queue, with the configured lanes, if any."""
+        return LaneQueue(self._lanes, self._scheduling) if self._lanes else Queue()
+
+    def partition(self, count, queue_factory=None, raw=False):
+        """
+        Partition received envelopes by topic into `count` queues; call before starting.
+
+        In raw mode, the queues receive the envelopes' frames instead, partitioned by their
+        topic frame, and decoding them is left to the consumers. Raw frames bypass exchange
+        filtering, deduplication and lag handling, which require decoding.
+
+        :param count: number of partitions
+        :param queue_factory: callable returning a new queue, e.g.
+                              :meth:`multiprocessing.context.BaseContext.Queue` to feed worker
+                              processes; defaults to the receiver's usual queue
+        :param raw: queue raw frames instead of decoded envelopes
+        :return: :class:`None`
+        """
+        if count < 1:
+            raise ValueError("count must be at least 1, not %r" % count)
+        self.queues = [(queue_factory or self._new_queue)() for _ in range(count)]
+        self.q = self.queues[0]
+        self.raw = raw
+
+    def depths(self):
+        """
+        Return the number of queued envelopes per partition.
+
+        :return: list of :class:`int`, or :class:`None` where a queue cannot tell
+        """
+        depths = []
+        for q in self.queues:
+            try:
+                depths.append(q.qsize())
+            except NotImplementedError:
+                depths.append(None)
+        return depths
+
+    def _enqueue(self, envelope):
+        """Put the envelope on the queue of its partition."""
+        if len(self.queues) == 1:
+            self.q.put(envelope)
+        else:
+            self.queues[shard(envelope.topic, len(self.queues))].put(envelope)
+
+    def start(self, wait=False, timeout=None):
+        """
+        Start the :class:`hermes.Receiver` instance.
+
+        :param wait: enable the handshake and block until it completed
+        :param timeout: maximum time in seconds to wait
+        :return: True if ready, False on timeout; :class:`None` if not waiting
+        """
+        if wait:
+            self.handshake = True
+        super(Receiver, self).start()
+        if wait:
+            return self.wait_ready(timeout)
+        return None
+
+    @property
+    def ready(self):
+        """Check if the socket is connected, and the handshake completed, if enabled."""
+        return self._ready.is_set()
+
+    def wait_ready(self, timeout=None):
+        """
+        Block until the :class:`hermes.Receiver` is ready.
+
+        :param timeout: maximum time in seconds to wait
+        :return: True if ready, False on timeout
+        """
+        return self._ready.wait(timeout)
+
     def stop(self, timeout=None):
         """
         Stop the :class:`hermes.Receiver` instance.
@@ -63,6 +330,139 @@ class Receiver(Thread):
         self._running.clear()
         super(Receiver, self).join(timeout=timeout)
 
+    @property
+    def lag_stats(self):
+        """Return the lag metrics of this :class:`hermes.Receiver` instance."""
+        return self.lag.stats
+
+    def _catch_up(self, envelope):
+        """
+        Drain the socket, keeping only the newest envelope per topic.
+
+        Only the kept envelopes are decoded. They are put on the queue in the order their topics
+        were last received. Heartbeats and handshake probes drained along the way are processed
+        as in :meth:`hermes.Receiver.run`.
+
+        :param envelope: the most recently received :class:`hermes.Envelope`
+        :return: :class:`None`
+        """
+        latest = OrderedDict()
+        drained = 0
+        while True:
+            try:
+                frames = self._recv_frames()
+            except zmq.error.Again:
+                break
+            if self._handle_control(frames) or not is_envelope(frames):
+                continue
+            if self.heartbeat_timeout:
+                self._last_seen = time.time()
+                if self._is_duplicate(frames):
+                    continue
+            drained += 1
+            latest.pop(frames[0], None)
+            latest[frames[0]] = frames
+
+        newest = {envelope.topic: envelope}
+        for frames in latest.values():
+            try:
+                env = Envelope.load_from_frames(frames)
+            except DECODE_ERRORS:
+                log.exception("Receiver %s: dropping malformed frames %r", self.name, frames)
+                continue
+            if self._exchanges and env.origin not in self._exchanges:
+                continue
+            newest.pop(env.topic, None)
+            newest[env.topic] = env
+
+        skipped = drained + 1 - len(newest)
+        lag = hop_latency(list(newest.values())[-1], self.clock)
+        self.lag.caught_up(skipped, lag)
+        log.warning("Receiver %s: caught up by skipping %s envelopes, lag is now %.3fs",
+                    self.name, skipped, lag)
+        for env in newest.values():
+            if self.dedup is None or not self.dedup.is_duplicate(env):
+                self._enqueue(env)
+
+    def _handle_control(self, frames):
+        """
+        Process heartbeat and handshake probe frames.
+
+        :param frames: list of :class:`bytes`
+        :return: True if the frames were control frames, False otherwise
+        """
+        if frames[0] == HEARTBEAT_FRAME:
+            self.last_heartbeat = self._last_seen = time.time()
+            return True
+        if self._probe is not None and frames[0] == self._probe:
+            self.sock.setsockopt(zmq.UNSUBSCRIBE, self._probe)
+            self._probe = None
+            self._ready.set()
+            return True
+        return False
+
+    def _fail_over(self, now):
+        """
+        Connect to the next address, keeping the current one until the overlap has passed.
+
+        With a single address, the receiver reconnects to it instead.
+
+        :param now: current time
+        :return: :class:`None`
+        """
+        silent = self.active
+        self.active = (self.active + 1) % len(self.addresses)
+        log.warning("Receiver %s: no data from %s for %.1fs, failing over to %s",
+                    self.name, self.addresses[silent], now - self._last_seen,
+                    self.addresses[self.active])
+        if self.active == silent:
+            self.sock.disconnect(self.addresses[silent])
+        elif self._overlap is not None:
+            self.sock.disconnect(self.addresses[self._overlap[0]])
+        self.sock.connect(self.addresses[self.active])
+        self._overlap = (silent, now + self.heartbeat_timeout) if self.active != silent else None
+        self._last_seen = now
+        self.failovers += 1
+
+    def _check_connection(self):
+        """Fail over if the current address is silent, and end overlaps which passed."""
+        now = time.time()
+        if self._overlap is not None and now >= self._overlap[1]:
+            self.sock.disconnect(self.addresses[self._overlap[0]])
+            self._overlap = None
+            self._seen.clear()
+        if now - self._last_seen > self.heartbeat_timeout:
+            self._fail_over(now)
+
+    def _is_duplicate(self, frames):
+        """
+        Check if the given frames were received before, during a fail-over overlap.
+
+        :param frames: list of :class:`bytes`
+        :return: True if the frames are a duplicate, False otherwise
+        """
+        if self._overlap is None:
+            return False
+        if self._seen.seen((frames[0], frames[1], frames[-1])):
+            self.duplicates += 1
+            return True
+        return False
+
+    def _recv_frames(self):
+        """
+        Return the frames of the next envelope, splitting batches sent by a Publisher.
+
+        :raises zmq.error.Again: if no message is available
+        :return: list of :class:`bytes`
+        """
+        if self._batch:
+            return self._batch.popleft()
+        frames = self.sock.recv_multipart(flags=zmq.NOBLOCK)
+        if len(frames) > ENVELOPE_FRAMES:
+            self._batch.extend(split_batch(frames))
+            return self._batch.popleft()
+        return frames
+
     def run(self):
         """
         Execute the custom run loop for the :class:`hermes.Receiver` class.
@@ -73,55 +473,107 @@ class Receiver(Thread):
         :return: :class:`None`
         """
         self._running.set()
-        ctx = zmq.Context()
-        self.sock = ctx.socket(zmq.SUB)
+        self.sock = create_socket(self.ctx, zmq.SUB, self.sockopts)
         log.info("Setting sockopts to subscribe to topics %r.." % self._topics)
-        self.sock.setsockopt_unicode(zmq.SUBSCRIBE, self._topics)
-        log.info("Connecting Publisher to zmq.XPUB Socket at %s.." % self.sub_addr)
-        self.sock.connect(self.sub_addr)
+        for topic in self._topics:
+            self.sock.setsockopt_unicode(zmq.SUBSCRIBE, topic)
+        if self.heartbeat_timeout:
+            self.sock.setsockopt(zmq.SUBSCRIBE, HEARTBEAT_FRAME)
+        if self.handshake:
+            self._probe = topic_frame('%s/%s/%x' % (PROBE_TOPIC, self.name, id(self)))
+            self.sock.setsockopt(zmq.SUBSCRIBE, self._probe)
+        log.info("Connecting Publisher to zmq.XPUB Socket at %s.." % self.addresses[0])
+        self.sock.connect(self.addresses[0])
+        self._last_seen = time.time()
+        if not self.handshake:
+            self._ready.set()
         log.info("Success! Executing receiver loop..")
 
         while self._running.is_set():
             try:
-                frames = self.sock.recv_multipart(flags=zmq.NOBLOCK)
+                frames = self._recv_frames()
             except zmq.error.Again:
+                if self.heartbeat_timeout:
+                    self._check_connection()
+                continue
+
+            if self._handle_control(frames):
+                continue
+            if not is_envelope(frames):
+                # Handshake traffic of other components, or not an envelope at all.
+                continue
+            if self.heartbeat_timeout:
+                self._last_seen = time.time()
+                if self._is_duplicate(frames):
+                    continue
+            if self.raw:
+                self.queues[shard(frames[0], len(self.queues))].put(frames)
                 continue
 
+            trace = self.profiler.trace(self) if self.profiler is not None else None
             try:
                 envelope = Envelope.load_from_frames(frames)
-            except KeyError as e:
-                log.exception(e)
-                log.error(frames)
+            except DECODE_ERRORS:
+                log.exception("Receiver %s: dropping malformed frames %r", self.name, frames)
                 continue
+            if trace is not None:
+                trace.mark('decode')
 
             log.debug("run(): Received %r", envelope)
 
             if self._exchanges and envelope.origin not in self._exchanges:
                 continue
+            if self.dedup is not None and self.dedup.is_duplicate(envelope):
+                continue
 
-            recv_at = time.time()
-            if recv_at - float(envelope.ts) > self.timeout:
+            previous = self.lag.state
+            latency = hop_latency(envelope, self.clock)
+            state = self.lag.update(latency)
+            if state == LagEstimator.SHUTDOWN:
                 log.error("Reciever %s: Receiver cannot keep up with publisher "
-                          "(message delay(%s) > %s)! Cannot take peer "
+                          "(average delay %.3fs > %s) despite catching up! Cannot take peer "
                           "pressure, committing suicide.",
-                          self.name, recv_at - envelope.ts, self.timeout)
+                          self.name, self.lag.average, self.lag.policy.shutdown)
                 self._running.clear()
                 continue
+            if state == LagEstimator.CATCH_UP:
+                self._catch_up(envelope)
+                continue
+            if state == LagEstimator.WARN and previous == LagEstimator.OK:
+                log.warning("Receiver %s: falling behind publisher (average delay %.3fs)",
+                            self.name, self.lag.average)
+            elif state == LagEstimator.WARN and previous == LagEstimator.CATCH_UP:
+                log.warning("Receiver %s: still behind publisher after %s catch-ups "
+                            "(average delay %.3fs, %s envelopes skipped in total); delivering "
+                            "all envelopes", self.name, self.lag.policy.max_catch_ups,
+                            self.lag.average, self.lag.skipped)
 
-            self.q.put(envelope)
+            if trace is not None:
+                trace.mark('filter')
+                self.profiler.record('transit', latency)
+                self.profiler.enqueued(envelope)
+            self._enqueue(envelope)
+            if trace is not None:
+                trace.mark('enqueue')
 
-        ctx.destroy()
+        self.sock.close()
         self.sock = None
+        self._ready.clear()
         log.info("Loop terminated.")
 
-    def recv(self, block=False, timeout=None):
+    def recv(self, block=False, timeout=None, partition=0):
         """
         Wrap around :meth:`Queue.get()`.
 
         Returns the popped value or :class:`None` if the :class:`queue.Queue` is empty.
 
+        :param partition: index of the partition to receive from
         :return: data or :class:`None`
         """
-        if not self.q.empty():
-            return self.q.get(block, timeout)
+        q = self.queues[partition]
+        if not q.empty():
+            envelope = q.get(block, timeout)
+            if self.profiler is not None:
+                self.profiler.dequeued(envelope)
+            return envelope
         return None
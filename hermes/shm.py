@@ -0,0 +1,315 @@
+"""Shared-memory transport for Nodes running on the same host.
+
+Even over ``ipc://``, every message sent between processes costs socket system calls and
+copies. :class:`hermes.shm.ShmPublisher` instead writes the frames of each envelope into a
+ring buffer in shared memory, which any number of :class:`hermes.shm.ShmReceiver` instances
+on the same host read from, without any system call on either side.
+
+The ring consists of a header holding the write cursor - the number of envelopes written so
+far - followed by a fixed number of fixed-size slots. Envelope `n` is written to slot
+``n % slots``, guarded by a sequence lock: the slot's sequence number is odd while it is
+written, and ``2 * n + 2`` once envelope `n` is complete. Each receiver keeps its own read
+cursor. The publisher never waits for receivers; a receiver which falls more than a full ring
+behind skips to the oldest envelope still available, and counts the envelopes it missed in
+:attr:`hermes.shm.ShmReceiver.dropped`.
+
+Both classes implement the facility interface of :class:`hermes.Node`, so they can be used in
+place of a :class:`hermes.Publisher` and :class:`hermes.Receiver`. Unlike those, they are not
+threads: publishing writes to the ring from the calling thread, and receiving reads from it.
+
+Requires Python 3.8 or later, for :mod:`multiprocessing.shared_memory`.
+"""
+
+# Import Built-Ins
+import logging
+import os
+import struct
+import time
+
+try:
+    from multiprocessing import resource_tracker
+    from multiprocessing.shared_memory import SharedMemory
+except ImportError:
+    SharedMemory = None
+
+# Import Third-Party
+
+# Import Homebrew
+from hermes.structs import Envelope
+
+# Init Logging Facilities
+log = logging.getLogger(__name__)
+
+# Ring header: write cursor, number of slots, slot size.
+_HEADER = struct.Struct('<QII')
+# Slot header: sequence number, payload length.
+_SLOT = struct.Struct('<QI')
+_CURSOR = struct.Struct('<Q')
+_LENGTH = struct.Struct('<I')
+
+DEFAULT_SLOTS = 4096
+DEFAULT_SLOT_SIZE = 4096
+
+# Names of the rings created by this process.
+_CREATED = set()
+
+# Give up the CPU between polls of an empty ring, so a spinning receiver does not starve the
+# publisher on hosts with fewer cores than busy processes.
+_yield = getattr(os, 'sched_yield', lambda: time.sleep(0))
+
+
+def _require_shared_memory():
+    """Raise :exc:`RuntimeError` if shared memory is not available."""
+    if SharedMemory is None:
+        raise RuntimeError("The shm transport requires multiprocessing.shared_memory "
+                           "(Python 3.8+)")
+
+
+def _inherited_tracker():
+    """Check if this process uses the resource tracker of its parent process."""
+    # pylint: disable=protected-access
+    tracker = getattr(resource_tracker, '_resource_tracker', None)
+    return tracker is not None and tracker._fd is not None and tracker._pid is None
+
+
+def _attach(name):
+    """Attach to an existing shared memory segment, without tracking it for cleanup."""
+    try:
+        return SharedMemory(name, track=False)
+    except TypeError:
+        pass
+    # Before Python 3.13, attaching registers the segment with the resource tracker, which
+    # would unlink it once this process exits. Withdraw this segment's registration again -
+    # unless it may be the creator's: the tracker keeps a single registration per segment, and
+    # spawned processes share the tracker of their parent.
+    shared = _inherited_tracker()
+    shm = SharedMemory(name)
+    if name not in _CREATED and not shared:
+        resource_tracker.unregister(shm._name, 'shared_memory')  # pylint: disable=protected-access
+    return shm
+
+
+def pack_frames(frames):
+    """
+    Serialize a list of frames to a single :class:`bytes` object.
+
+    :param frames: list of :class:`bytes`
+    :return: :class:`bytes`
+    """
+    parts = [_LENGTH.pack(len(frames))]
+    for frame in frames:
+        parts.append(_LENGTH.pack(len(frame)))
+        parts.append(frame)
+    return b''.join(parts)
+
+
+def unpack_frames(payload):
+    """
+    Deserialize frames packed by :func:`hermes.shm.pack_frames`.
+
+    :param payload: :class:`bytes`
+    :return: list of :class:`bytes`
+    """
+    count, = _LENGTH.unpack_from(payload, 0)
+    offset = _LENGTH.size
+    frames = []
+    for _ in range(count):
+        length, = _LENGTH.unpack_from(payload, offset)
+        offset += _LENGTH.size
+        frames.append(payload[offset:offset + length])
+        offset += length
+    return frames
+
+
+class ShmPublisher:
+    """Write envelopes to a shared-memory ring buffer; there must only be one per ring."""
+
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(self, ring, name, slots=DEFAULT_SLOTS, slot_size=DEFAULT_SLOT_SIZE,
+                 compressor=None):
+        """
+        Initialize a :class:`hermes.shm.ShmPublisher` instance.
+
+        :param ring: name of the shared memory segment to create
+        :param name: Name to give this :class:`hermes.shm.ShmPublisher` instance
+        :param slots: number of envelopes the ring holds
+        :param slot_size: maximum size in bytes of a serialized envelope
+        :param compressor: :class:`hermes.compression.Compressor` applied to data frames
+        """
+        self.ring = ring
+        self.name = name
+        self.slots = slots
+        self.slot_size = slot_size
+        self.compressor = compressor
+        self.published = 0
+        self._shm = None
+        self._buf = None
+        self._header_cache = {}
+
+    def start(self):
+        """Create the shared memory segment."""
+        _require_shared_memory()
+        self._shm = SharedMemory(self.ring, create=True,
+                                 size=_HEADER.size + self.slots * self.slot_size)
+        _CREATED.add(self.ring)
+        self._buf = self._shm.buf
+        _HEADER.pack_into(self._buf, 0, 0, self.slots, self.slot_size)
+        log.info("Created shm ring %s (%s slots of %s bytes)", self.ring, self.slots,
+                 self.slot_size)
+
+    def stop(self):
+        """Close and remove the shared memory segment."""
+        if self._shm is None:
+            return
+        self._buf = None
+        self._shm.close()
+        self._shm.unlink()
+        _CREATED.discard(self.ring)
+        self._shm = None
+
+    def publish(self, envelope):
+        """
+        Write the given envelope to the ring.
+
+        :param envelope: :class:`hermes.Envelope` instance
+        :raises ValueError: if the serialized envelope exceeds the slot size
+        :return: True if the envelope was written, False if the publisher is not started
+        """
+        if self._buf is None:
+            return False
+        frames = envelope.convert_to_frames(compressor=self.compressor,
+                                            header_cache=self._header_cache)
+        return self.publish_frames(frames)
+
+    def publish_frames(self, frames):
+        """
+        Write the given frames to the ring.
+
+        :param frames: list of :class:`bytes`
+        :raises ValueError: if the serialized frames exceed the slot size
+        :return: True
+        """
+        payload = pack_frames(frames)
+        if len(payload) > self.slot_size - _SLOT.size:
+            raise ValueError("Envelope of %s bytes exceeds slot size of %s bytes"
+                             % (len(payload), self.slot_size))
+        buf, n = self._buf, self.published
+        offset = _HEADER.size + (n % self.slots) * self.slot_size
+        _CURSOR.pack_into(buf, offset, 2 * n + 1)
+        _LENGTH.pack_into(buf, offset + _CURSOR.size, len(payload))
+        start = offset + _SLOT.size
+        buf[start:start + len(payload)] = payload
+        _CURSOR.pack_into(buf, offset, 2 * n + 2)
+        self.published = n + 1
+        _CURSOR.pack_into(buf, 0, n + 1)
+        return True
+
+
+class ShmReceiver:
+    """Read envelopes from a shared-memory ring buffer written by a ShmPublisher."""
+
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(self, ring, name, topics=None, from_start=False):
+        """
+        Initialize a :class:`hermes.shm.ShmReceiver` instance.
+
+        :param ring: name of the shared memory segment to read from
+        :param name: Name to give this :class:`hermes.shm.ShmReceiver` instance
+        :param topics: list of topic prefixes to receive; receives all topics by default
+        :param from_start: read all envelopes still in the ring, instead of only new ones
+        """
+        self.ring = ring
+        self.name = name
+        self.topics = tuple(topics) if topics else None
+        self.from_start = from_start
+        self.cursor = 0
+        self.dropped = 0
+        self._shm = None
+        self._buf = None
+        self._slots = None
+        self._slot_size = None
+
+    def start(self, timeout=None):
+        """
+        Attach to the shared memory segment.
+
+        :param timeout: time in seconds to wait for the segment to be created
+        :raises FileNotFoundError: if the segment does not exist within `timeout`
+        :return: :class:`None`
+        """
+        _require_shared_memory()
+        deadline = time.time() + (timeout or 0)
+        while True:
+            try:
+                self._shm = _attach(self.ring)
+                break
+            except FileNotFoundError:
+                if time.time() >= deadline:
+                    raise
+                time.sleep(.01)
+        self._buf = self._shm.buf
+        written, self._slots, self._slot_size = _HEADER.unpack_from(self._buf, 0)
+        self.cursor = max(0, written - self._slots) if self.from_start else written
+
+    def stop(self):
+        """Detach from the shared memory segment."""
+        if self._shm is None:
+            return
+        self._buf = None
+        self._shm.close()
+        self._shm = None
+
+    def recv_frames(self):
+        """
+        Read the next envelope's frames from the ring.
+
+        :return: list of :class:`bytes`, or :class:`None` if no new envelope is available
+        """
+        buf = self._buf
+        while True:
+            n = self.cursor
+            written, = _CURSOR.unpack_from(buf, 0)
+            if n >= written:
+                return None
+            if written - n > self._slots:
+                self._skip(written - self._slots)
+                continue
+            offset = _HEADER.size + (n % self._slots) * self._slot_size
+            seq, length = _SLOT.unpack_from(buf, offset)
+            if seq == 2 * n + 2:
+                start = offset + _SLOT.size
+                payload = bytes(buf[start:start + length])
+                if _CURSOR.unpack_from(buf, offset)[0] == seq:
+                    self.cursor = n + 1
+                    return unpack_frames(payload)
+            # The slot was overwritten before or while reading it.
+            self._skip(max(n + 1, _CURSOR.unpack_from(buf, 0)[0] - self._slots))
+
+    def _skip(self, cursor):
+        """Skip envelopes which were overwritten, up to `cursor`."""
+        log.warning("ShmReceiver %s fell behind, skipping %s envelopes", self.name,
+                    cursor - self.cursor)
+        self.dropped += cursor - self.cursor
+        self.cursor = cursor
+
+    def recv(self, block=False, timeout=None):
+        """
+        Return the next envelope, or :class:`None` if none is available.
+
+        :param block: poll until an envelope is available
+        :param timeout: maximum time in seconds to poll, if blocking
+        :return: :class:`hermes.Envelope` or :class:`None`
+        """
+        deadline = time.time() + timeout if block and timeout is not None else None
+        while True:
+            frames = self.recv_frames()
+            if frames is None:
+                if not block or (deadline is not None and time.time() >= deadline):
+                    return None
+                _yield()
+                continue
+            envelope = Envelope.load_from_frames(frames)
+            if self.topics is None or envelope.topic.startswith(self.topics):
+                return envelope
@@ -6,9 +6,44 @@ import time
 import sys
 from functools import reduce
 
+from hermes.compression import is_compressed, decompress
+from hermes.config import HOST_ID, RESERVED_PREFIX
 
 log = logging.getLogger(__name__)
 
+# Cache of the attribute names returned by Message._slots(), per class.
+_SLOTS = {}
+
+
+def topic_frame(topic, encoding='utf-8'):
+    """
+    Return the topic frame of envelopes sent on the given topic.
+
+    Subscribing to this frame matches exactly the envelopes sent on `topic`.
+
+    :param topic: topic as :class:`str`
+    :param encoding: the encoding to us for :meth:`str.encode()`
+    :return: :class:`bytes`
+    """
+    return json.dumps(topic).encode(encoding)
+
+
+# Prefix of the topic frames of reserved topics, see hermes.config.RESERVED_PREFIX.
+RESERVED_FRAME = topic_frame(RESERVED_PREFIX)[:-1]
+
+# Errors raised by Envelope.load_from_frames() on malformed frames.
+DECODE_ERRORS = (IndexError, KeyError, TypeError, ValueError)
+
+
+def is_envelope(frames):
+    """
+    Check if the given frames are those of an envelope on a topic which is not reserved.
+
+    :param frames: list of :class:`bytes`, as received by :meth:`zmq.Socket.recv_multipart`
+    :return: :class:`bool`
+    """
+    return len(frames) == 4 and not frames[0].startswith(RESERVED_FRAME)
+
 
 class Envelope:
     """Transport Object for data being sent between hermes components via ZMQ.
@@ -18,14 +53,26 @@ class Envelope:
 
     They track topic and origin of the data they transport, as well as the
     timestamp it was last updated at. Updates occur automatically whenever
-    :meth:`hermes.Envelope.serialize` is called.
+    :meth:`hermes.Envelope.convert_to_frames` is called, unless re-stamping is disabled.
     This timestamp can be used to detect Slow-Subscriber-Syndrome by :class:`hermes.Receiver` and
     to initiate the suicidal snail pattern.
+
+    Additionally, they carry the id of the host they were created on and the time they were
+    last sent at. The latter is stamped by :meth:`hermes.Envelope.convert_to_frames`, in the
+    timebase of a :class:`hermes.clock.ClockSync` if the sending :class:`hermes.Publisher`
+    has one. Receivers using the same reference clock can thus compute per-hop latencies
+    which are corrected for clock skew between hosts.
+
+    By default, the timestamp frame contains the plain timestamp only, so envelopes can be read
+    by older versions. Send time and host are transmitted only if requested, in the extended
+    timestamp frame ``[ts, sent, host]``; both formats are accepted when loading envelopes, the
+    send time defaulting to the timestamp if missing.
     """
 
-    __slots__ = ['topic', 'origin', 'data', 'ts']
+    __slots__ = ['topic', 'origin', 'data', 'ts', 'sent', 'host']
 
-    def __init__(self, topic_tree, origin, data, ts=None):
+    # pylint: disable=too-many-arguments
+    def __init__(self, topic_tree, origin, data, ts=None, sent=None, host=None):
         """Initialize an :class:`hermes.Envelope` instance.
 
         :param topic_tree: topic this data belongs to
@@ -33,11 +80,16 @@ class Envelope:
         :param data: data struct transported by this instance
         :param ts: timestamp of this message, defaults to current unix ts if
                    None
+        :param sent: time this message was last sent at, defaults to ts
+        :param host: id of the host this message was created on, defaults to
+                     :const:`hermes.config.HOST_ID`
         """
         self.topic = topic_tree
         self.origin = origin
         self.data = data
         self.ts = ts or time.time()
+        self.sent = sent or self.ts
+        self.host = host or HOST_ID
 
     def __repr__(self):
         """Construct a basic string-represenation of this class instance."""
@@ -50,14 +102,20 @@ class Envelope:
         Load json to a new :class:`hermes.Envelope` instance.
 
         Automatically converts to string if the passed object is
-        a :class:`bytes.encode()` object.
+        a :class:`bytes.encode()` object. Data frames compressed by a
+        :class:`hermes.compression.Compressor` are decompressed transparently.
 
         :param frames: Frames, as received by :meth:`zmq.socket.recv_multipart`
         :param encoding: The encoding to use for :meth:`bytes.encode()`; default UTF-8
         :return: :class:`hermes.Envelope` instance
         """
         encoding = encoding if encoding else 'utf-8'
+        if is_compressed(frames[2]):
+            frames = frames[0], frames[1], decompress(frames[2]), frames[3]
         topic, origin, data, ts = [json.loads(x.decode(encoding)) for x in frames]
+        sent = host = None
+        if isinstance(ts, list):
+            ts, sent, host = ts
         data_dtype = data[0]
 
         def load_class_from_string(class_name):
@@ -68,29 +126,60 @@ class Envelope:
         except AttributeError:
             pass
 
-        return Envelope(topic, origin, data, ts)
+        return Envelope(topic, origin, data, ts, sent, host)
 
-    def convert_to_frames(self, encoding=None):
+    # pylint: disable=too-many-arguments
+    def convert_to_frames(self, encoding=None, compressor=None, sent=None, restamp=True,
+                          header_cache=None, extended=False):
         """
         Encode the :class:`hermes.Envelope` attributes as a list of json-serialized strings.
 
         :param encoding: the encoding to us for :meth:`str.encode()`, default UTF-8
+        :param compressor: :class:`hermes.compression.Compressor` to compress the data
+                           frame with, if given
+        :param sent: send timestamp to stamp this envelope with, defaults to the current time
+        :param restamp: update the creation timestamp as well; disable this when forwarding
+                        envelopes, to preserve the time they were originally created at
+        :param header_cache: :class:`dict` to cache encoded topic and origin frames in, keyed
+                             by (topic, origin); must only be shared for a single encoding
+        :param extended: transmit send time and host in an extended timestamp frame, which
+                         receivers running versions before its introduction cannot read
         :return: list of :class:`bytes`
         """
         encoding = encoding if encoding else 'utf-8'
-        self.update_ts()
-
-        topic = json.dumps(self.topic).encode(encoding)
-        origin = json.dumps(self.origin).encode(encoding)
-        ts = json.dumps(self.ts).encode(encoding)
+        if restamp:
+            self.ts = time.time()
+            self.sent = sent or self.ts
+        else:
+            self.sent = sent or time.time()
+
+        if header_cache is None:
+            topic, origin = self._encode_header(encoding)
+        else:
+            try:
+                topic, origin = header_cache[(self.topic, self.origin)]
+            except KeyError:
+                topic, origin = self._encode_header(encoding)
+                header_cache[(self.topic, self.origin)] = topic, origin
+        if extended:
+            ts = json.dumps([self.ts, self.sent, self.host]).encode(encoding)
+        else:
+            ts = json.dumps(self.ts).encode(encoding)
 
         try:
             data = self.data.serialize(encoding)
         except AttributeError:
             data = json.dumps(self.data).encode(encoding)
 
+        if compressor is not None:
+            data = compressor.compress(data, self.topic)
+
         return topic, origin, data, ts
 
+    def _encode_header(self, encoding):
+        """Return the topic and origin frames of this :class:`hermes.Envelope`."""
+        return json.dumps(self.topic).encode(encoding), json.dumps(self.origin).encode(encoding)
+
     def update_ts(self):
         """Update the :class:`hermes.Envelope` timestamp."""
         self.ts = time.time()
@@ -123,6 +212,17 @@ class Message:
         self.ts = time.time() if not ts else ts
         self.dtype = self._class_to_string()
 
+    @classmethod
+    def empty(cls):
+        """
+        Create an uninitialized instance, to be populated by :meth:`hermes.Message.load`.
+
+        Used by :meth:`hermes.Envelope.load_from_frames`.
+
+        :return: :class:`hermes.Message`
+        """
+        return cls.__new__(cls)
+
     def load(self, data):
         """
         Load data into a new data struct.
@@ -156,11 +256,16 @@ class Message:
 
         :return: :class:`list`, copy of __slots__
         """
+        try:
+            return list(_SLOTS[type(self)])
+        except KeyError:
+            pass
         slot_attrs = []
         class_slots = [cls for cls in reversed(type(self).__mro__[:-1])]
         for cls in class_slots:
             for attr in cls.__slots__:
                 slot_attrs.append(attr)
+        _SLOTS[type(self)] = tuple(slot_attrs)
         return slot_attrs
 
     def _class_to_string(self):
@@ -176,3 +281,63 @@ class Message:
         attributes_as_strings = attributes_as_strings[:-2] + ')'
         s = "{0}{1}".format(self._class_to_string(), attributes_as_strings)
         return s
+
+
+class OrderBook(Message):
+    """
+    Level 2 order book snapshot or delta.
+
+    `bids` and `asks` are lists of ``[price, size]`` pairs. In a snapshot, they contain the
+    complete book; in a delta, only the changed levels, where a size of 0 removes the level.
+    `seq` is an optional sequence number used to detect gaps between deltas.
+    """
+
+    __slots__ = ['exchange', 'pair', 'bids', 'asks', 'snapshot', 'seq']
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, exchange, pair, bids, asks, snapshot=False, seq=None, ts=None):
+        """
+        Initialize a :class:`hermes.structs.OrderBook` instance.
+
+        :param exchange: name of the exchange
+        :param pair: name of the traded pair
+        :param bids: list of [price, size] pairs
+        :param asks: list of [price, size] pairs
+        :param snapshot: True if this is a complete snapshot of the book
+        :param seq: sequence number of this update
+        :param ts: timestamp at which the message was created.
+        """
+        super(OrderBook, self).__init__(ts)
+        self.exchange = exchange
+        self.pair = pair
+        self.bids = bids
+        self.asks = asks
+        self.snapshot = snapshot
+        self.seq = seq
+
+
+class WindowResult(Message):
+    """
+    Result of a windowed aggregation, as published by :class:`hermes.aggregation.AggregationNode`.
+
+    `values` maps aggregator names to their values over the window from `start` to `end`.
+    """
+
+    __slots__ = ['key', 'start', 'end', 'values']
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, key, start, end, values, ts=None):
+        """
+        Initialize a :class:`hermes.structs.WindowResult` instance.
+
+        :param key: key the window was kept for, usually a topic
+        :param start: timestamp the window starts at
+        :param end: timestamp the window ends at
+        :param values: :class:`dict` mapping aggregator names to values
+        :param ts: timestamp at which the message was created.
+        """
+        super(WindowResult, self).__init__(ts)
+        self.key = key
+        self.start = start
+        self.end = end
+        self.values = values
@@ -0,0 +1,348 @@
+r"""Run :class:`hermes.Node` instances in separate processes.
+
+All hermes components are threads, so Nodes running in the same process share one GIL. The
+:class:`hermes.supervisor.Supervisor` launches each Node described by a
+:class:`hermes.supervisor.NodeSpec` in its own process (using the `spawn` start method),
+optionally pinned to a set of CPU cores. It restarts crashed Nodes with an exponential back-off,
+according to their restart policy, and aggregates the heartbeats they send into a health report.
+
+Nodes are wired through a :class:`hermes.PostOffice`, which the supervisor can host itself; use
+``ipc://`` or ``tcp://`` addresses for it, as ``inproc://`` does not cross process boundaries.
+
+The supervisor can also be started from the command line::
+
+    hermes-supervisor --xsub ipc:///tmp/hermes-in --xpub ipc:///tmp/hermes-out \\
+        mypackage.nodes:make_ticker@0 mypackage.nodes:make_bars@1,2
+
+Each factory given on the command line is called with `name`, `pub_addr` and `sub_addr`
+keyword arguments and must return a :class:`hermes.Node` instance.
+"""
+
+# Import Built-Ins
+import argparse
+import importlib
+import logging
+import multiprocessing
+import os
+import queue
+import sys
+import time
+from threading import Thread, Event
+
+# Import Third-Party
+
+# Import Homebrew
+from hermes.proxy import PostOffice
+
+# Init Logging Facilities
+log = logging.getLogger(__name__)
+
+
+class NodeSpec:
+    """
+    Definition of a :class:`hermes.Node` to be run in its own process.
+
+    The restart policy determines when the supervisor restarts the Node's process:
+
+    * :attr:`hermes.supervisor.NodeSpec.ON_FAILURE` restarts it if it exits with a non-zero
+      code or is killed by a signal, e.g. after its run loop raised an exception.
+    * :attr:`hermes.supervisor.NodeSpec.ALWAYS` restarts it whenever it exits, including
+      Nodes whose run loop returned.
+    * :attr:`hermes.supervisor.NodeSpec.NEVER` never restarts it.
+    """
+
+    # pylint: disable=too-few-public-methods,too-many-arguments
+
+    # Restart policies.
+    ALWAYS, ON_FAILURE, NEVER = 'always', 'on-failure', 'never'
+
+    def __init__(self, name, factory, args=None, kwargs=None, cpus=None, restart=ON_FAILURE):
+        """
+        Initialize a :class:`hermes.supervisor.NodeSpec` instance.
+
+        :param name: name of the Node process
+        :param factory: callable returning a :class:`hermes.Node`, or its import path as
+                        'package.module:attribute'. Callables must be picklable, i.e. defined
+                        at module level.
+        :param args: positional arguments passed to the factory
+        :param kwargs: keyword arguments passed to the factory
+        :param cpus: iterable of CPU core ids to pin the process to
+        :param restart: restart policy; True and False are accepted for
+                        :attr:`hermes.supervisor.NodeSpec.ON_FAILURE` and
+                        :attr:`hermes.supervisor.NodeSpec.NEVER`
+        """
+        if restart is True or restart is False:
+            restart = self.ON_FAILURE if restart else self.NEVER
+        if restart not in (self.ALWAYS, self.ON_FAILURE, self.NEVER):
+            raise ValueError("Unknown restart policy %r" % restart)
+        self.name = name
+        self.factory = factory
+        self.args = tuple(args or ())
+        self.kwargs = dict(kwargs or {})
+        self.cpus = set(cpus) if cpus is not None else None
+        self.restart = restart
+
+    def should_restart(self, exitcode):
+        """
+        Check if the Node's process should be restarted after exiting with the given code.
+
+        :param exitcode: exit code of the process; negative if it was killed by a signal
+        :return: :class:`bool`
+        """
+        if self.restart == self.ALWAYS:
+            return True
+        return self.restart == self.ON_FAILURE and exitcode != 0
+
+    def build(self):
+        """Import the factory if necessary and return the :class:`hermes.Node` it creates."""
+        factory = self.factory
+        if isinstance(factory, str):
+            module, _, attr = factory.partition(':')
+            factory = getattr(importlib.import_module(module), attr)
+        return factory(*self.args, **self.kwargs)
+
+
+def _set_affinity(cpus):
+    """Pin the current process to the given CPU cores, if supported by the platform."""
+    if cpus is None:
+        return
+    try:
+        os.sched_setaffinity(0, cpus)
+    except AttributeError:
+        log.warning("CPU affinity is not supported on this platform, ignoring cpus=%r", cpus)
+
+
+def _run_node(spec, health_q, stop_event, interval):
+    """
+    Entry point of a Node process.
+
+    Builds and starts the Node, executes its run loop in a thread and reports its health
+    to the supervisor every `interval` seconds, until `stop_event` is set or the run loop
+    terminates. Exits with a non-zero code if the run loop raised an exception.
+    """
+    _set_affinity(spec.cpus)
+    node = spec.build()
+    errors = []
+
+    def run():
+        """Execute the Node's run loop, recording any exception raised."""
+        try:
+            node.run()
+        except Exception as e:  # pylint: disable=broad-except
+            log.exception(e)
+            errors.append(e)
+
+    node.start()
+    runner = Thread(target=run, name='%s-run' % spec.name, daemon=True)
+    runner.start()
+    while not stop_event.wait(interval) and runner.is_alive():
+        facilities = {f.name: f.is_alive() if hasattr(f, 'is_alive') else True
+                      for f in node._facilities if f}  # pylint: disable=protected-access
+        health_q.put((spec.name, os.getpid(), time.time(), facilities))
+    node.stop()
+    runner.join(interval)
+    if errors:
+        sys.exit(1)
+
+
+class Supervisor(Thread):
+    """
+    Launch, monitor and restart Node processes.
+
+    The supervisor is a thread itself, and can thus be stopped and started like any other
+    hermes component.
+    """
+
+    # pylint: disable=too-many-instance-attributes,too-many-arguments
+
+    def __init__(self, specs, proxy_in=None, proxy_out=None, heartbeat_interval=1.0,
+                 max_restarts=5, restart_backoff=1.0, name='Supervisor'):
+        """
+        Initialize a :class:`hermes.supervisor.Supervisor` instance.
+
+        :param specs: iterable of :class:`hermes.supervisor.NodeSpec` instances
+        :param proxy_in: if given together with `proxy_out`, the supervisor hosts a
+                         :class:`hermes.PostOffice` with these addresses
+        :param proxy_out: see `proxy_in`
+        :param heartbeat_interval: interval in seconds at which Nodes report their health
+        :param max_restarts: maximum number of restarts per Node
+        :param restart_backoff: delay in seconds before the first restart, doubled with
+                                each subsequent restart
+        :param name: Name to give this :class:`hermes.supervisor.Supervisor` instance
+        """
+        self.specs = {spec.name: spec for spec in specs}
+        self.heartbeat_interval = heartbeat_interval
+        self.max_restarts = max_restarts
+        self.restart_backoff = restart_backoff
+        self.post_office = None
+        if proxy_in and proxy_out:
+            self.post_office = PostOffice(proxy_in, proxy_out)
+        self._mp = multiprocessing.get_context('spawn')
+        self._health_q = self._mp.Queue()
+        self._processes = {}
+        self._stop_events = {}
+        self._restarts = {name: 0 for name in self.specs}
+        self._next_restart = {}
+        self._heartbeats = {}
+        self._running = Event()
+        super(Supervisor, self).__init__(name=name)
+
+    def _launch(self, name):
+        """Start the process of the Node with the given name."""
+        spec = self.specs[name]
+        stop_event = self._mp.Event()
+        process = self._mp.Process(target=_run_node, name=name,
+                                   args=(spec, self._health_q, stop_event,
+                                         self.heartbeat_interval))
+        process.start()
+        log.info("Launched Node %s (pid %s, cpus %r)", name, process.pid, spec.cpus)
+        self._processes[name] = process
+        self._stop_events[name] = stop_event
+
+    def start(self):
+        """Start the PostOffice, if any, all Node processes and the monitoring loop."""
+        if self.post_office:
+            self.post_office.start()
+        self._running.set()
+        for name in self.specs:
+            self._launch(name)
+        super(Supervisor, self).start()
+
+    def stop(self, timeout=None):
+        """
+        Stop all Node processes, the PostOffice and the monitoring loop.
+
+        Processes which do not exit within `timeout` seconds are terminated.
+
+        :param timeout: time in seconds to wait for each process to exit
+        :return: :class:`None`
+        """
+        log.info("Stopping Supervisor instance..")
+        self._running.clear()
+        self.join(timeout)
+        for stop_event in self._stop_events.values():
+            stop_event.set()
+        for name, process in self._processes.items():
+            process.join(timeout)
+            if process.is_alive():
+                log.warning("Node %s did not exit in time, terminating it.", name)
+                process.terminate()
+                process.join()
+        if self.post_office:
+            self.post_office.stop()
+        log.info("..done.")
+
+    def _collect_heartbeats(self):
+        """Drain the health queue."""
+        while True:
+            try:
+                name, pid, ts, facilities = self._health_q.get_nowait()
+            except queue.Empty:
+                return
+            self._heartbeats[name] = {'pid': pid, 'ts': ts, 'facilities': facilities}
+
+    def _check_processes(self):
+        """Restart Node processes which exited while the supervisor is running."""
+        now = time.time()
+        for name, process in self._processes.items():
+            if process.is_alive() or not self._running.is_set():
+                continue
+            spec = self.specs[name]
+            if not spec.should_restart(process.exitcode):
+                continue
+            if self._restarts[name] >= self.max_restarts:
+                continue
+            if name not in self._next_restart:
+                delay = self.restart_backoff * 2 ** self._restarts[name]
+                log.error("Node %s exited with code %s, restarting in %.1fs",
+                          name, process.exitcode, delay)
+                self._next_restart[name] = now + delay
+            elif now >= self._next_restart[name]:
+                del self._next_restart[name]
+                self._restarts[name] += 1
+                self._launch(name)
+
+    def run(self):
+        """
+        Monitor the Node processes until the supervisor is stopped.
+
+        :return: :class:`None`
+        """
+        while self._running.is_set():
+            self._collect_heartbeats()
+            self._check_processes()
+            time.sleep(min(self.heartbeat_interval, .1))
+
+    def health(self):
+        """
+        Return the health of all Nodes.
+
+        A Node is considered healthy if its process is alive and its last heartbeat is no
+        older than three heartbeat intervals.
+
+        :return: dict mapping Node names to dicts with keys `pid`, `alive`, `healthy`,
+                 `exitcode`, `restarts`, `last_heartbeat` and `facilities`
+        """
+        self._collect_heartbeats()
+        now = time.time()
+        report = {}
+        for name, process in list(self._processes.items()):
+            heartbeat = self._heartbeats.get(name, {})
+            last = heartbeat.get('ts')
+            alive = process.is_alive()
+            report[name] = {
+                'pid': process.pid, 'alive': alive, 'exitcode': process.exitcode,
+                'restarts': self._restarts[name], 'last_heartbeat': last,
+                'facilities': heartbeat.get('facilities', {}),
+                'healthy': bool(alive and heartbeat.get('pid') == process.pid and
+                                last and now - last <= 3 * self.heartbeat_interval)}
+        return report
+
+    @property
+    def healthy(self):
+        """Check if all Nodes are healthy."""
+        return all(h['healthy'] for h in self.health().values())
+
+
+def _parse_spec(arg, pub_addr, sub_addr):
+    """Parse a 'module:factory[@cpu,cpu..]' command line argument to a NodeSpec."""
+    factory, _, cpus = arg.partition('@')
+    cpus = [int(c) for c in cpus.split(',')] if cpus else None
+    name = factory.rpartition(':')[2]
+    return NodeSpec(name, factory, cpus=cpus,
+                    kwargs={'name': name, 'pub_addr': pub_addr, 'sub_addr': sub_addr})
+
+
+def main(argv=None):
+    """Run a :class:`hermes.supervisor.Supervisor` from the command line."""
+    parser = argparse.ArgumentParser(description="Run hermes Nodes in separate processes.")
+    parser.add_argument('--xsub', required=True,
+                        help="address of the PostOffice socket facing publishers")
+    parser.add_argument('--xpub', required=True,
+                        help="address of the PostOffice socket facing receivers")
+    parser.add_argument('--no-proxy', action='store_true',
+                        help="don't host a PostOffice, connect to an existing one")
+    parser.add_argument('--max-restarts', type=int, default=5)
+    parser.add_argument('--heartbeat-interval', type=float, default=1.0)
+    parser.add_argument('nodes', nargs='+', metavar='module:factory[@cpu,..]')
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    specs = [_parse_spec(arg, args.xsub, args.xpub) for arg in args.nodes]
+    proxy = (None, None) if args.no_proxy else (args.xsub, args.xpub)
+    supervisor = Supervisor(specs, *proxy, heartbeat_interval=args.heartbeat_interval,
+                            max_restarts=args.max_restarts)
+    supervisor.start()
+    try:
+        while True:
+            time.sleep(10 * args.heartbeat_interval)
+            for name, health in sorted(supervisor.health().items()):
+                log.info("%s: %r", name, health)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        supervisor.stop(timeout=5)
+
+
+if __name__ == '__main__':
+    main()
@@ -27,5 +27,7 @@ setup(name='hermes-zmq',
                    'Programming Language :: Python :: 3 :: Only',
                    'Topic :: Office/Business :: Financial :: Investment'],
       package_data={'': ['*.md', '*.rst']},
+      entry_points={'console_scripts': ['hermes-supervisor=hermes.supervisor:main',
+                                        'hermes-loadgen=hermes.loadgen:main']},
       keywords="zmq pubsub ipc distributed messaging", python_requires=">=3.5")
 
@@ -0,0 +1,110 @@
+# Import Built-Ins
+import logging
+import random
+import unittest
+from unittest import mock
+
+# Import Homebrew
+from hermes import Envelope, Publisher
+from hermes.aggregation import AggregationNode, SlidingWindow, TumblingWindow
+from hermes.aggregation import Count, Max, Min, OHLC, Sum, VWAP
+from hermes.structs import WindowResult
+
+# Init Logging Facilities
+log = logging.getLogger(__name__)
+
+AGGREGATORS = {'volume': Sum, 'trades': Count, 'low': Min, 'high': Max, 'vwap': VWAP,
+               'ohlc': OHLC}
+
+
+class AggregationTests(unittest.TestCase):
+
+    def test_TumblingWindow_emits_closed_windows(self):
+        window = TumblingWindow(10, AGGREGATORS)
+        self.assertEqual(window.update('BTC', 1, 100.0, 1.0), [])
+        self.assertEqual(window.update('BTC', 5, 102.0, 3.0), [])
+        self.assertEqual(window.update('ETH', 6, 10.0, 1.0), [])
+        self.assertEqual(window.update('BTC', 9, 99.0, 1.0), [])
+        results = window.update('BTC', 12, 101.0, 1.0)
+        # Crossing the window boundary closes the windows of all keys.
+        self.assertEqual(sorted(r.key for r in results), ['BTC', 'ETH'])
+        result = next(r for r in results if r.key == 'BTC')
+        self.assertIsInstance(result, WindowResult)
+        self.assertEqual((result.key, result.start, result.end), ('BTC', 0, 10))
+        self.assertEqual(result.values['volume'], 5.0)
+        self.assertEqual(result.values['trades'], 3)
+        self.assertEqual(result.values['low'], 99.0)
+        self.assertEqual(result.values['high'], 102.0)
+        self.assertAlmostEqual(result.values['vwap'], (100 + 306 + 99) / 5)
+        self.assertEqual(result.values['ohlc'], [100.0, 102.0, 99.0, 99.0])
+
+        self.assertEqual(window.update('ETH', 15, 10.0, 1.0), [])
+        flushed = window.flush(now=25)
+        self.assertEqual(sorted(r.key for r in flushed), ['BTC', 'ETH'])
+        self.assertEqual(window.flush(now=25), [])
+
+    def test_TumblingWindow_drops_late_samples(self):
+        window = TumblingWindow(10, AGGREGATORS)
+        window.update('BTC', 1, 100.0, 1.0)
+        window.update('BTC', 12, 101.0, 1.0)
+        # Belongs to the emitted window [0, 10).
+        self.assertEqual(window.update('BTC', 8, 90.0, 5.0), [])
+        self.assertEqual(window.late, 1)
+        result, = window.update('BTC', 21, 102.0, 1.0)
+        self.assertEqual((result.start, result.values['trades']), (10, 1))
+        self.assertEqual(result.values['low'], 101.0)
+
+        # Also after the window was flushed.
+        window.flush(now=40)
+        self.assertEqual(window.update('BTC', 25, 90.0, 1.0), [])
+        self.assertEqual(window.late, 2)
+        self.assertEqual(window.update('BTC', 31, 90.0, 1.0), [])
+        self.assertEqual(window.late, 2)
+
+    def test_SlidingWindow_matches_full_recomputation(self):
+        window = SlidingWindow(5, AGGREGATORS)
+        rng = random.Random(42)
+        samples = []
+        ts = 0.0
+        for _ in range(500):
+            ts += rng.random()
+            price, size = rng.uniform(90, 110), rng.uniform(0.1, 2)
+            samples.append((ts, price, size))
+            result, = window.update('BTC', ts, price, size)
+            live = [s for s in samples if s[0] > ts - 5]
+            prices = [s[1] for s in live]
+            self.assertEqual(result.values['trades'], len(live))
+            self.assertEqual(result.values['low'], min(prices))
+            self.assertEqual(result.values['high'], max(prices))
+            self.assertAlmostEqual(result.values['volume'], sum(s[2] for s in live))
+            self.assertAlmostEqual(result.values['vwap'],
+                                   sum(p * s for _, p, s in live) / sum(s[2] for s in live))
+            self.assertEqual(result.values['ohlc'], [prices[0], max(prices), min(prices),
+                                                     prices[-1]])
+
+    def test_SlidingWindow_respects_emit_interval(self):
+        window = SlidingWindow(60, {'trades': Count}, emit_interval=1)
+        emitted = [window.update('BTC', ts / 10, 100.0, 1.0) for ts in range(25)]
+        self.assertEqual(sum(len(r) for r in emitted), 3)
+        self.assertEqual(window.value('BTC'), {'trades': 25})
+
+    def test_AggregationNode_publishes_results(self):
+        publisher = mock.Mock(Publisher)
+        node = AggregationNode('bars', TumblingWindow(10, {'vwap': VWAP}), publisher=publisher)
+        for ts, price in ((1, 100.0), (2, 102.0), (11, 101.0)):
+            envelope = Envelope('trades/BTC', 'testsuite', ['Trade', price, 1.0])
+            envelope.ts = ts
+            node.aggregate(envelope)
+        self.assertEqual(publisher.publish.call_count, 1)
+        envelope = publisher.publish.call_args[0][0]
+        self.assertEqual(envelope.topic, 'agg/trades/BTC/bars')
+        self.assertEqual(envelope.data.values, {'vwap': 101.0})
+
+        frames = envelope.convert_to_frames()
+        loaded = Envelope.load_from_frames(frames).data
+        self.assertIsInstance(loaded, WindowResult)
+        self.assertEqual(loaded.values, {'vwap': 101.0})
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,79 @@
+# Import Built-Ins
+import logging
+import time
+import unittest
+
+# Import Homebrew
+from hermes import Envelope, Publisher, Receiver
+from hermes.batching import AdaptiveBatcher, group_by_topic, split_batch
+from hermes.batching import BURST, IMMEDIATE, LINGER
+from hermes.proxy import PostOffice
+
+# Init Logging Facilities
+log = logging.getLogger(__name__)
+
+
+class BatchingTests(unittest.TestCase):
+
+    def test_batches_are_split_into_envelopes(self):
+        envelopes = [Envelope('batch', 'testsuite', ['Raw', i]) for i in range(3)]
+        frames = [f for e in envelopes for f in e.convert_to_frames()]
+        split = split_batch(frames)
+        self.assertEqual([Envelope.load_from_frames(f).data for f in split],
+                         [e.data for e in envelopes])
+        single = list(envelopes[0].convert_to_frames())
+        self.assertEqual(split_batch(single), [single])
+        self.assertEqual(split_batch([b'probe']), [[b'probe']])
+
+    def test_envelopes_are_grouped_by_topic_in_order(self):
+        envelopes = [Envelope(t, 'testsuite', ['Raw', i]) for i, t in enumerate('abab')]
+        groups = group_by_topic(envelopes)
+        self.assertEqual([[e.data[1] for e in g] for g in groups], [[0, 2], [1, 3]])
+
+    def test_batcher_adapts_to_load(self):
+        batcher = AdaptiveBatcher(max_latency=.001, max_batch=100)
+        self.assertEqual(batcher.plan(1), (1, 0.0))
+        self.assertEqual(batcher.mode, IMMEDIATE)
+        self.assertEqual(batcher.plan(500), (100, 0.0))
+        self.assertEqual(batcher.mode, BURST)
+        for i in range(100):
+            batcher.sent(10, i * .001)
+        self.assertGreater(batcher.rate, 5000)
+        limit, linger = batcher.plan(1)
+        self.assertEqual(batcher.mode, LINGER)
+        self.assertEqual(limit, 100)
+        self.assertLessEqual(linger, .001)
+        for size in (1, 2, 3, 100):
+            batcher.record(size)
+        self.assertEqual(batcher.stats()['histogram'], {1: 1, 2: 1, 4: 1, 128: 1})
+        self.assertRaises(ValueError, AdaptiveBatcher, max_latency=0)
+
+    def test_Receiver_receives_batched_envelopes_in_order(self):
+        proxy = PostOffice("tcp://127.0.0.1:5787", "tcp://127.0.0.1:5788")
+        receiver = Receiver("tcp://127.0.0.1:5788", 'batch_recv')
+        publisher = Publisher("tcp://127.0.0.1:5787", 'batch_pub', max_batch_latency=.005)
+        proxy.start()
+        try:
+            self.assertTrue(receiver.start(wait=True, timeout=2))
+            self.assertTrue(publisher.start(wait=True, timeout=2))
+            for i in range(200):
+                publisher.publish(Envelope('topic%d' % (i % 2), 'testsuite', ['Raw', i]))
+            received = []
+            deadline = time.time() + 2
+            while len(received) < 200 and time.time() < deadline:
+                envelope = receiver.recv()
+                if envelope is not None:
+                    received.append(envelope)
+            for topic in ('topic0', 'topic1'):
+                values = [e.data[1] for e in received if e.topic == topic]
+                self.assertEqual(values, sorted(values))
+                self.assertEqual(len(values), 100)
+            self.assertTrue(any(size > 1 for size in publisher.batcher.histogram))
+        finally:
+            publisher.stop()
+            receiver.stop()
+            proxy.stop()
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
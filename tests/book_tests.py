@@ -0,0 +1,89 @@
+# Import Built-Ins
+import logging
+import unittest
+from unittest import mock
+
+# Import Homebrew
+from hermes import Envelope, Publisher
+from hermes.book import Book, BookNode
+from hermes.structs import OrderBook
+
+# Init Logging Facilities
+log = logging.getLogger(__name__)
+
+
+def snapshot(seq=1):
+    return OrderBook('bitfinex', 'BTC-USD', [['100.0', '1'], ['99.5', '2'], ['99.0', '3']],
+                     [['100.5', '1'], ['101.0', '2']], snapshot=True, seq=seq)
+
+
+class BookTests(unittest.TestCase):
+
+    def test_snapshot_and_deltas_are_applied(self):
+        book = Book('bitfinex', 'BTC-USD')
+        self.assertTrue(book.apply(snapshot()))
+        self.assertEqual(book.best_bid, (100.0, 1.0))
+        self.assertEqual(book.best_ask, (100.5, 1.0))
+
+        delta = OrderBook('bitfinex', 'BTC-USD', [['100.0', '0'], ['99.75', '5']],
+                          [['100.25', '4']], seq=2)
+        self.assertTrue(book.apply(delta))
+        self.assertEqual(book.best_bid, (99.75, 5.0))
+        self.assertEqual(book.best_ask, (100.25, 4.0))
+        self.assertEqual(book.bids.top(2), [[99.75, 5.0], [99.5, 2.0]])
+        self.assertEqual(book.asks.top(10), [[100.25, 4.0], [100.5, 1.0], [101.0, 2.0]])
+        self.assertEqual(len(book.bids), 3)
+
+    def test_deltas_are_ignored_until_snapshot_and_after_gaps(self):
+        book = Book('bitfinex', 'BTC-USD')
+        delta = OrderBook('bitfinex', 'BTC-USD', [['98', '1']], [], seq=1)
+        self.assertFalse(book.apply(delta))
+        self.assertIsNone(book.best_bid)
+        book.apply(snapshot(seq=1))
+        gap = OrderBook('bitfinex', 'BTC-USD', [['98', '1']], [], seq=5)
+        self.assertFalse(book.apply(gap))
+        self.assertFalse(book.synced)
+        self.assertTrue(book.apply(snapshot(seq=6)))
+
+    def test_OrderBook_is_loaded_from_frames(self):
+        frames = Envelope('book', 'testsuite', snapshot()).convert_to_frames()
+        loaded = Envelope.load_from_frames(frames).data
+        self.assertIsInstance(loaded, OrderBook)
+        self.assertEqual(loaded.pair, 'BTC-USD')
+        self.assertTrue(loaded.snapshot)
+        self.assertEqual(loaded.asks, [['100.5', '1'], ['101.0', '2']])
+
+    def test_BookNode_publishes_conflated_views(self):
+        publisher = mock.Mock(Publisher)
+        node = BookNode('books', publisher=publisher, depth=1)
+        updates = [snapshot()] + [OrderBook('bitfinex', 'BTC-USD', [['100.0', str(i)]], [],
+                                            seq=i) for i in range(2, 12)]
+        for update in updates:
+            node.apply(Envelope('raw', 'testsuite', update))
+        node.publish_views(node.books.values())
+        self.assertEqual(publisher.publish.call_count, 1)
+        envelope = publisher.publish.call_args[0][0]
+        self.assertEqual(envelope.topic, 'book/bitfinex/BTC-USD/books')
+        self.assertEqual(envelope.data.bids, [[100.0, 11.0]])
+        self.assertEqual(envelope.data.asks, [[100.5, 1.0]])
+
+    def test_BookNode_publishes_views_after_max_drain_envelopes(self):
+        publisher = mock.Mock(Publisher)
+        receiver = mock.Mock()
+        updates = [snapshot()] + [OrderBook('bitfinex', 'BTC-USD', [['100.0', str(i)]], [],
+                                            seq=i) for i in range(2, 12)]
+        receiver.recv.side_effect = [Envelope('raw', 'testsuite', u) for u in updates] + [None]
+        node = BookNode('books', receiver=receiver, publisher=publisher, depth=1, max_drain=4)
+        self.assertEqual(node.drain(), 4)
+        self.assertEqual(publisher.publish.call_count, 1)
+        self.assertEqual(publisher.publish.call_args[0][0].data.bids, [[100.0, 4.0]])
+        self.assertEqual(node.drain(), 4)
+        self.assertEqual(node.drain(), 3)
+        self.assertEqual(publisher.publish.call_count, 3)
+        self.assertEqual(publisher.publish.call_args[0][0].data.bids, [[100.0, 11.0]])
+        with self.assertRaises(ValueError):
+            BookNode('books', max_drain=0)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
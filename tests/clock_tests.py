@@ -0,0 +1,53 @@
+# Import Built-Ins
+import logging
+import time
+import unittest
+
+# Import Homebrew
+from hermes import Envelope
+from hermes.clock import ClockSync, hop_latency
+from hermes.proxy import PostOffice
+
+# Init Logging Facilities
+log = logging.getLogger(__name__)
+
+
+class ClockTests(unittest.TestCase):
+
+    def test_offset_is_taken_from_sample_with_lowest_delay(self):
+        clock = ClockSync("tcp://127.0.0.1:5760")
+        self.assertFalse(clock.synced)
+        # Reference clock 10s ahead, answer delayed by queuing on the way back.
+        clock.add_sample(100.0, 110.1, 100.4)
+        # Reference clock 10s ahead, symmetric round-trip.
+        clock.add_sample(200.0, 210.05, 200.1)
+        self.assertTrue(clock.synced)
+        self.assertAlmostEqual(clock.offset, 10.0)
+        self.assertAlmostEqual(clock.delay, .1)
+
+    def test_hop_latency_is_corrected_by_clock_offset(self):
+        clock = ClockSync("tcp://127.0.0.1:5760")
+        clock.add_sample(100.0, 150.0, 100.0)
+        envelope = Envelope('test', 'testsuite', ['data'])
+        envelope.sent = time.time() + 50 - 1
+        self.assertAlmostEqual(hop_latency(envelope, clock), 1, places=2)
+        self.assertAlmostEqual(hop_latency(envelope), -49, places=2)
+
+    def test_ClockSync_syncs_with_PostOffice(self):
+        proxy = PostOffice("tcp://127.0.0.1:5761", "tcp://127.0.0.1:5762",
+                           clock_addr="tcp://127.0.0.1:5763")
+        proxy.start()
+        clock = ClockSync("tcp://127.0.0.1:5763", interval=.1)
+        clock.start()
+        try:
+            self.assertTrue(clock.wait(5))
+            # Both share the same host clock.
+            self.assertLess(abs(clock.offset), .01)
+            self.assertLess(clock.delay, .1)
+        finally:
+            clock.stop()
+            proxy.stop()
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
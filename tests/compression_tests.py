@@ -0,0 +1,64 @@
+# Import Built-Ins
+import logging
+import json
+import unittest
+
+# Import Homebrew
+from hermes import Envelope, compression
+from hermes.compression import Compressor, available_codecs, register_dictionary
+from hermes.compression import train_dictionary, is_compressed, decompress
+
+# Init Logging Facilities
+log = logging.getLogger(__name__)
+
+
+def book_snapshot(i):
+    bids = [[str(100.0 - n * 0.5), str(1.5 + n), i] for n in range(50)]
+    asks = [[str(100.5 + n * 0.5), str(2.5 + n), i] for n in range(50)]
+    return ['Snapshot', 'BTC-USD', bids, asks]
+
+
+class CompressionTests(unittest.TestCase):
+
+    def test_small_frames_are_not_compressed(self):
+        compressor = Compressor('zlib', threshold=512)
+        frame = json.dumps(['Raw', 'small']).encode('utf-8')
+        self.assertEqual(compressor.compress(frame), frame)
+        self.assertFalse(is_compressed(frame))
+
+    def test_all_available_codecs_roundtrip_through_envelope(self):
+        for codec in available_codecs():
+            compressor = Compressor(codec, threshold=64)
+            env = Envelope('book/BTC-USD', 'testsuite', book_snapshot(1))
+            frames = env.convert_to_frames(compressor=compressor)
+            self.assertTrue(is_compressed(frames[2]), codec)
+            self.assertLess(len(frames[2]), len(json.dumps(env.data)))
+            loaded = Envelope.load_from_frames(frames)
+            self.assertEqual(loaded.data, env.data)
+
+    def test_unavailable_codec_falls_back_to_zlib(self):
+        self.assertEqual(Compressor('snappy').codec, 'zlib')
+
+    def test_per_topic_dictionaries_are_used_by_prefix(self):
+        samples = [json.dumps(book_snapshot(i)).encode('utf-8') for i in range(200)]
+        register_dictionary('book', train_dictionary(samples, size=4096))
+        for codec in available_codecs():
+            compressor = Compressor(codec, threshold=64, dictionaries={'book/': 'book'})
+            data = json.dumps(book_snapshot(500)).encode('utf-8')
+            with_dict = compressor.compress(data, 'book/BTC-USD')
+            without_dict = compressor.compress(data, 'trades/BTC-USD')
+            self.assertIn(b'book', with_dict[:8])
+            self.assertEqual(decompress(with_dict), data)
+            self.assertEqual(decompress(without_dict), data)
+
+    def test_unknown_dictionary_raises_key_error(self):
+        register_dictionary('temporary', b'{"some": "dictionary"}')
+        compressor = Compressor('zlib', threshold=1, dictionaries={'': 'temporary'})
+        frame = compressor.compress(b'{"some": "payload"}')
+        del compression._DICTIONARIES['temporary']
+        with self.assertRaises(KeyError):
+            decompress(frame)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
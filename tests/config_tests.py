@@ -0,0 +1,51 @@
+# Import Built-Ins
+import logging
+import time
+import unittest
+from unittest import mock
+
+# Import Third-Party
+import zmq
+
+# Import Homebrew
+from hermes import Publisher
+from hermes.config import SocketOptions, LOW_LATENCY, HIGH_THROUGHPUT
+from hermes.context import create_socket, get_context
+
+# Init Logging Facilities
+log = logging.getLogger(__name__)
+
+
+class SocketOptionsTests(unittest.TestCase):
+
+    def test_overrides_take_precedence(self):
+        merged = HIGH_THROUGHPUT.merge(SocketOptions(sndhwm=10, immediate=True))
+        self.assertEqual(merged.sndhwm, 10)
+        self.assertEqual(merged.rcvhwm, HIGH_THROUGHPUT.rcvhwm)
+        self.assertTrue(merged.immediate)
+        self.assertEqual(HIGH_THROUGHPUT.merge(None).items(), HIGH_THROUGHPUT.items())
+
+    def test_options_must_be_ints(self):
+        self.assertRaises(TypeError, SocketOptions, sndhwm='1000')
+        self.assertRaises(TypeError, SocketOptions, linger=1.5)
+
+    def test_options_are_applied_to_sockets(self):
+        with mock.patch('hermes.config.SOCKET_OPTIONS', LOW_LATENCY):
+            sock = create_socket(get_context(), zmq.SUB, SocketOptions(rcvhwm=42))
+            self.assertEqual(sock.getsockopt(zmq.RCVHWM), 42)
+            self.assertEqual(sock.getsockopt(zmq.SNDHWM), LOW_LATENCY.sndhwm)
+            self.assertEqual(sock.getsockopt(zmq.LINGER), 0)
+            self.assertEqual(sock.getsockopt(zmq.IMMEDIATE), 1)
+            sock.close()
+
+        publisher = Publisher("tcp://127.0.0.1:5730", 'TestPub',
+                              sockopts=SocketOptions(sndhwm=7, sndbuf=65536))
+        publisher.start()
+        time.sleep(.1)
+        self.assertEqual(publisher.sock.getsockopt(zmq.SNDHWM), 7)
+        self.assertEqual(publisher.sock.getsockopt(zmq.SNDBUF), 65536)
+        publisher.stop()
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
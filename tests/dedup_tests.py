@@ -0,0 +1,103 @@
+# Import Built-Ins
+import logging
+import time
+import unittest
+
+# Import Third-Party
+import zmq
+
+# Import Homebrew
+from hermes import Envelope, Receiver
+from hermes.dedup import Deduplicator, LRUSet, RotatingBloomFilter, content_key, field_key
+from hermes.pipeline import Deduplicate, Pipeline
+from hermes.structs import OrderBook
+
+# Init Logging Facilities
+log = logging.getLogger(__name__)
+
+
+def trade(origin, trade_id, price=6500.0):
+    return Envelope('trades/BTC-USD', origin, ['Trade', trade_id, price])
+
+
+class DedupTests(unittest.TestCase):
+
+    def test_LRUSet_is_bounded_by_size_and_age(self):
+        now = [0]
+        keys = LRUSet(3, ttl=10, clock=lambda: now[0])
+        self.assertEqual([keys.seen(k) for k in 'abca'], [False, False, False, True])
+        keys.seen('d')
+        self.assertEqual(len(keys), 3)
+        self.assertFalse(keys.seen('b'))
+        now[0] = 20
+        self.assertFalse(keys.seen('a'))
+        self.assertEqual(len(keys), 1)
+        self.assertRaises(ValueError, LRUSet, 0)
+
+    def test_RotatingBloomFilter_remembers_recent_keys(self):
+        keys = RotatingBloomFilter(1000, error_rate=0.01)
+        self.assertLess(sum(keys.seen('key%d' % i) for i in range(1000)), 50)
+        self.assertTrue(all(keys.seen('key%d' % i) for i in range(1000)))
+        false_positives = sum(keys.seen('new%d' % i) for i in range(1000))
+        self.assertLess(false_positives, 50)
+        for i in range(2000):
+            keys.seen('later%d' % i)
+        self.assertLess(sum(keys.seen('key%d' % i) for i in range(1000)), 50)
+        self.assertRaises(ValueError, RotatingBloomFilter, 10, error_rate=1)
+
+    def test_Deduplicator_drops_envelopes_from_redundant_feeds(self):
+        for store in (LRUSet(100), RotatingBloomFilter(100)):
+            dedup = Deduplicator(key=field_key(1), store=store)
+            envelopes = [trade('primary', 1), trade('backup', 1), trade('backup', 2),
+                         trade('primary', 2), trade('primary', 3)]
+            unique = [e for e in envelopes if not dedup.is_duplicate(e)]
+            self.assertEqual([(e.origin, e.data[1]) for e in unique],
+                             [('primary', 1), ('backup', 2), ('primary', 3)])
+            self.assertEqual(dedup.stats(), {'hits': 2, 'misses': 3, 'ratio': .4, 'size': 3})
+        self.assertEqual(content_key(trade('a', 1)), content_key(trade('b', 1)))
+        self.assertNotEqual(content_key(trade('a', 1)), content_key(trade('a', 1, 6501.0)))
+
+    def test_content_key_identifies_Message_payloads(self):
+        def book(origin, seq):
+            data = OrderBook('exchange', 'BTC-USD', [[6500.0, 1.0]], [], seq=seq)
+            return Envelope('book/BTC-USD', origin, data)
+        dedup = Deduplicator()
+        primary = book('primary', 1)
+        # Each feed stamps the books it creates with its local time.
+        time.sleep(.01)
+        envelopes = [primary, book('backup', 1), book('backup', 2)]
+        self.assertNotEqual(envelopes[0].data.ts, envelopes[1].data.ts)
+        self.assertEqual([dedup.is_duplicate(e) for e in envelopes], [False, True, False])
+        loaded = Envelope.load_from_frames(book('primary', 1).convert_to_frames())
+        self.assertEqual(content_key(loaded), content_key(book('backup', 1)))
+
+    def test_Deduplicate_stage_and_Receiver_drop_duplicates(self):
+        pipeline = Pipeline([Deduplicate()])
+        self.assertEqual(len(pipeline.process(trade('primary', 1))), 1)
+        self.assertEqual(pipeline.process(trade('backup', 1)), [])
+
+        port = 5786
+        ctx = zmq.Context().instance()
+        publisher = ctx.socket(zmq.PUB)
+        publisher.bind("tcp://127.0.0.1:%s" % port)
+        receiver = Receiver("tcp://127.0.0.1:%s" % port, 'TestNode', dedup=Deduplicator())
+        receiver.start()
+        time.sleep(.5)
+        for origin in ('primary', 'backup'):
+            for i in range(3):
+                publisher.send_multipart(trade(origin, i).convert_to_frames())
+        time.sleep(.5)
+        received = []
+        while True:
+            envelope = receiver.recv()
+            if envelope is None:
+                break
+            received.append((envelope.origin, envelope.data[1]))
+        receiver.stop()
+        publisher.close()
+        self.assertEqual(received, [('primary', 0), ('primary', 1), ('primary', 2)])
+        self.assertEqual(receiver.dedup.hits, 3)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,148 @@
+# Import Built-Ins
+import logging
+import random
+import threading
+import time
+import unittest
+from unittest import mock
+
+# Import Homebrew
+from hermes import Envelope, Publisher, Receiver
+from hermes.executor import ExecutorNode, PartitionedNode, ShardedExecutor, shard
+
+# Init Logging Facilities
+log = logging.getLogger(__name__)
+
+
+def square(envelope):
+    time.sleep(random.random() / 1000)
+    return [envelope.topic, envelope.data[1] ** 2]
+
+
+def slow_square(envelope):
+    time.sleep(.01)
+    return [envelope.topic, envelope.data[1] ** 2]
+
+
+def fail_on_odd(value):
+    if value % 2:
+        raise ValueError(value)
+    return value
+
+
+class ExecutorTests(unittest.TestCase):
+
+    def test_shard_is_stable(self):
+        self.assertEqual(shard('trades/BTC', 8), shard(b'trades/BTC', 8))
+        self.assertEqual(shard('trades/BTC', 8), 6)
+        self.assertEqual({shard('topic%d' % i, 4) for i in range(100)}, {0, 1, 2, 3})
+
+    def test_results_are_returned_in_order(self):
+        for processes in (False, True):
+            executor = ShardedExecutor(square, shards=4, processes=processes)
+            executor.start()
+            envelopes = [Envelope('topic%d' % (i % 7), 'testsuite', ['n', i]) for i in range(200)]
+            for envelope in envelopes:
+                executor.submit(envelope.topic, envelope)
+            results = []
+            while len(results) < len(envelopes):
+                results.extend(executor.results(timeout=1))
+            executor.stop()
+            self.assertEqual(results, [[e.topic, e.data[1] ** 2] for e in envelopes])
+
+    def test_failures_are_skipped(self):
+        executor = ShardedExecutor(fail_on_odd, shards=2)
+        executor.start()
+        for i in range(10):
+            executor.submit(str(i), i)
+        executor.stop()
+        self.assertEqual(list(executor.results()), [0, 2, 4, 6, 8])
+        self.assertEqual(executor.failed, 5)
+
+    def test_in_flight_work_is_bounded(self):
+        release = threading.Event()
+        executor = ShardedExecutor(lambda _: release.wait(), shards=2, max_in_flight=3)
+        self.assertRaises(RuntimeError, executor.submit, 'a', 1)
+        executor.start()
+        for i in range(3):
+            self.assertTrue(executor.submit(str(i), i))
+        self.assertFalse(executor.submit('3', 3, timeout=.05))
+        release.set()
+        self.assertTrue(executor.submit('3', 3, timeout=1))
+        executor.stop()
+
+    def test_ExecutorNode_publishes_results(self):
+        publisher = mock.Mock(Publisher)
+        node = ExecutorNode('pricer', square, publisher=publisher, channel='squares')
+        node.executor.start()
+        node.executor.submit('a', Envelope('a', 'testsuite', ['n', 3]))
+        node.publish_results(timeout=1)
+        node.executor.stop()
+        envelope = publisher.publish.call_args[0][0]
+        self.assertEqual(envelope.topic, 'squares/pricer')
+        self.assertEqual(envelope.data, ['a', 9])
+        self.assertIn(node.executor, node._facilities)
+
+    def test_ExecutorNode_publishes_results_in_flight_on_stop(self):
+        publisher = mock.Mock(Publisher)
+        receiver = mock.Mock(Receiver)
+        node = ExecutorNode('pricer', slow_square, receiver=receiver, publisher=publisher,
+                            channel='squares')
+        envelopes = [Envelope(str(i), 'testsuite', ['n', i]) for i in range(20)]
+
+        def recv(block, timeout):
+            # Stop as soon as all envelopes were submitted, before their results are in.
+            if not envelopes:
+                node._running = False
+                return None
+            return envelopes.pop(0)
+
+        receiver.recv.side_effect = recv
+        node.executor.start()
+        node._running = True
+        node.run()
+        node.executor.stop()
+        self.assertEqual(node.executor.in_flight, 0)
+        self.assertEqual(publisher.publish.call_count, 20)
+
+    def test_Receiver_partitions_envelopes_by_topic(self):
+        receiver = Receiver('tcp://127.0.0.1:5789', 'partitioned', partitions=4)
+        envelopes = [Envelope('topic%d' % (i % 7), 'testsuite', ['n', i]) for i in range(70)]
+        for envelope in envelopes:
+            receiver._enqueue(envelope)
+        self.assertEqual(sum(receiver.depths()), 70)
+        for partition in range(4):
+            received = []
+            while True:
+                envelope = receiver.recv(partition=partition)
+                if envelope is None:
+                    break
+                received.append(envelope)
+            self.assertTrue(all(shard(e.topic, 4) == partition for e in received))
+            self.assertEqual(received, [e for e in envelopes if shard(e.topic, 4) == partition])
+        self.assertEqual(receiver.depths(), [0, 0, 0, 0])
+
+    def test_PartitionedNode_publishes_results_of_workers(self):
+        for processes in (False, True):
+            publisher = mock.Mock(Publisher)
+            receiver = Receiver('tcp://127.0.0.1:5789', 'partitioned')
+            node = PartitionedNode('pricer', square, receiver, publisher, workers=3,
+                                   processes=processes, raw=processes)
+            node.start()
+            for i in range(30):
+                envelope = Envelope('topic%d' % (i % 5), 'testsuite', ['n', i])
+                if processes:
+                    frames = list(envelope.convert_to_frames())
+                    receiver.queues[shard(frames[0], 3)].put(frames)
+                else:
+                    receiver._enqueue(envelope)
+            node.stop()
+            results = [call[0][0].data for call in publisher.publish.call_args_list]
+            self.assertEqual(sorted(r[1] for r in results), [i ** 2 for i in range(30)])
+            for topic in ('topic%d' % t for t in range(5)):
+                values = [r[1] for r in results if r[0] == topic]
+                self.assertEqual(values, sorted(values))
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,187 @@
+# Import Built-Ins
+import logging
+import os
+import tempfile
+import time
+import unittest
+
+# Import Third-Party
+import zmq
+
+# Import Homebrew
+from hermes import Envelope
+from hermes.journal import Journal, Recorder, Replayer
+
+# Init Logging Facilities
+log = logging.getLogger(__name__)
+
+
+class JournalTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_journal_appends_and_reads_frames(self):
+        journal = Journal(self.tmp.name)
+        envelopes = [Envelope('test/%s' % i, 'testsuite', ['data', i], ts=1000 + i)
+                     for i in range(10)]
+        for env in envelopes:
+            journal.append(env.convert_to_frames(), env.ts, env.topic)
+        journal.close()
+
+        records = list(Journal(self.tmp.name).read())
+        self.assertEqual(len(records), 10)
+        for env, (ts, topic, frames) in zip(envelopes, records):
+            self.assertEqual(ts, env.ts)
+            self.assertEqual(topic, env.topic)
+            loaded = Envelope.load_from_frames(frames)
+            self.assertEqual(loaded.data, env.data)
+
+    def test_journal_rolls_over_segments(self):
+        journal = Journal(self.tmp.name, segment_size=256)
+        frames = Envelope('test', 'testsuite', 'x' * 100).convert_to_frames()
+        for i in range(10):
+            journal.append(frames, float(i), 'test')
+        self.assertGreater(len(journal.segments()), 1)
+        self.assertEqual(len(list(journal.read())), 10)
+        journal.close()
+        self.assertEqual([ts for ts, _, _ in journal.read(start=3, end=5)], [3.0, 4.0, 5.0])
+
+    def test_read_does_not_stop_at_out_of_order_records(self):
+        journal = Journal(self.tmp.name)
+        frames = Envelope('test', 'testsuite', ['data']).convert_to_frames()
+        for ts in (1.0, 2.0, 9.0, 3.0, 4.0):
+            journal.append(frames, ts, 'test')
+        journal.close()
+        self.assertEqual([ts for ts, _, _ in journal.read(start=2, end=5)], [2.0, 3.0, 4.0])
+
+    def test_query_finds_out_of_order_records(self):
+        journal = Journal(self.tmp.name)
+        for ts in (1.0, 2.0, 9.0, 3.0, 4.0):
+            env = Envelope('t', 'testsuite', ['data', ts])
+            journal.append(env.convert_to_frames(), ts, env.topic)
+        self.assertEqual([e.data[1] for e in journal.query('t', 2, 5)], [2.0, 3.0, 4.0])
+        journal.close()
+        # From the saved index, and from one built by scanning the segment.
+        self.assertEqual([e.data[1] for e in Journal(self.tmp.name).query('t', 2, 5)],
+                         [2.0, 3.0, 4.0])
+        for name in os.listdir(self.tmp.name):
+            if name.endswith('.idx'):
+                os.remove(os.path.join(self.tmp.name, name))
+        self.assertEqual([ts for ts, _, _ in Journal(self.tmp.name).query('t', 2, 5, raw=True)],
+                         [2.0, 3.0, 4.0])
+
+    def test_query_returns_envelopes_for_topic_prefix_and_time_range(self):
+        journal = Journal(self.tmp.name, segment_size=1024)
+        for i in range(100):
+            for topic in ('trades/BTC-USD', 'trades/ETH-USD', 'book/BTC-USD'):
+                env = Envelope(topic, 'testsuite', ['tick', i])
+                journal.append(env.convert_to_frames(), 1000.0 + i, env.topic)
+
+        # Query the segment still being written to, using the in-memory index.
+        envelopes = list(journal.query('trades/BTC', 1090, 1099))
+        self.assertEqual([e.data[1] for e in envelopes], list(range(90, 100)))
+
+        journal.close()
+        self.assertTrue(any(p.endswith('.idx') for p in os.listdir(self.tmp.name)))
+
+        reopened = Journal(self.tmp.name)
+        envelopes = list(reopened.query('trades/', 1010, 1014))
+        self.assertEqual(len(envelopes), 10)
+        self.assertEqual([e.data[1] for e in envelopes], [10, 10, 11, 11, 12, 12, 13, 13, 14, 14])
+        self.assertTrue(all(e.topic.startswith('trades/') for e in envelopes))
+        self.assertEqual(list(reopened.query('book/', 2000)), [])
+
+    def test_segment_index_is_rebuilt_if_missing(self):
+        journal = Journal(self.tmp.name)
+        env = Envelope('test', 'testsuite', ['data'])
+        journal.append(env.convert_to_frames(), 1234.0, env.topic)
+        journal.close()
+        for name in os.listdir(self.tmp.name):
+            if name.endswith('.idx'):
+                os.remove(os.path.join(self.tmp.name, name))
+        index = Journal(self.tmp.name).index(journal.segments()[0])
+        self.assertEqual(index.min_ts, 1234.0)
+        # Records follow the segment header.
+        self.assertEqual(index.lookup('test'), [(1234.0, 8)])
+
+    def test_segment_index_is_cached_until_appended_to(self):
+        writer = Journal(self.tmp.name)
+        frames = Envelope('test', 'testsuite', ['data']).convert_to_frames()
+        writer.append(frames, 1.0, 'test')
+        writer.flush()
+        path = writer.segments()[0]
+        reader = Journal(self.tmp.name)
+        index = reader.index(path)
+        self.assertIs(reader.index(path), index)
+        writer.append(frames, 2.0, 'test')
+        writer.flush()
+        self.assertEqual([ts for ts, _ in reader.index(path).lookup('test')], [1.0, 2.0])
+        writer.close()
+        index = reader.index(path)
+        self.assertIs(reader.index(path), index)
+        self.assertEqual(index.max_ts, 2.0)
+
+    def test_replayer_publishes_recorded_frames(self):
+        port = 5710
+        ctx = zmq.Context().instance()
+        journal = Journal(self.tmp.name)
+        for i in range(5):
+            env = Envelope('replay', 'testsuite', ['tick', i])
+            journal.append(env.convert_to_frames(), 1000.0 + i * .2, env.topic)
+        journal.close()
+
+        sub = ctx.socket(zmq.SUB)
+        sub.setsockopt(zmq.SUBSCRIBE, b'')
+        sub.bind("tcp://127.0.0.1:%s" % port)
+        replayer = Replayer("tcp://127.0.0.1:%s" % port, 'TestReplayer', journal, speed=1.0)
+        time.sleep(.5)
+        replayer.start()
+        received = []
+        while sub.poll(1000):
+            received.append(Envelope.load_from_frames(sub.recv_multipart()).data)
+        replayer.join()
+        sub.close()
+        self.assertEqual(replayer.replayed, 5)
+        self.assertTrue(received)
+
+    def test_recorder_records_raw_frames(self):
+        journal = Journal(self.tmp.name)
+        recorder = Recorder("tcp://127.0.0.1:5711", 'TestRecorder', journal)
+        env = Envelope('record', 'testsuite', ['data'])
+        recorder.record(env.convert_to_frames())
+        journal.close()
+        self.assertEqual(recorder.recorded, 1)
+        ts, topic, frames = next(journal.read())
+        self.assertEqual(topic, 'record')
+        self.assertEqual(ts, env.ts)
+
+    def test_recorder_splits_batches(self):
+        journal = Journal(self.tmp.name)
+        recorder = Recorder("tcp://127.0.0.1:5711", 'TestRecorder', journal)
+        frames = []
+        for i in range(3):
+            frames.extend(Envelope('batch', 'testsuite', ['data', i], ts=1000 + i)
+                          .convert_to_frames(restamp=False))
+        recorder.record(frames)
+        journal.close()
+        self.assertEqual(recorder.recorded, 3)
+        self.assertEqual([ts for ts, _, _ in journal.read()], [1000, 1001, 1002])
+
+    def test_recorder_skips_reserved_topics_and_malformed_messages(self):
+        journal = Journal(self.tmp.name)
+        recorder = Recorder("tcp://127.0.0.1:5711", 'TestRecorder', journal)
+        recorder.record([b'"_hermes/probe/recv/1"'])
+        recorder.record(list(Envelope('_hermes/welcome', 'pub', ['Welcome']).convert_to_frames()))
+        recorder.record([b'"record"', b'"testsuite"', b'["data"]', b'not json'])
+        recorder.record(list(Envelope('record', 'testsuite', ['data']).convert_to_frames()))
+        journal.close()
+        self.assertEqual(recorder.recorded, 1)
+        self.assertEqual([topic for _, topic, _ in journal.read()], ['record'])
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,68 @@
+# Import Built-Ins
+import logging
+import threading
+import unittest
+from queue import Empty
+
+# Import Homebrew
+from hermes import Envelope, Receiver
+from hermes.lanes import Lane, LaneQueue, STRICT, WEIGHTED
+
+# Init Logging Facilities
+log = logging.getLogger(__name__)
+
+
+def envelope(topic, i=0):
+    return Envelope(topic, 'testsuite', ['Raw', i])
+
+
+class LaneQueueTests(unittest.TestCase):
+
+    def test_topics_are_assigned_to_lanes(self):
+        q = LaneQueue([Lane('control', topics=['orders/', 'control/']),
+                       Lane('books', topics=['book/'])])
+        self.assertEqual(q.lane_for('orders/BTC').name, 'control')
+        self.assertEqual(q.lane_for('book/BTC').name, 'books')
+        self.assertEqual(q.lane_for('trades/BTC').name, 'books')
+        self.assertRaises(ValueError, LaneQueue, [])
+        self.assertRaises(ValueError, LaneQueue, [Lane('a')], scheduling='random')
+        self.assertRaises(ValueError, Lane, 'a', weight=0)
+
+    def test_strict_scheduling_serves_higher_lanes_first(self):
+        q = LaneQueue([Lane('control', topics=['orders/']), Lane('data')], STRICT)
+        for i in range(3):
+            q.put(envelope('book/BTC', i))
+        q.put(envelope('orders/BTC'))
+        self.assertEqual(q.depths(), {'control': 1, 'data': 3})
+        self.assertEqual(q.qsize(), 4)
+        self.assertEqual([q.get().topic for _ in range(4)],
+                         ['orders/BTC', 'book/BTC', 'book/BTC', 'book/BTC'])
+        self.assertTrue(q.empty())
+        self.assertRaises(Empty, q.get_nowait)
+        self.assertRaises(Empty, q.get, True, .01)
+
+    def test_weighted_scheduling_interleaves_lanes(self):
+        q = LaneQueue([Lane('control', topics=['orders/'], weight=3), Lane('data')], WEIGHTED)
+        for i in range(8):
+            q.put(envelope('orders/BTC', i))
+            q.put(envelope('book/BTC', i))
+        lanes = ''.join(q.get().topic[0] for _ in range(8))
+        self.assertEqual(lanes, 'oobooobo')
+
+    def test_get_blocks_until_put(self):
+        q = LaneQueue([Lane('data')])
+        threading.Timer(.05, q.put, args=(envelope('late'),)).start()
+        self.assertEqual(q.get(timeout=1).topic, 'late')
+
+    def test_Receiver_returns_envelopes_by_lane(self):
+        receiver = Receiver('tcp://127.0.0.1:5780', 'lanes_recv',
+                            lanes=[Lane('control', topics=['control/']), Lane('data')])
+        receiver.q.put(envelope('book/BTC'))
+        receiver.q.put(envelope('control/stop'))
+        self.assertEqual(receiver.recv().topic, 'control/stop')
+        self.assertEqual(receiver.recv().topic, 'book/BTC')
+        self.assertIsNone(receiver.recv())
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
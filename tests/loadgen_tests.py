@@ -0,0 +1,132 @@
+# Import Built-Ins
+import logging
+import time
+import unittest
+
+# Import Homebrew
+from hermes import Envelope
+from hermes.loadgen import LoadGenerator, LoadSink, main, sequence, MIXED, SNAPSHOT
+from hermes.proxy import PostOffice
+from hermes.structs import OrderBook
+
+# Init Logging Facilities
+log = logging.getLogger(__name__)
+
+
+class LoadGeneratorTests(unittest.TestCase):
+
+    def test_streams_cover_all_instruments_of_all_exchanges(self):
+        generator = LoadGenerator('tcp://127.0.0.1:6400', exchanges=['a', 'b'], instruments=3,
+                                  topic_tree='{channel}.{base}.{exchange}')
+        self.assertEqual(len(generator.streams), 6)
+        self.assertEqual(set(generator.publishers), {'a', 'b'})
+        envelopes = [generator.envelope_for(stream) for stream in generator.streams]
+        self.assertIn('trades.BTC.a', [e.topic for e in envelopes])
+        self.assertEqual({e.origin for e in envelopes}, {'a', 'b'})
+        self.assertEqual([sequence(e.data) for e in envelopes], [1] * 6)
+
+    def test_mixed_payloads_interleave_snapshots(self):
+        generator = LoadGenerator('tcp://127.0.0.1:6401', instruments=1, payload=MIXED,
+                                  depth=20, snapshot_every=4, seed=1)
+        stream = generator.streams[0]
+        payloads = [generator.payload_for(stream) for _ in range(8)]
+        self.assertEqual([c for c, _ in payloads], ['book', 'trades', 'book', 'trades'] * 2)
+        snapshots = [d for _, d in payloads if isinstance(d, OrderBook) and d.snapshot]
+        self.assertEqual(len(snapshots), 2)
+        self.assertEqual(len(snapshots[0].bids), 20)
+        self.assertEqual([sequence(d) for c, d in payloads if c == 'trades'], [1, 2, 3, 4])
+        self.assertEqual([sequence(d) for c, d in payloads if c == 'book'], [1, 2, 3, 4])
+
+    def test_bursts_raise_the_rate_periodically(self):
+        generator = LoadGenerator('tcp://127.0.0.1:6402', rate=100, burst_rate=1000,
+                                  burst_period=10, burst_duration=2)
+        self.assertEqual(generator.current_rate(1), 1000)
+        self.assertEqual(generator.current_rate(5), 100)
+        self.assertEqual(generator.current_rate(11), 1000)
+
+    def test_invalid_arguments_raise_ValueError(self):
+        with self.assertRaises(ValueError):
+            LoadGenerator('tcp://127.0.0.1:6403', payload='xml')
+        with self.assertRaises(ValueError):
+            LoadGenerator('tcp://127.0.0.1:6403', burst_rate=10, burst_period=1,
+                          burst_duration=2)
+
+
+class LoadSinkTests(unittest.TestCase):
+
+    def test_sink_counts_gaps_as_lost_and_late_envelopes_as_reordered(self):
+        sink = LoadSink('tcp://127.0.0.1:6404')
+        now = time.time()
+        for seq in (1, 2, 5, 3, 6, 3, 6):
+            sink.measure(Envelope('trades/a/BTC-USD', 'a', ['BTC-USD', seq, 1.0, 1.0, 'buy'],
+                                  ts=now - .001), now)
+        book = OrderBook('a', 'BTC-USD', [], [], seq=1)
+        sink.measure(Envelope('book/a/BTC-USD', 'a', book, ts=now - .002), now)
+        stats = sink.stats()
+        self.assertEqual(stats['received'], 8)
+        self.assertEqual(stats['lost'], 1)
+        self.assertEqual(stats['reordered'], 1)
+        self.assertEqual(stats['duplicates'], 2)
+        self.assertEqual(stats['streams'], 2)
+        self.assertAlmostEqual(stats['p50'], .001, places=4)
+        self.assertEqual(sink.stats(sent=10)['lost'], 4)
+
+    def test_latency_samples_are_bounded(self):
+        sink = LoadSink('tcp://127.0.0.1:6405', max_samples=10)
+        now = time.time()
+        for i in range(100):
+            sink.measure(Envelope('t', 'a', ['x'], ts=now - i), now)
+        self.assertEqual(len(sink.latencies), 10)
+        self.assertEqual(sink.stats()['received'], 100)
+
+
+class LoadTestTests(unittest.TestCase):
+
+    def test_generated_feeds_are_delivered_through_a_PostOffice(self):
+        xsub, xpub = 'tcp://127.0.0.1:6410', 'tcp://127.0.0.1:6411'
+        proxy = PostOffice(xsub, xpub)
+        proxy.start()
+        sink = LoadSink(xpub)
+        generator = LoadGenerator(xsub, exchanges=2, instruments=5, rate=2000, count=400,
+                                  payload=SNAPSHOT, depth=10)
+        try:
+            sink.start(timeout=10)
+            generator.start(timeout=10)
+            generator.join(10)
+            generator.stop(timeout=5)
+            sink.wait_idle(.5, timeout=10)
+        finally:
+            sink.stop(timeout=5)
+            proxy.stop()
+        self.assertEqual(generator.stats()['sent'], 400)
+        self.assertEqual(generator.stats()['per_exchange'], {'exchange0': 200, 'exchange1': 200})
+        stats = sink.stats(sent=400)
+        self.assertEqual(stats['received'], 400)
+        self.assertEqual(stats['lost'], 0)
+        self.assertEqual(stats['streams'], 10)
+        self.assertLess(stats['p50'], 1)
+
+    def test_main_runs_a_load_test_and_checks_thresholds(self):
+        status = main(['run', '--xsub', 'tcp://127.0.0.1:6412', '--xpub', 'tcp://127.0.0.1:6413',
+                       '--count', '200', '--rate', '1000', '--payload', 'mixed', '--idle', '.5',
+                       '--json', '--max-loss', '0'])
+        self.assertEqual(status, 0)
+
+    def test_main_subscribes_to_each_topic_prefix(self):
+        status = main(['run', '--xsub', 'tcp://127.0.0.1:6414', '--xpub', 'tcp://127.0.0.1:6415',
+                       '--count', '200', '--rate', '1000', '--payload', 'mixed', '--idle', '.5',
+                       '--json', '--topics', 'trades', 'book/exchange0', '--max-loss', '0'])
+        self.assertEqual(status, 0)
+        # Envelopes on topics the sink did not subscribe to do not count as lost.
+        status = main(['run', '--xsub', 'tcp://127.0.0.1:6417', '--xpub', 'tcp://127.0.0.1:6418',
+                       '--count', '200', '--rate', '1000', '--payload', 'mixed', '--idle', '.5',
+                       '--json', '--topics', 'trades', '--max-loss', '0'])
+        self.assertEqual(status, 0)
+
+    def test_main_fails_if_the_handshake_times_out(self):
+        status = main(['sink', '--xpub', 'tcp://127.0.0.1:6416', '--handshake-timeout', '.5'])
+        self.assertEqual(status, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+# Import Built-Ins
+import logging
+import unittest
+from unittest import mock
+
+# Import Homebrew
+from hermes import Envelope, Publisher
+from hermes.aggregation import Count, TumblingWindow
+from hermes.pipeline import Aggregate, Filter, Map, Pipeline, PipelineNode, Route
+
+# Init Logging Facilities
+log = logging.getLogger(__name__)
+
+
+def trade(topic, price, ts):
+    envelope = Envelope(topic, 'testsuite', ['Trade', price, 1.0])
+    envelope.ts = ts
+    return envelope
+
+
+class PipelineTests(unittest.TestCase):
+
+    def test_stages_pass_envelopes_by_reference(self):
+        pipeline = Pipeline([Filter(lambda env: env.data[1] > 100),
+                             Map(lambda env: env.data[1] * 2, channel='doubled')])
+        self.assertEqual(pipeline.process(trade('trades/BTC', 99, 1)), [])
+        output, = pipeline.process(trade('trades/BTC', 101, 1))
+        self.assertEqual((output.topic, output.data, output.ts), ('doubled', 202, 1))
+
+        envelope = trade('trades/BTC', 101, 1)
+        self.assertIs(Pipeline([Filter(lambda env: True)]).process(envelope)[0], envelope)
+
+    def test_Route_dispatches_by_prefix(self):
+        route = Route({'trades/BTC': [Map(lambda env: 'btc')],
+                       'trades': [Map(lambda env: 'any')]})
+        self.assertEqual([e.data for e in route.process(trade('trades/BTC', 1, 1))],
+                         ['btc', 'any'])
+        self.assertEqual([e.data for e in route.process(trade('trades/ETH', 1, 1))], ['any'])
+        self.assertEqual(route.process(trade('book/ETH', 1, 1)), [])
+        route.first_match = True
+        self.assertEqual([e.data for e in route.process(trade('trades/BTC', 1, 1))], ['btc'])
+
+    def test_PipelineNode_publishes_pipeline_output(self):
+        publisher = mock.Mock(Publisher)
+        node = PipelineNode('derived', [Aggregate(TumblingWindow(10, {'n': Count}), 'bars')],
+                            publisher=publisher)
+        for ts in (1, 2, 3, 12):
+            node.process(trade('trades/BTC', 100, ts))
+        self.assertEqual(publisher.publish.call_count, 1)
+        envelope = publisher.publish.call_args[0][0]
+        self.assertEqual(envelope.topic, 'bars/trades/BTC')
+        self.assertEqual(envelope.data.values, {'n': 3})
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
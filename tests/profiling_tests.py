@@ -0,0 +1,100 @@
+# Import Built-Ins
+import glob
+import logging
+import os
+import signal
+import tempfile
+import threading
+import time
+import unittest
+
+# Import Homebrew
+from hermes import Envelope, Publisher, Receiver
+from hermes.profiling import StackSampler, StageProfiler, install_signal_handler
+from hermes.proxy import PostOffice
+
+# Init Logging Facilities
+log = logging.getLogger(__name__)
+
+
+def spin_until(event):
+    while not event.is_set():
+        sum(range(1000))
+
+
+class ProfilingTests(unittest.TestCase):
+
+    def test_only_sampled_envelopes_are_traced(self):
+        profiler = StageProfiler(sample_rate=.25)
+        traces = [profiler.trace() for _ in range(8)]
+        self.assertEqual([t is not None for t in traces], [False, False, False, True] * 2)
+        handler = profiler.wrap('handler', lambda x: x * 2)
+        self.assertEqual([handler(i) for i in range(8)], [0, 2, 4, 6, 8, 10, 12, 14])
+        self.assertEqual(profiler.stats()['handler']['count'], 2)
+        self.assertIn('handler', profiler.report())
+        self.assertRaises(ValueError, StageProfiler, sample_rate=0)
+
+    def test_sources_sharing_a_profiler_are_sampled_independently(self):
+        profiler = StageProfiler(sample_rate=.01)
+        receiver, publisher = object(), object()
+        handler = profiler.wrap('handler', lambda: None)
+        sampled = {receiver: 0, publisher: 0}
+        for _ in range(1000):
+            for source in (receiver, publisher):
+                sampled[source] += profiler.trace(source) is not None
+            handler()
+        self.assertEqual(sampled, {receiver: 10, publisher: 10})
+        self.assertEqual(profiler.stats()['handler']['count'], 10)
+
+    def test_components_record_stages(self):
+        profiler = StageProfiler(sample_rate=1)
+        proxy = PostOffice("tcp://127.0.0.1:5790", "tcp://127.0.0.1:5791")
+        receiver = Receiver("tcp://127.0.0.1:5791", 'prof_recv', profiler=profiler)
+        publisher = Publisher("tcp://127.0.0.1:5790", 'prof_pub', profiler=profiler)
+        proxy.start()
+        try:
+            self.assertTrue(receiver.start(wait=True, timeout=2))
+            self.assertTrue(publisher.start(wait=True, timeout=2))
+            for i in range(10):
+                publisher.publish(Envelope('profiled', 'testsuite', ['Raw', i]))
+            received = 0
+            deadline = time.time() + 2
+            while received < 10 and time.time() < deadline:
+                received += receiver.recv() is not None
+        finally:
+            publisher.stop()
+            receiver.stop()
+            proxy.stop()
+        stats = profiler.stats()
+        for stage in ('transit', 'decode', 'filter', 'enqueue', 'dequeue', 'encode', 'send'):
+            self.assertEqual(stats[stage]['count'], 10, stage)
+
+    def test_stack_samples_are_dumped_on_signal(self):
+        stop = threading.Event()
+        worker = threading.Thread(target=spin_until, args=(stop,), name='spinner')
+        worker.start()
+        sampler = StackSampler(interval=.001)
+        sampler.start()
+        time.sleep(.2)
+        sampler.stop()
+        stop.set()
+        worker.join()
+        self.assertIn('spinner;', sampler.folded())
+        self.assertIn('spin_until (profiling_tests.py:', sampler.folded())
+
+        with tempfile.TemporaryDirectory() as tmp:
+            previous = install_signal_handler(os.path.join(tmp, 'profile'), StageProfiler(),
+                                              sampler)
+            try:
+                os.kill(os.getpid(), signal.SIGUSR1)
+                time.sleep(.1)
+            finally:
+                signal.signal(signal.SIGUSR1, previous)
+            self.assertEqual(len(glob.glob(os.path.join(tmp, 'profile-*.stages.txt'))), 1)
+            folded = glob.glob(os.path.join(tmp, 'profile-*.folded'))
+            with open(folded[0]) as f:
+                self.assertIn('spin_until', f.read())
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -6,8 +6,13 @@ from multiprocessing import Process
 import time
 
 # Import Homebrew
+from hermes import Publisher, Receiver, Envelope
+from hermes.context import get_context
+from hermes.lanes import Lane
 from hermes.proxy import PostOffice
+from hermes.structs import topic_frame
 from hermes.config import XPUB_ADDR, XSUB_ADDR, DEBUG_ADDR
+from hermes.config import INPROC_XPUB_ADDR, INPROC_XSUB_ADDR
 
 # Init Logging Facilities
 log = logging.getLogger(__name__)
@@ -31,6 +36,171 @@ class ProxyTests(unittest.TestCase):
         time.sleep(1)
         self.assertFalse(proxy.running)
 
+    def test_proxy_does_not_terminate_shared_context(self):
+        proxy = PostOffice(XSUB_ADDR, XPUB_ADDR)
+        proxy.start()
+        time.sleep(.5)
+        proxy.stop()
+        self.assertFalse(proxy.running)
+        self.assertFalse(get_context().closed)
+
+    def test_components_share_context_and_communicate_via_inproc(self):
+        proxy = PostOffice(INPROC_XSUB_ADDR, INPROC_XPUB_ADDR)
+        publisher = Publisher(INPROC_XSUB_ADDR, 'inproc_pub')
+        receiver = Receiver(INPROC_XPUB_ADDR, 'inproc_recv')
+        self.assertIs(proxy.ctx, publisher.ctx)
+        self.assertIs(proxy.ctx, receiver.ctx)
+
+        proxy.start()
+        receiver.start()
+        publisher.start()
+        try:
+            received = None
+            for _ in range(50):
+                publisher.publish(Envelope('inproc', 'testsuite', ['Raw', 'data']))
+                time.sleep(.05)
+                received = receiver.recv()
+                if received:
+                    break
+            self.assertIsNotNone(received)
+            self.assertEqual(received.data, ['Raw', 'data'])
+        finally:
+            publisher.stop()
+            receiver.stop()
+            proxy.stop()
+
+    def test_Receiver_fails_over_to_secondary_PostOffice(self):
+        primary = PostOffice("tcp://127.0.0.1:5760", "tcp://127.0.0.1:5761",
+                             heartbeat_interval=.1)
+        secondary = PostOffice("tcp://127.0.0.1:5762", "tcp://127.0.0.1:5763",
+                               heartbeat_interval=.1)
+        receiver = Receiver(["tcp://127.0.0.1:5761", "tcp://127.0.0.1:5763"], 'failover',
+                            heartbeat_timeout=.5)
+        primary.start()
+        secondary.start()
+        receiver.start()
+        try:
+            time.sleep(.5)
+            self.assertIsNotNone(receiver.last_heartbeat)
+            self.assertEqual(receiver.failovers, 0)
+            self.assertIsNone(receiver.recv())
+            primary.stop()
+            time.sleep(1.5)
+            self.assertEqual(receiver.failovers, 1)
+            self.assertEqual(receiver.active, 1)
+            self.assertLess(time.time() - receiver.last_heartbeat, .5)
+        finally:
+            receiver.stop()
+            secondary.stop()
+            primary.stop()
+
+    def test_handshake_makes_first_messages_arrive(self):
+        proxy = PostOffice("tcp://127.0.0.1:5770", "tcp://127.0.0.1:5771")
+        receiver = Receiver("tcp://127.0.0.1:5771", 'handshake_recv')
+        publisher = Publisher("tcp://127.0.0.1:5770", 'handshake_pub', handshake=True)
+        proxy.start()
+        try:
+            started = time.time()
+            self.assertTrue(receiver.start(wait=True, timeout=2))
+            publisher.publish(Envelope('first', 'testsuite', ['Raw', 1]))
+            self.assertFalse(publisher.ready)
+            self.assertTrue(publisher.start(wait=True, timeout=2))
+            publisher.publish(Envelope('second', 'testsuite', ['Raw', 2]))
+            self.assertLess(time.time() - started, 1)
+            received = []
+            deadline = time.time() + 1
+            while len(received) < 2 and time.time() < deadline:
+                envelope = receiver.recv()
+                if envelope is not None:
+                    received.append(envelope.topic)
+            self.assertEqual(received, ['first', 'second'])
+            self.assertIn(b'', proxy.subscriptions)
+        finally:
+            publisher.stop()
+            receiver.stop()
+            proxy.stop()
+
+    def test_handshake_traffic_does_not_reach_wildcard_Receivers(self):
+        proxy = PostOffice("tcp://127.0.0.1:5777", "tcp://127.0.0.1:5778")
+        wildcard = Receiver("tcp://127.0.0.1:5778", 'wildcard_recv')
+        receiver = Receiver("tcp://127.0.0.1:5778", 'probing_recv')
+        publisher = Publisher("tcp://127.0.0.1:5777", 'welcome_pub', handshake=True)
+        proxy.start()
+        try:
+            self.assertTrue(wildcard.start(wait=True, timeout=2))
+            self.assertTrue(receiver.start(wait=True, timeout=2))
+            self.assertTrue(publisher.start(wait=True, timeout=2))
+            publisher.publish(Envelope('data', 'testsuite', ['Raw', 1]))
+            received = None
+            deadline = time.time() + 1
+            while received is None and time.time() < deadline:
+                received = wildcard.recv()
+            self.assertTrue(wildcard.is_alive())
+            self.assertEqual(received.topic, 'data')
+            self.assertIsNone(wildcard.recv())
+        finally:
+            publisher.stop()
+            receiver.stop()
+            wildcard.stop()
+            proxy.stop()
+
+    def test_handshake_times_out_without_PostOffice(self):
+        receiver = Receiver("tcp://127.0.0.1:5772", 'lonely_recv')
+        self.assertFalse(receiver.start(wait=True, timeout=.2))
+        receiver.stop()
+
+    def test_Publisher_skips_topics_without_subscribers(self):
+        proxy = PostOffice("tcp://127.0.0.1:5773", "tcp://127.0.0.1:5774")
+        prefix = topic_frame('wanted')[:-1].decode('utf-8')
+        receiver = Receiver("tcp://127.0.0.1:5774", 'interest_recv', topics=prefix)
+        publisher = Publisher("tcp://127.0.0.1:5773", 'interest_pub', track_interest=True)
+        proxy.start()
+        try:
+            self.assertTrue(receiver.start(wait=True, timeout=2))
+            self.assertTrue(publisher.start(wait=True, timeout=2))
+            self.assertTrue(publisher.publish(Envelope('wanted/BTC', 'testsuite', ['Raw', 1])))
+            self.assertFalse(publisher.publish(Envelope('unwanted', 'testsuite', ['Raw', 2])))
+            self.assertEqual(publisher.skipped, {'unwanted': 1})
+            received = None
+            deadline = time.time() + 1
+            while received is None and time.time() < deadline:
+                received = receiver.recv()
+            self.assertEqual(received.topic, 'wanted/BTC')
+
+            receiver.stop()
+            deadline = time.time() + 1
+            while publisher.interested('wanted/BTC') and time.time() < deadline:
+                time.sleep(.01)
+            self.assertFalse(publisher.publish(Envelope('wanted/BTC', 'testsuite', ['Raw', 3])))
+        finally:
+            publisher.stop()
+            receiver.stop()
+            proxy.stop()
+
+    def test_Publisher_sends_dedicated_lanes_over_separate_sockets(self):
+        proxy = PostOffice("tcp://127.0.0.1:5775", "tcp://127.0.0.1:5776")
+        receiver = Receiver("tcp://127.0.0.1:5776", 'lanes_recv')
+        lanes = [Lane('control', topics=['control/'], dedicated=True), Lane('data')]
+        publisher = Publisher("tcp://127.0.0.1:5775", 'lanes_pub', lanes=lanes)
+        proxy.start()
+        try:
+            self.assertTrue(receiver.start(wait=True, timeout=2))
+            self.assertTrue(publisher.start(wait=True, timeout=2))
+            self.assertEqual(len(publisher._lane_socks['control']), 1)
+            publisher.publish(Envelope('book/BTC', 'testsuite', ['Raw', 1]))
+            publisher.publish(Envelope('control/stop', 'testsuite', ['Raw', 2]))
+            received = []
+            deadline = time.time() + 1
+            while len(received) < 2 and time.time() < deadline:
+                envelope = receiver.recv()
+                if envelope is not None:
+                    received.append(envelope.topic)
+            self.assertEqual(sorted(received), ['book/BTC', 'control/stop'])
+        finally:
+            publisher.stop()
+            receiver.stop()
+            proxy.stop()
+
 
 if __name__ == '__main__':
     unittest.main(verbosity=2)
@@ -9,6 +9,7 @@ import zmq
 
 # Import Homebrew
 from hermes import Publisher, Envelope
+from hermes.executor import shard
 
 
 # Init Logging Facilities
@@ -85,6 +86,70 @@ class PublisherTests(unittest.TestCase):
         time.sleep(3)
         self.assertTrue(publisher._running.is_set())
 
+    def _xsub(self, ctx, addr):
+        xsub = ctx.socket(zmq.XSUB)
+        xsub.bind(addr)
+        return xsub
+
+    def _recv_topics(self, sock, timeout=500):
+        topics = []
+        while sock.poll(timeout):
+            topics.append(Envelope.load_from_frames(sock.recv_multipart()).topic)
+            timeout = 100
+        return topics
+
+    def test_Publisher_broadcasts_and_hashes_to_multiple_endpoints(self):
+        ctx = zmq.Context.instance()
+        addrs = ["tcp://127.0.0.1:%s" % port for port in (5710, 5711)]
+        socks = [self._xsub(ctx, addr) for addr in addrs]
+        for routing in (Publisher.BROADCAST, Publisher.HASH):
+            publisher = Publisher(addrs, 'TestPub', routing=routing)
+            publisher.start()
+            time.sleep(.5)
+            for sock in socks:
+                sock.send(b'\x01')
+            time.sleep(.2)
+            topics = ['topic%d' % i for i in range(10)]
+            for topic in topics:
+                publisher.publish(Envelope(topic, 'testsuite', ['Raw', 1]))
+            received = [self._recv_topics(sock) for sock in socks]
+            publisher.stop()
+            if routing == Publisher.BROADCAST:
+                self.assertEqual(received, [topics, topics])
+            else:
+                self.assertEqual(sorted(received[0] + received[1]), topics)
+                self.assertTrue(all(shard(t, 2) == 0 for t in received[0]))
+                self.assertTrue(all(shard(t, 2) == 1 for t in received[1]))
+        for sock in socks:
+            sock.close()
+
+    def test_Publisher_fails_over_to_connected_endpoint(self):
+        ctx = zmq.Context.instance()
+        primary, backup = ["tcp://127.0.0.1:%s" % port for port in (5712, 5713)]
+        backup_sock = self._xsub(ctx, backup)
+        publisher = Publisher([primary, backup], 'TestPub', routing=Publisher.FAILOVER)
+        publisher.start()
+        time.sleep(.5)
+        backup_sock.send(b'\x01')
+        self.assertEqual(publisher.connected, [False, True])
+        publisher.publish(Envelope('failover', 'testsuite', ['Raw', 1]))
+        self.assertEqual(self._recv_topics(backup_sock), ['failover'])
+
+        primary_sock = self._xsub(ctx, primary)
+        time.sleep(.5)
+        primary_sock.send(b'\x01')
+        time.sleep(.2)
+        publisher.publish(Envelope('failback', 'testsuite', ['Raw', 1]))
+        self.assertEqual(self._recv_topics(primary_sock), ['failback'])
+        self.assertEqual(publisher.failovers, 2)
+        publisher.stop()
+        primary_sock.close()
+        backup_sock.close()
+
+    def test_Publisher_rejects_unknown_routing(self):
+        self.assertRaises(ValueError, Publisher, "tcp://127.0.0.1:5714", 'TestPub',
+                          routing='random')
+
 
 if __name__ == '__main__':
     unittest.main(verbosity=2)
@@ -0,0 +1,77 @@
+# Import Built-Ins
+import logging
+import time
+import unittest
+
+# Import Third-Party
+import zmq
+
+# Import Homebrew
+from hermes import Envelope, Publisher
+from hermes.ratelimit import RateLimit, RateLimiter
+
+# Init Logging Facilities
+log = logging.getLogger(__name__)
+
+
+def envelope(topic, i=0):
+    return Envelope(topic, 'testsuite', ['Raw', i])
+
+
+class RateLimiterTests(unittest.TestCase):
+
+    def test_token_bucket_allows_bursts_and_drops_excess(self):
+        limiter = RateLimiter([RateLimit(topics=['trades/'], rate=10, burst=3, coalesce=False)])
+        admitted = [limiter.admit(envelope('trades/BTC', i), now=100) for i in range(5)]
+        self.assertEqual(admitted, [True, True, True, False, False])
+        self.assertEqual(limiter.dropped, {'trades/BTC': 2})
+        self.assertTrue(limiter.admit(envelope('trades/ETH'), now=100))
+        self.assertTrue(limiter.admit(envelope('book/BTC'), now=100))
+        self.assertFalse(limiter.admit(envelope('trades/BTC'), now=100.05))
+        self.assertTrue(limiter.admit(envelope('trades/BTC'), now=100.2))
+        self.assertEqual(limiter.due(now=200), [])
+
+    def test_coalescing_sends_latest_envelope_once_refilled(self):
+        limiter = RateLimiter([RateLimit(min_interval=1)])
+        self.assertTrue(limiter.admit(envelope('book/BTC', 0), now=10))
+        for i in range(1, 4):
+            self.assertFalse(limiter.admit(envelope('book/BTC', i), now=10 + .1 * i))
+        self.assertEqual(limiter.pending, 1)
+        self.assertEqual(limiter.dropped, {'book/BTC': 2})
+        self.assertEqual(limiter.due(now=10.5), [])
+        self.assertEqual([e.data[1] for e in limiter.due(now=11)], [3])
+        self.assertEqual(limiter.pending, 0)
+        self.assertEqual(limiter.due(now=20), [])
+
+    def test_invalid_limits_are_rejected(self):
+        self.assertRaises(ValueError, RateLimit)
+        self.assertRaises(ValueError, RateLimit, rate=0)
+        self.assertRaises(ValueError, RateLimit, rate=1, burst=0)
+        self.assertRaises(ValueError, RateLimit, min_interval=-1)
+
+    def test_Publisher_coalesces_throttled_topics(self):
+        ctx = zmq.Context.instance()
+        xsub = ctx.socket(zmq.XSUB)
+        xsub.bind("tcp://127.0.0.1:5785")
+        publisher = Publisher("tcp://127.0.0.1:5785", 'TestPub',
+                              rate_limits=[RateLimit(topics=['book/'], min_interval=.3)])
+        publisher.start()
+        time.sleep(.5)
+        xsub.send(b'\x01')
+        time.sleep(.2)
+        for i in range(10):
+            publisher.publish(envelope('book/BTC', i))
+            publisher.publish(envelope('trades/BTC', i))
+        received = []
+        while xsub.poll(600):
+            received.append(Envelope.load_from_frames(xsub.recv_multipart()))
+        publisher.stop()
+        xsub.close()
+        self.assertEqual([e.data[1] for e in received if e.topic == 'book/BTC'], [0, 9])
+        self.assertEqual([e.data[1] for e in received if e.topic == 'trades/BTC'],
+                         list(range(10)))
+        self.assertEqual(publisher.limiter.dropped, {'book/BTC': 8})
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
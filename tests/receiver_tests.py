@@ -1,13 +1,17 @@
 # Import Built-Ins
+import json
 import logging
 import time
 import unittest
+from unittest import mock
 
 # Import Third-Party
 import zmq
 
 # Import Homebrew
 from hermes import Receiver, Envelope
+from hermes.receiver import HEARTBEAT_FRAME, LagPolicy, LagEstimator
+from hermes.structs import topic_frame
 
 
 # Init Logging Facilities
@@ -43,6 +47,134 @@ class ReceiverTests(unittest.TestCase):
         r = Receiver("tcp://127.0.0.1:%s" % port, "test")
         self.assertIsNone(r.recv())
 
+    def test_LagEstimator_escalates_gradually(self):
+        estimator = LagEstimator(LagPolicy(warn=.5, catch_up=1, shutdown=2, smoothing=1,
+                                           max_catch_ups=2))
+        self.assertEqual(estimator.update(.1), LagEstimator.OK)
+        self.assertEqual(estimator.update(.7), LagEstimator.WARN)
+        self.assertEqual(estimator.update(3), LagEstimator.CATCH_UP)
+        estimator.caught_up(10, 3)
+        self.assertEqual(estimator.update(3), LagEstimator.CATCH_UP)
+        estimator.caught_up(10, 3)
+        self.assertEqual(estimator.update(3), LagEstimator.SHUTDOWN)
+        self.assertEqual(estimator.stats['skipped'], 20)
+        self.assertEqual(estimator.stats['warnings'], 1)
+        self.assertEqual(estimator.update(.1), LagEstimator.OK)
+
+    def test_LagEstimator_limits_catch_ups_below_shutdown(self):
+        estimator = LagEstimator(LagPolicy(warn=.5, catch_up=1, shutdown=5, smoothing=1,
+                                           max_catch_ups=2))
+        for _ in range(2):
+            self.assertEqual(estimator.update(2), LagEstimator.CATCH_UP)
+            estimator.caught_up(10, 2)
+        self.assertEqual(estimator.update(2), LagEstimator.WARN)
+        self.assertEqual(estimator.update(2), LagEstimator.WARN)
+        self.assertEqual(estimator.stats['catch_ups'], 2)
+        self.assertEqual(estimator.update(.1), LagEstimator.OK)
+        self.assertEqual(estimator.update(2), LagEstimator.CATCH_UP)
+
+    def test_Receiver_handles_heartbeats_and_probe_while_catching_up(self):
+        conn = Receiver("tcp://127.0.0.1:5670", 'TestNode', heartbeat_timeout=1, handshake=True)
+        conn._probe = topic_frame('probe/TestNode')
+        conn._last_seen = 0
+        stale = list(Envelope('topic', 'TestNode', ['Raw', 1]).convert_to_frames())
+        stale[3] = json.dumps(time.time() - 2).encode('utf-8')
+        conn.sock = mock.Mock()
+        conn.sock.recv_multipart.side_effect = [[HEARTBEAT_FRAME, b'', b'', b''],
+                                                [conn._probe, b'', b'', b''], stale,
+                                                zmq.error.Again()]
+        conn._catch_up(Envelope.load_from_frames(stale))
+        self.assertIsNotNone(conn.last_heartbeat)
+        self.assertGreater(conn._last_seen, 0)
+        self.assertTrue(conn.ready)
+        self.assertIsNone(conn._probe)
+        self.assertEqual(conn.lag_stats['skipped'], 1)
+        self.assertEqual(conn.recv().data, ['Raw', 1])
+
+    def _send_stale(self, publisher, topic, i, age):
+        frames = list(Envelope(topic, 'TestNode', ['Raw', i]).convert_to_frames())
+        frames[3] = json.dumps(time.time() - age).encode('utf-8')
+        publisher.send_multipart(frames)
+
+    def test_Receiver_catches_up_instead_of_shutting_down(self):
+        port = 5658
+        ctx = zmq.Context().instance()
+        publisher = ctx.socket(zmq.PUB)
+        publisher.bind("tcp://127.0.0.1:%s" % port)
+        policy = LagPolicy(warn=.5, catch_up=1, shutdown=None, smoothing=1)
+        conn = Receiver("tcp://127.0.0.1:%s" % port, 'TestNode', lag_policy=policy)
+        conn.start()
+        time.sleep(.5)
+        for i in range(100):
+            self._send_stale(publisher, 'topic/%s' % (i % 2), i, 2)
+        time.sleep(1)
+        self.assertTrue(conn._running.is_set())
+        stats = conn.lag_stats
+        self.assertGreaterEqual(stats['catch_ups'], 1)
+        self.assertGreater(stats['skipped'], 0)
+        received = []
+        while True:
+            envelope = conn.recv()
+            if envelope is None:
+                break
+            received.append(envelope)
+        self.assertEqual(len(received) + stats['skipped'], 100)
+        self.assertEqual(received[-1].data[1], 99)
+        publisher.close()
+        conn.stop()
+
+    def test_Receiver_shuts_down_if_catching_up_fails(self):
+        port = 5659
+        ctx = zmq.Context().instance()
+        publisher = ctx.socket(zmq.PUB)
+        publisher.bind("tcp://127.0.0.1:%s" % port)
+        policy = LagPolicy(warn=.5, catch_up=1, shutdown=1.5, smoothing=1, max_catch_ups=1)
+        conn = Receiver("tcp://127.0.0.1:%s" % port, 'TestNode', lag_policy=policy)
+        conn.start()
+        time.sleep(.5)
+        for i in range(2):
+            self._send_stale(publisher, 'topic', i, 2)
+            time.sleep(.2)
+        time.sleep(.5)
+        self.assertFalse(conn._running.is_set())
+        publisher.close()
+        conn.stop()
+
+    def test_Receiver_drops_duplicates_while_failing_over(self):
+        ctx = zmq.Context().instance()
+        primary, backup = ctx.socket(zmq.PUB), ctx.socket(zmq.PUB)
+        primary.bind("tcp://127.0.0.1:5664")
+        backup.bind("tcp://127.0.0.1:5665")
+        conn = Receiver(["tcp://127.0.0.1:5664", "tcp://127.0.0.1:5665"], 'TestNode',
+                        heartbeat_timeout=.3)
+        conn.start()
+        time.sleep(.2)
+        frames = [Envelope('topic', 'TestNode', ['Raw', i]).convert_to_frames()
+                  for i in range(10)]
+        for i in range(5):
+            primary.send_multipart(frames[i])
+        for _ in range(10):
+            time.sleep(.1)
+            if conn.failovers:
+                break
+        self.assertEqual(conn.failovers, 1)
+        time.sleep(.1)
+        for i in range(5, 10):
+            primary.send_multipart(frames[i])
+            backup.send_multipart(frames[i])
+        time.sleep(.2)
+        received = []
+        while True:
+            envelope = conn.recv()
+            if envelope is None:
+                break
+            received.append(envelope.data[1])
+        self.assertEqual(received, list(range(10)))
+        self.assertEqual(conn.duplicates, 5)
+        primary.close()
+        backup.close()
+        conn.stop()
+
 
 if __name__ == '__main__':
     unittest.main(verbosity=2)
@@ -0,0 +1,91 @@
+# Import Built-Ins
+import logging
+import multiprocessing
+import os
+import unittest
+
+# Import Homebrew
+from hermes import Envelope
+from hermes.shm import ShmPublisher, ShmReceiver, pack_frames, unpack_frames
+
+# Init Logging Facilities
+log = logging.getLogger(__name__)
+
+
+def ring_name():
+    return 'hermes-test-%s' % os.getpid()
+
+
+def consume(ring, count, results):
+    receiver = ShmReceiver(ring, 'child', from_start=True)
+    receiver.start(timeout=5)
+    received = []
+    while len(received) < count:
+        envelope = receiver.recv(block=True, timeout=5)
+        if envelope is None:
+            break
+        received.append(envelope.data[1])
+    receiver.stop()
+    results.put(received)
+
+
+class ShmTests(unittest.TestCase):
+
+    def test_frames_roundtrip(self):
+        frames = [b'"topic"', b'', b'\x00\x01' * 100, b'[1.0, 2.0, "host"]']
+        self.assertEqual(unpack_frames(pack_frames(frames)), frames)
+
+    def test_receivers_read_envelopes_in_order(self):
+        publisher = ShmPublisher(ring_name(), 'pub', slots=8, slot_size=256)
+        publisher.start()
+        try:
+            first, second = ShmReceiver(ring_name(), 'a'), ShmReceiver(ring_name(), 'b',
+                                                                       topics=['odd'])
+            first.start()
+            second.start()
+            self.assertIsNone(first.recv())
+            for i in range(6):
+                publisher.publish(Envelope('odd' if i % 2 else 'even', 'testsuite', ['Raw', i]))
+            self.assertEqual([first.recv().data[1] for _ in range(6)], list(range(6)))
+            self.assertIsNone(first.recv())
+            self.assertEqual([second.recv().data[1] for _ in range(3)], [1, 3, 5])
+            self.assertIsNone(second.recv())
+            first.stop()
+            second.stop()
+        finally:
+            publisher.stop()
+
+    def test_slow_receiver_skips_overwritten_envelopes(self):
+        publisher = ShmPublisher(ring_name(), 'pub', slots=4, slot_size=256)
+        publisher.start()
+        try:
+            receiver = ShmReceiver(ring_name(), 'slow')
+            receiver.start()
+            for i in range(10):
+                publisher.publish(Envelope('topic', 'testsuite', ['Raw', i]))
+            self.assertEqual([receiver.recv().data[1] for _ in range(4)], [6, 7, 8, 9])
+            self.assertEqual(receiver.dropped, 6)
+            self.assertRaises(ValueError, publisher.publish,
+                              Envelope('topic', 'testsuite', ['Raw', 'x' * 300]))
+            receiver.stop()
+        finally:
+            publisher.stop()
+
+    def test_envelopes_cross_process_boundaries(self):
+        ctx = multiprocessing.get_context('spawn')
+        results = ctx.Queue()
+        publisher = ShmPublisher(ring_name(), 'pub', slots=1024, slot_size=256)
+        publisher.start()
+        try:
+            child = ctx.Process(target=consume, args=(ring_name(), 100, results))
+            child.start()
+            for i in range(100):
+                publisher.publish(Envelope('topic', 'testsuite', ['Raw', i]))
+            self.assertEqual(results.get(timeout=10), list(range(100)))
+            child.join(5)
+        finally:
+            publisher.stop()
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
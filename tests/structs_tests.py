@@ -29,6 +29,48 @@ class StructsTests(unittest.TestCase):
         for item in loaded_msg.data:
             self.assertIsInstance(item, str)
 
+    def test_Envelope_carries_send_time_and_host(self):
+        msg = Envelope('test/message', 'testsuite', ['data'], host='host-a')
+        frames = msg.convert_to_frames(sent=1234.5, extended=True)
+        self.assertEqual(len(frames), 4)
+        loaded = Envelope.load_from_frames(frames)
+        self.assertEqual(loaded.sent, 1234.5)
+        self.assertEqual(loaded.host, 'host-a')
+        self.assertEqual(loaded.ts, msg.ts)
+
+        # Plain timestamps, as sent by older versions, are still accepted.
+        legacy = frames[:3] + (json.dumps(1000.0).encode('utf-8'),)
+        loaded = Envelope.load_from_frames(legacy)
+        self.assertEqual(loaded.ts, 1000.0)
+        self.assertEqual(loaded.sent, 1000.0)
+
+    def test_Envelope_sends_plain_timestamps_by_default(self):
+        msg = Envelope('test/message', 'testsuite', ['data'], host='host-a')
+        frames = msg.convert_to_frames(sent=1234.5)
+        self.assertEqual(json.loads(frames[3].decode('utf-8')), msg.ts)
+        loaded = Envelope.load_from_frames(frames)
+        self.assertEqual(loaded.ts, msg.ts)
+        self.assertEqual(loaded.sent, msg.ts)
+
+    def test_Envelope_keeps_creation_time_if_not_restamped(self):
+        msg = Envelope('test/message', 'testsuite', ['data'], ts=1000.0)
+        loaded = Envelope.load_from_frames(msg.convert_to_frames(restamp=False, extended=True))
+        self.assertEqual(loaded.ts, 1000.0)
+        self.assertGreater(loaded.sent, 1000.0)
+        msg.convert_to_frames()
+        self.assertGreater(msg.ts, 1000.0)
+
+    def test_Envelope_uses_header_cache(self):
+        cache = {}
+        first = Envelope('test/message', 'testsuite', ['data']).convert_to_frames(
+            header_cache=cache)
+        self.assertIn(('test/message', 'testsuite'), cache)
+        second = Envelope('test/message', 'testsuite', ['other']).convert_to_frames(
+            header_cache=cache)
+        self.assertIs(first[0], second[0])
+        self.assertIs(first[1], second[1])
+        self.assertEqual(Envelope.load_from_frames(second).data, ['other'])
+
     def test_Message_dumps_and_loads_correctly(self):
         m = Message()
         serialized = m.serialize()
@@ -0,0 +1,104 @@
+# Import Built-Ins
+import logging
+import os
+import time
+import unittest
+
+# Import Homebrew
+from hermes import Node
+from hermes.supervisor import NodeSpec, Supervisor, _parse_spec
+
+# Init Logging Facilities
+log = logging.getLogger(__name__)
+
+
+class IdleNode(Node):
+
+    def run(self):
+        while self._running:
+            time.sleep(.05)
+
+
+def idle_node(name):
+    return IdleNode(name)
+
+
+class FinishingNode(Node):
+
+    def run(self):
+        pass
+
+
+def finishing_node(name):
+    return FinishingNode(name)
+
+
+def wait_for(condition, timeout=20):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(.1)
+    return False
+
+
+class SupervisorTests(unittest.TestCase):
+
+    def test_supervisor_runs_nodes_in_separate_processes(self):
+        cpus = sorted(os.sched_getaffinity(0))[:1]
+        specs = [NodeSpec('idle_a', idle_node, args=('idle_a',), cpus=cpus),
+                 NodeSpec('idle_b', idle_node, args=('idle_b',))]
+        supervisor = Supervisor(specs, heartbeat_interval=.2)
+        supervisor.start()
+        try:
+            self.assertTrue(wait_for(lambda: supervisor.healthy))
+            health = supervisor.health()
+            self.assertEqual(set(health), {'idle_a', 'idle_b'})
+            self.assertNotEqual(health['idle_a']['pid'], health['idle_b']['pid'])
+            self.assertNotIn(os.getpid(), [h['pid'] for h in health.values()])
+        finally:
+            supervisor.stop(timeout=5)
+        self.assertFalse(any(h['alive'] for h in supervisor.health().values()))
+
+    def test_supervisor_restarts_crashed_nodes(self):
+        # A bare Node has no receiver, so its run loop raises NotImplementedError.
+        spec = NodeSpec('crashing', 'hermes.node:Node', args=('crashing',))
+        supervisor = Supervisor([spec], heartbeat_interval=.2, max_restarts=2,
+                                restart_backoff=.1)
+        supervisor.start()
+        try:
+            self.assertTrue(wait_for(lambda: supervisor.health()['crashing']['restarts'] == 2))
+            self.assertTrue(wait_for(lambda: not supervisor.health()['crashing']['alive']))
+            self.assertFalse(supervisor.healthy)
+            self.assertEqual(supervisor.health()['crashing']['exitcode'], 1)
+        finally:
+            supervisor.stop(timeout=5)
+
+    def test_supervisor_restarts_cleanly_exiting_nodes_only_if_asked_to(self):
+        specs = [NodeSpec('finished', finishing_node, args=('finished',)),
+                 NodeSpec('repeated', finishing_node, args=('repeated',),
+                          restart=NodeSpec.ALWAYS)]
+        supervisor = Supervisor(specs, heartbeat_interval=.2, max_restarts=1,
+                                restart_backoff=.1)
+        supervisor.start()
+        try:
+            self.assertTrue(wait_for(lambda: supervisor.health()['repeated']['restarts'] == 1))
+            self.assertTrue(wait_for(lambda: not supervisor.health()['repeated']['alive']))
+            health = supervisor.health()['finished']
+            self.assertFalse(health['alive'])
+            self.assertEqual(health['exitcode'], 0)
+            self.assertEqual(health['restarts'], 0)
+        finally:
+            supervisor.stop(timeout=5)
+        self.assertRaises(ValueError, NodeSpec, 'invalid', finishing_node, restart='sometimes')
+
+    def test_command_line_specs_are_parsed(self):
+        spec = _parse_spec('pkg.mod:make_node@0,2', 'ipc:///in', 'ipc:///out')
+        self.assertEqual(spec.name, 'make_node')
+        self.assertEqual(spec.factory, 'pkg.mod:make_node')
+        self.assertEqual(spec.cpus, {0, 2})
+        self.assertEqual(spec.kwargs['pub_addr'], 'ipc:///in')
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)